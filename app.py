@@ -1,25 +1,70 @@
 from flask import Flask, render_template, jsonify, request, session
-from flask_session import Session
-from database import get_db_connection, test_connection
+from database import test_connection
+import assets
+from health import health_monitor
+import http_cache
+from json_provider import configure_json
+import metrics
+from query_profiler import query_profiler
+from sessions import configure_sessions
 import os
 
 app = Flask(__name__)
 
 # Configuración
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
-app.config['SESSION_TYPE'] = 'filesystem'
 app.config['SESSION_PERMANENT'] = True
-Session(app)
+configure_sessions(app)
+configure_json(app)
+metrics.init_app(app)
+# Después de metrics: comprime antes de que se mida el tamaño de la respuesta
+http_cache.init_app(app)
+assets.init_app(app)
+query_profiler.install()
 
 # Importar módulos
 from modules.prospectos import prospectos_bp
 from modules.prospectos_activos import prospectos_activos_bp
 from modules.knowledge_base import knowledge_base_bp
+from modules.admin import admin_bp
+from modules.followups import followups_bp
+from modules.mensajes import mensajes_bp
+from modules.leads import leads_bp
 
 # Registrar blueprints
 app.register_blueprint(prospectos_bp, url_prefix='/prospectos')
 app.register_blueprint(prospectos_activos_bp, url_prefix='/prospectos_activos')
 app.register_blueprint(knowledge_base_bp, url_prefix='/knowledge_base')
+app.register_blueprint(admin_bp, url_prefix='/admin')
+app.register_blueprint(followups_bp, url_prefix='/followups')
+app.register_blueprint(mensajes_bp, url_prefix='/mensajes')
+app.register_blueprint(leads_bp, url_prefix='/leads')
+
+def start_background_services():
+    """
+    Hilos propios de cada proceso que atiende requests
+
+    - Carga de dependencias pesadas según HEAVY_IMPORTS (ver startup.py)
+    - Warm-up de clientes de Knowledge Base (tokenizer y pools HTTP)
+    - Construcción de las facetas que aún no existen (ver facets.py)
+    - Chequeos de dependencias cada HEALTH_CHECK_INTERVAL segundos
+    """
+    from modules.knowledge_base.clients import start_background_warm_up
+    from facets import facet_cache
+    import startup
+    
+    if startup.heavy_imports_mode() == 'eager':
+        startup.import_heavy_modules()
+    else:
+        startup.start_background_imports()
+    start_background_warm_up()
+    facet_cache.start_background_warm_up()
+    health_monitor.start()
+
+# Con gunicorn (preload) la app se importa en el master antes del fork; los
+# hilos se inician en cada worker desde post_fork (ver gunicorn.conf.py)
+if os.getenv('APP_SERVER') != 'gunicorn':
+    start_background_services()
 
 @app.route('/')
 def index():
@@ -37,6 +82,7 @@ def theme():
     if request.method == 'POST':
         data = request.get_json()
         theme_color = data.get('theme', '#25D366')
+        session.permanent = True
         session['theme_color'] = theme_color
         return jsonify({'success': True, 'theme': theme_color})
     else:
@@ -44,98 +90,81 @@ def theme():
         return jsonify({'theme': theme_color})
 
 @app.route('/health')
+@app.route('/health/live')
 def health():
-    """Endpoint para verificar el estado de la aplicación"""
+    """Liveness: el proceso responde (no consulta dependencias)"""
     return jsonify({
         'status': 'ok',
         'message': 'WhatsApp Dashboard is running'
     })
 
+@app.route('/health/ready')
+def health_ready():
+    """Readiness desde la caché del monitor de salud"""
+    snapshot = health_monitor.snapshot()
+    return jsonify({
+        'status': 'ok' if snapshot['ready'] else 'error',
+        **snapshot
+    }), 200 if snapshot['ready'] else 503
+
 @app.route('/db-test')
 def db_test():
-    """Endpoint para probar la conexión a la base de datos"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT version();")
-            db_version = cursor.fetchone()
-            cursor.close()
-            conn.close()
-            return jsonify({
-                'status': 'success',
-                'message': 'Database connection successful',
-                'version': db_version
-            })
-        except Exception as e:
-            return jsonify({
-                'status': 'error',
-                'message': str(e)
-            }), 500
-    else:
+    """Estado de la conexión a la base de datos (último chequeo en caché)"""
+    if request.args.get('refresh') == '1':
+        health_monitor.refresh()
+    
+    result = health_monitor.result('database')
+    if not result:
         return jsonify({
-            'status': 'error',
-            'message': 'Could not connect to database'
-        }), 500
+            'status': 'pending',
+            'message': 'Database check has not run yet'
+        }), 503
+    
+    if result['success']:
+        return jsonify({
+            'status': 'success',
+            'message': 'Database connection successful',
+            'version': result['version'],
+            'latency_ms': result['latency_ms'],
+            'checked_at': result['checked_at']
+        })
+    
+    return jsonify({
+        'status': 'error',
+        'message': result.get('error', 'Could not connect to database'),
+        'checked_at': result['checked_at']
+    }), 500
 
 @app.route('/api/knowledge_base/health')
 def kb_health():
-    """Verificar estado de conexiones de Knowledge Base"""
-    try:
-        from modules.knowledge_base.qdrant_manager import QdrantManager
-        from modules.knowledge_base.embedding_manager import EmbeddingManager
-        from database_kb import get_kb_db_connection
-        
-        # Test Qdrant
-        try:
-            qdrant = QdrantManager()
-            qdrant_status = qdrant.test_connection()
-        except Exception as e:
-            qdrant_status = {'success': False, 'error': str(e)}
-        
-        # Test OpenAI
-        try:
-            embeddings = EmbeddingManager()
-            openai_status = embeddings.test_connection()
-        except Exception as e:
-            openai_status = {'success': False, 'error': str(e)}
-        
-        # Test Database KB
-        db_status = {'success': False}
-        conn = get_kb_db_connection()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM knowledge_bases")
-                kb_count = cursor.fetchone()['count']
-                cursor.close()
-                conn.close()
-                db_status = {
-                    'success': True,
-                    'knowledge_bases_count': kb_count
-                }
-            except Exception as e:
-                db_status = {'success': False, 'error': str(e)}
-        
-        all_ok = qdrant_status['success'] and openai_status['success'] and db_status['success']
-        
+    """Estado de conexiones de Knowledge Base (último chequeo en caché)"""
+    if request.args.get('refresh') == '1':
+        health_monitor.refresh()
+    
+    services = {
+        'qdrant': health_monitor.result('qdrant'),
+        'openai': health_monitor.result('openai'),
+        'database': health_monitor.result('kb_database')
+    }
+    
+    if any(status is None for status in services.values()):
         return jsonify({
-            'status': 'ok' if all_ok else 'error',
-            'services': {
-                'qdrant': qdrant_status,
-                'openai': openai_status,
-                'database': db_status
-            }
-        })
-        
-    except Exception as e:
-        return jsonify({
-            'status': 'error',
-            'error': str(e)
-        }), 500
+            'status': 'pending',
+            'services': services
+        }), 503
+    
+    all_ok = all(status['success'] for status in services.values())
+    
+    return jsonify({
+        'status': 'ok' if all_ok else 'error',
+        'services': services
+    })
 
 if __name__ == '__main__':
     print("Iniciando WhatsApp Dashboard...")
     print("Probando conexión a la base de datos...")
     test_connection()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Servidor de desarrollo (con reloader) solo para FLASK_ENV=development;
+    # en producción se usa gunicorn (ver Dockerfile)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')),
+            debug=os.getenv('FLASK_ENV') == 'development')
\ No newline at end of file
@@ -0,0 +1,247 @@
+"""
+Pipeline de assets estáticos: bundles, minificación, fingerprint y precompresión
+
+    python assets.py            # genera static/dist y static/dist/manifest.json
+    python assets.py --check    # falla si el manifiesto no está al día
+
+Cada asset (o bundle de varios archivos) se escribe como
+static/dist/<ruta>.<hash>.<ext> junto a sus variantes .gz y .br. Las
+plantillas lo referencian con asset_url()/asset_urls(); sin manifiesto (o
+con ASSETS_DEBUG=1) se sirven los archivos originales de static/.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(ROOT, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Archivos que todas las páginas cargan juntos (el orden importa)
+BUNDLES = {
+    'css/base.css': ['css/reset.css', 'css/theme.css', 'css/bootstrap-theme.css', 'css/sidebar.css', 'css/main.css'],
+    'js/base.js': ['js/theme.js', 'js/main.js']
+}
+
+# Assets que se publican por separado (solo los usa su módulo)
+SINGLE_ASSETS = [
+    'css/bootstrap.min.css',
+    'css/prospectos.css',
+    'css/prospectos_activos.css',
+    'css/knowledge_base.css',
+    'css/knowledge_base_detail.css',
+    'js/bootstrap.bundle.min.js',
+    'js/prospectos.js',
+    'js/prospectos_activos.js',
+    'js/knowledge_base.js',
+    'js/knowledge_base_detail.js',
+    'js/query_profiles.js'
+]
+
+# Los nombres llevan el hash del contenido: pueden cachearse un año sin revalidar
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+_SOURCE_MAP_RE = re.compile(r'/[*/]# sourceMappingURL=\S+(?: \*/)?')
+
+
+# ---------- build ----------
+
+def _minify_css(text):
+    if rcssmin is not None:
+        return rcssmin.cssmin(text)
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}').strip()
+
+
+def _minify_js(text):
+    if rjsmin is not None:
+        return rjsmin.jsmin(text)
+    # Sin rjsmin solo se quitan comentarios de línea completa y líneas vacías:
+    # los template literals del dashboard contienen HTML y no deben tocarse
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        lines.append(line.rstrip())
+    return '\n'.join(lines)
+
+
+def _read(path):
+    with open(os.path.join(STATIC_DIR, path), encoding='utf-8') as f:
+        return _SOURCE_MAP_RE.sub('', f.read())
+
+
+def build_asset(name, sources):
+    """Concatenar y minificar las fuentes de un asset; retorna los bytes finales"""
+    if name.endswith('.css'):
+        parts = [_read(path) if path.endswith('.min.css') else _minify_css(_read(path)) for path in sources]
+        return '\n'.join(parts).encode('utf-8')
+    # ';' entre archivos para que un script sin punto y coma final no se una al siguiente
+    parts = [_read(path) if path.endswith('.min.js') else _minify_js(_read(path)) for path in sources]
+    return '\n;\n'.join(parts).encode('utf-8')
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(output_dir=DIST_DIR):
+    """
+    Generar los assets con hash y el manifiesto
+
+    Returns:
+        Manifiesto {nombre lógico: ruta relativa a static/}
+    """
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+
+    assets = dict(BUNDLES)
+    assets.update({path: [path] for path in SINGLE_ASSETS})
+
+    manifest = {}
+    for name, sources in assets.items():
+        data = build_asset(name, sources)
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        base, ext = os.path.splitext(name)
+        hashed = f"{base}.{digest}{ext}"
+        target = os.path.join(output_dir, hashed)
+
+        _write(target, data)
+        _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write(target + '.br', brotli.compress(data, quality=11))
+
+        manifest[name] = f"dist/{hashed}"
+
+    _write(os.path.join(output_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+# ---------- runtime ----------
+
+class AssetManifest:
+    """Resuelve nombres lógicos a URLs con hash (o a las fuentes sin manifiesto)"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.entries = None
+
+    def load(self, enabled=True):
+        self.entries = None
+        if enabled and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        return self.entries is not None
+
+    def urls(self, name):
+        """URLs a incluir para un asset o bundle"""
+        if self.entries and name in self.entries:
+            return [url_for('static', filename=self.entries[name])]
+        return [url_for('static', filename=path) for path in BUNDLES.get(name, [name])]
+
+    def url(self, name):
+        urls = self.urls(name)
+        if len(urls) != 1:
+            raise ValueError(f"{name} es un bundle de {len(urls)} archivos; usa asset_urls()")
+        return urls[0]
+
+
+manifest = AssetManifest()
+
+
+def serve_dist(filename):
+    """Servir static/dist con la variante precomprimida que acepte el cliente"""
+    accepted = request.accept_encodings
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + suffix)):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype, max_age=31536000)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(DIST_DIR, filename, max_age=31536000)
+
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Registrar asset_url/asset_urls en Jinja y la ruta de static/dist"""
+    # En desarrollo se sirven las fuentes para ver los cambios sin reconstruir
+    use_manifest = os.getenv('FLASK_ENV') != 'development' and os.getenv('ASSETS_DEBUG') != '1'
+    if manifest.load(use_manifest):
+        print(f"Assets: {len(manifest.entries)} archivos con hash desde {os.path.relpath(MANIFEST_PATH, ROOT)}")
+
+    app.jinja_env.globals['asset_url'] = manifest.url
+    app.jinja_env.globals['asset_urls'] = manifest.urls
+    # Más específica que /static/<path:filename>, así que tiene prioridad
+    app.add_url_rule(f"{app.static_url_path}/dist/<path:filename>", 'static_dist', serve_dist)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generar los assets estáticos con hash')
+    parser.add_argument('--check', action='store_true',
+                        help='No escribir; falla si static/dist no corresponde a las fuentes')
+    args = parser.parse_args()
+
+    if args.check:
+        if not os.path.exists(MANIFEST_PATH):
+            print('No existe static/dist/manifest.json')
+            sys.exit(1)
+        with open(MANIFEST_PATH) as f:
+            current = json.load(f)
+        tmp_dir = os.path.join(STATIC_DIR, '.dist-check')
+        try:
+            expected = build(tmp_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        stale = sorted(name for name in expected if current.get(name) != expected[name])
+        if stale:
+            print(f"Assets desactualizados: {', '.join(stale)}")
+            sys.exit(1)
+        print('Assets al día')
+        return
+
+    built = build()
+    sizes = []
+    for name, path in sorted(built.items()):
+        size = os.path.getsize(os.path.join(STATIC_DIR, path))
+        sizes.append(f"{name:<32} -> {path} ({size / 1024:.1f} KB)")
+    print('\n'.join(sizes))
+    if brotli is None:
+        print('⚠️ Brotli no está instalado: solo se generaron variantes .gz')
+
+
+if __name__ == '__main__':
+    main()
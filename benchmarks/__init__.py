@@ -0,0 +1,9 @@
+"""
+Benchmarks end-to-end del dashboard
+
+    python -m benchmarks.seed --reset      # datos sintéticos en una BD local
+    python -m benchmarks.stubs             # OpenAI y Qdrant simulados
+    python -m benchmarks.run               # latencias p50/p95/p99 y throughput
+
+Ver la sección "Benchmarks" del README.
+"""
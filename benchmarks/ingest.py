@@ -0,0 +1,112 @@
+"""
+Throughput de la ingesta de mensajes contra PostgreSQL local (sin HTTP)
+
+    python -m benchmarks.ingest --messages 50000 --producers 16
+    python -m benchmarks.ingest --mode single --messages 5000
+
+Compara el MessageIngestor (inserts de varias filas por transacción; el
+trigger de init_db.py suma los contadores por INSERT) con un INSERT y un
+commit por mensaje, como lo hace n8n.
+Requiere la base poblada con benchmarks.seed (usa sus teléfonos); los
+mensajes insertados quedan en n8n_chat_histories hasta el próximo
+seed --reset.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import get_db_connection, ensure_schema  # noqa: E402
+from benchmarks.seed import MANIFEST_PATH, check_host  # noqa: E402
+from init_db import LEADS_MENSAJES_SQL  # noqa: E402
+from modules.mensajes.ingest import MessageIngestor, parse_message, write_messages  # noqa: E402
+
+
+def make_events(telefonos, count, rng):
+    return [{
+        'session_id': rng.choice(telefonos),
+        'message': {'type': 'human' if i % 2 == 0 else 'ai', 'content': f'Mensaje de benchmark {i}'}
+    } for i in range(count)]
+
+
+def run_buffered(events, producers, per_request, max_rows, max_delay):
+    ingestor = MessageIngestor(max_rows=max_rows, max_delay=max_delay)
+    requests = [events[i:i + per_request] for i in range(0, len(events), per_request)]
+
+    def one(batch):
+        pending, rejected = ingestor.submit(batch)
+        pending.wait()
+        return len(rejected)
+
+    with ThreadPoolExecutor(max_workers=producers) as pool:
+        rejected = sum(pool.map(one, requests))
+    return {'transactions': ingestor.buffer.flushes, 'rejected': rejected}
+
+
+def run_single(events, producers):
+    def one(event):
+        conn = get_db_connection()
+        try:
+            write_messages(conn, [parse_message(event, datetime.now(timezone.utc))])
+            conn.commit()
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=producers) as pool:
+        list(pool.map(one, events))
+    return {'transactions': len(events), 'rejected': 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de ingesta de mensajes')
+    parser.add_argument('--mode', choices=['buffered', 'single'], default='buffered')
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--producers', type=int, default=16, help='Hilos que simulan requests concurrentes')
+    parser.add_argument('--per-request', type=int, default=1, help='Mensajes por request (modo buffered)')
+    parser.add_argument('--max-rows', type=int, default=500)
+    parser.add_argument('--max-delay-ms', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--allow-remote', action='store_true')
+    args = parser.parse_args()
+
+    check_host('DB_HOST', args.allow_remote)
+    if not os.path.exists(MANIFEST_PATH):
+        raise SystemExit('No existe benchmarks/.seed.json; ejecuta primero python -m benchmarks.seed')
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+
+    # Los mismos formatos que llegan desde WhatsApp/n8n
+    rng = random.Random(args.seed)
+    telefonos = [rng.choice([t, f'56{t}', f'+56 {t[0]} {t[1:5]} {t[5:]}']) for t in manifest['telefonos']]
+    events = make_events(telefonos, args.messages, rng)
+
+    os.environ.setdefault('DB_POOL_MAX', str(args.producers + 2))
+    # El ALTER/backfill de leads.mensaje_count no entra en la medición
+    if not ensure_schema('leads_mensaje_count', LEADS_MENSAJES_SQL):
+        raise SystemExit('No se pudo preparar leads.mensaje_count')
+    started = time.perf_counter()
+    if args.mode == 'buffered':
+        result = run_buffered(events, args.producers, args.per_request, args.max_rows, args.max_delay_ms / 1000)
+    else:
+        result = run_single(events, args.producers)
+    wall = time.perf_counter() - started
+
+    print(json.dumps({
+        'mode': args.mode,
+        'messages': args.messages,
+        'producers': args.producers,
+        'seconds': round(wall, 3),
+        'messages_per_second': round(args.messages / wall, 1),
+        **result
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
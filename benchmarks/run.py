@@ -0,0 +1,300 @@
+"""
+Benchmark end-to-end de las APIs del dashboard
+
+    python -m benchmarks.run --base-url http://127.0.0.1:5000 --requests 200 --concurrency 8
+    python -m benchmarks.run --scenarios activos_list,mensajes --output results.json
+    python -m benchmarks.run --baseline baseline.json --max-regression 0.2
+
+Requiere una app corriendo contra la base de datos poblada con
+benchmarks.seed (y, para kb_sync, configurada con benchmarks.stubs). Con
+--baseline, termina con código 1 si el p95 de algún escenario empeora más
+que --max-regression respecto al resultado guardado.
+"""
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), '.seed.json')
+
+
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not sorted_values:
+        return None
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def summarize(name, latencies, errors, wall_seconds):
+    ordered = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'scenario': name,
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+        'max_ms': ms(ordered[-1] if ordered else None),
+        'mean_ms': ms(sum(ordered) / len(ordered) if ordered else None)
+    }
+
+
+class Scenario:
+    """Un endpoint a medir; call() ejecuta una iteración y retorna la Response medida"""
+
+    name = None
+    # Los escenarios que escriben no se paralelizan por defecto
+    max_concurrency = None
+
+    def __init__(self, client, manifest, rng):
+        self.client = client
+        self.manifest = manifest
+        self.rng = rng
+
+    def call(self):
+        raise NotImplementedError
+
+
+class ProspectosList(Scenario):
+    name = 'prospectos_list'
+
+    def call(self):
+        page = self.rng.randint(1, 20)
+        return self.client.get('/prospectos/api/list', params={'page': page, 'page_size': 50})
+
+
+class ActivosList(Scenario):
+    name = 'activos_list'
+
+    def call(self):
+        params = {'page': self.rng.randint(1, 10), 'page_size': 50}
+        if self.rng.random() < 0.3:
+            params['search'] = self.rng.choice(['camila', 'gonzález', 'informática', 'example'])
+        if self.rng.random() < 0.3:
+            params['sort_by'] = self.rng.choice(['mensaje_count', 'nombre', 'fecha_primer_contacto'])
+        return self.client.get('/prospectos_activos/api/list', params=params)
+
+
+class Mensajes(Scenario):
+    name = 'mensajes'
+
+    def call(self):
+        telefono = self.rng.choice(self.manifest['telefonos'])
+        return self.client.get(f'/prospectos_activos/api/mensajes/{telefono}')
+
+
+class Ingest(Scenario):
+    """Webhook de mensajes con lotes de `batch` mensajes"""
+
+    name = 'ingest'
+    batch = 50
+
+    def call(self):
+        messages = [{
+            'session_id': f"56{self.rng.choice(self.manifest['telefonos'])}",
+            'message': {'type': self.rng.choice(['human', 'ai']), 'content': f'Mensaje de benchmark {uuid.uuid4()}'}
+        } for _ in range(self.batch)]
+        headers = {'X-Ingest-Token': os.environ['INGEST_TOKEN']} if os.getenv('INGEST_TOKEN') else {}
+        return self.client.post('/mensajes/api/ingest', json={'messages': messages}, headers=headers)
+
+
+class Import(Scenario):
+    """Upload + import de un CSV nuevo (mide ambos pasos juntos)"""
+
+    name = 'import'
+    max_concurrency = 2
+    rows = 200
+
+    def _csv(self):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Nombre', 'Apellidos', 'Email', 'Telefono', 'Programa', 'Carrera', 'Urgencia'])
+        batch = uuid.uuid4().hex[:8]
+        for i in range(self.rows):
+            writer.writerow([
+                f'Bench{i}', 'Import', f'bench.{batch}.{i}@example.com',
+                f'9{self.rng.randrange(10**8):08d}', 'Plan Regular', 'Contabilidad General', 'Media'
+            ])
+        return buffer.getvalue().encode('utf-8')
+
+    def call(self):
+        started = time.perf_counter()
+        upload = self.client.post(
+            '/prospectos/api/upload',
+            files={'file': ('benchmark.csv', self._csv(), 'text/csv')}
+        )
+        if upload.status_code != 200 or not upload.json().get('success'):
+            return upload
+
+        data = upload.json()
+        response = self.client.post('/prospectos/api/import', json={
+            'mapping': data['suggested_mapping'],
+            'file_id': data['file_id']
+        })
+        response.elapsed_total = time.perf_counter() - started
+        return response
+
+
+class KbSync(Scenario):
+    """Crea puntos pendientes y mide la sincronización contra los stubs"""
+
+    name = 'kb_sync'
+    max_concurrency = 1
+    points = 100
+
+    def call(self):
+        kb_id = self.rng.choice(self.manifest['knowledge_base_ids'])
+        points = [
+            {'pageContent': f'Punto de benchmark {uuid.uuid4()}', 'metadata': {'origen': 'benchmark'}}
+            for _ in range(self.points)
+        ]
+        created = self.client.post(f'/knowledge_base/api/bases/{kb_id}/points/import', json={'points': points})
+        if created.status_code != 200:
+            return created
+
+        started = time.perf_counter()
+        response = self.client.post(f'/knowledge_base/api/bases/{kb_id}/sync')
+        response.elapsed_total = time.perf_counter() - started
+        return response
+
+
+SCENARIOS = {cls.name: cls for cls in (ProspectosList, ActivosList, Mensajes, Ingest, Import, KbSync)}
+
+
+def run_scenario(scenario, requests, concurrency, warmup):
+    """Ejecutar `requests` iteraciones con `concurrency` hilos"""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one():
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            response = scenario.call()
+            elapsed = getattr(response, 'elapsed_total', time.perf_counter() - started)
+            ok = response.status_code < 400 and response.json().get('success', True)
+        except Exception as e:
+            print(f"  {scenario.name}: {type(e).__name__}: {e}")
+            ok = False
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    for _ in range(warmup):
+        try:
+            scenario.call()
+        except Exception:
+            pass
+
+    workers = min(concurrency, scenario.max_concurrency or concurrency)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(one) for _ in range(requests)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    result = summarize(scenario.name, latencies, errors, wall)
+    result['concurrency'] = workers
+    return result
+
+
+def compare(results, baseline_path, max_regression):
+    """Retorna los escenarios cuyo p95 empeoró más de lo permitido"""
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['scenario'])
+        if not previous or not previous.get('p95_ms') or result['p95_ms'] is None:
+            continue
+        change = (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms']
+        result['p95_change'] = round(change, 3)
+        if change > max_regression:
+            regressions.append(result['scenario'])
+    return regressions
+
+
+def print_table(results):
+    header = f"{'escenario':<16}{'req':>6}{'err':>5}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'Δp95':>8}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        change = f"{r['p95_change'] * 100:+.0f}%" if 'p95_change' in r else ''
+        print(f"{r['scenario']:<16}{r['requests']:>6}{r['errors']:>5}{r['throughput_rps'] or 0:>9}"
+              f"{r['p50_ms'] or 0:>10}{r['p95_ms'] or 0:>10}{r['p99_ms'] or 0:>10}{change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark end-to-end del dashboard')
+    parser.add_argument('--base-url', default=os.getenv('BENCH_BASE_URL', 'http://127.0.0.1:5000'))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='Iteraciones por escenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help='Guardar resultados en JSON')
+    parser.add_argument('--baseline', help='Resultados JSON previos para comparar')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='Aumento máximo tolerado del p95 (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    if not os.path.exists(MANIFEST_PATH):
+        raise SystemExit('No existe benchmarks/.seed.json; ejecuta primero python -m benchmarks.seed')
+    with open(MANIFEST_PATH) as f:
+        manifest = json.load(f)
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Escenarios desconocidos: {', '.join(unknown)} (disponibles: {', '.join(SCENARIOS)})")
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = []
+    with httpx.Client(base_url=args.base_url, timeout=300, limits=limits) as client:
+        for name in names:
+            scenario = SCENARIOS[name](client, manifest, random.Random(args.seed))
+            print(f"▶ {name}")
+            results.append(run_scenario(scenario, args.requests, args.concurrency, args.warmup))
+
+    exit_code = 0
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_regression)
+        if regressions:
+            exit_code = 1
+
+    print()
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'base_url': args.base_url,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'volumes': manifest.get('volumes'),
+                'results': results
+            }, f, indent=2)
+
+    if exit_code:
+        print(f"\n❌ Regresión de p95 > {args.max_regression:.0%} en: {', '.join(regressions)}")
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
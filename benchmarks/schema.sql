@@ -0,0 +1,111 @@
+-- Esquema mínimo para correr los benchmarks contra una base de datos local.
+-- prospectos_raw replica database_schema.sql; el resto reproduce las columnas
+-- que usan los módulos (en producción esas tablas las administra Supabase/n8n).
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+CREATE TABLE IF NOT EXISTS prospectos_raw (
+    id BIGSERIAL PRIMARY KEY,
+    nombre VARCHAR(255),
+    apellidos VARCHAR(255),
+    fecha_creacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    propietario VARCHAR(255),
+    canal VARCHAR(255),
+    referrer TEXT,
+    email_1 VARCHAR(255),
+    email_2 VARCHAR(255),
+    telefono_1 VARCHAR(50),
+    telefono_2 VARCHAR(50),
+    programa VARCHAR(255),
+    rut VARCHAR(50),
+    carrera_postula VARCHAR(255),
+    experiencia VARCHAR(255),
+    urgencia VARCHAR(255),
+    estado VARCHAR(50),
+    archivo_origen VARCHAR(500),
+    fecha_importacion TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    lote_importacion VARCHAR(100),
+    datos_adicionales JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_nombre ON prospectos_raw(nombre);
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_email_1 ON prospectos_raw(email_1);
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_telefono_1 ON prospectos_raw(telefono_1);
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_rut ON prospectos_raw(rut);
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_fecha_creacion ON prospectos_raw(fecha_creacion);
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_lote ON prospectos_raw(lote_importacion);
+
+CREATE TABLE IF NOT EXISTS leads (
+    id BIGSERIAL PRIMARY KEY,
+    session_id VARCHAR(50) UNIQUE NOT NULL,
+    nombre VARCHAR(255),
+    apellido VARCHAR(255),
+    email VARCHAR(255),
+    telefono VARCHAR(50),
+    carrera_interes VARCHAR(255),
+    experiencia_laboral INTEGER,
+    plan VARCHAR(100),
+    nivel_intencion VARCHAR(50),
+    estado VARCHAR(50) DEFAULT 'nuevo',
+    canal_origen VARCHAR(100),
+    dias_transcurridos INTEGER DEFAULT 0,
+    descuento_actual NUMERIC(5, 2) DEFAULT 0,
+    fecha_primer_contacto TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    followup_dia3_enviado BOOLEAN DEFAULT false,
+    followup_dia3_fecha TIMESTAMP WITH TIME ZONE,
+    followup_dia5_enviado BOOLEAN DEFAULT false,
+    followup_dia5_fecha TIMESTAMP WITH TIME ZONE,
+    followup_dia6_enviado BOOLEAN DEFAULT false,
+    followup_dia6_fecha TIMESTAMP WITH TIME ZONE,
+    followup_dia8_enviado BOOLEAN DEFAULT false,
+    followup_dia8_fecha TIMESTAMP WITH TIME ZONE,
+    derivado_a_humano BOOLEAN DEFAULT false,
+    agente_asignado VARCHAR(255),
+    chat_status VARCHAR(50),
+    notas TEXT,
+    fecha_derivacion TIMESTAMP WITH TIME ZONE,
+    razon_derivacion TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_leads_telefono ON leads(telefono);
+CREATE INDEX IF NOT EXISTS idx_leads_fecha_primer_contacto ON leads(fecha_primer_contacto);
+
+CREATE TABLE IF NOT EXISTS n8n_chat_histories (
+    id SERIAL PRIMARY KEY,
+    session_id VARCHAR(255) NOT NULL,
+    message JSONB NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_n8n_chat_histories_session_id ON n8n_chat_histories(session_id);
+
+CREATE TABLE IF NOT EXISTS knowledge_bases (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nombre VARCHAR(255) NOT NULL,
+    descripcion TEXT,
+    qdrant_collection_name VARCHAR(255) UNIQUE NOT NULL,
+    vector_dimension INTEGER DEFAULT 3072,
+    embedding_model VARCHAR(100) DEFAULT 'text-embedding-3-large',
+    total_points INTEGER DEFAULT 0,
+    synced_points INTEGER DEFAULT 0,
+    last_synced_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS knowledge_points (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    knowledge_base_id UUID NOT NULL REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+    page_content TEXT NOT NULL,
+    metadata JSONB,
+    synced_to_qdrant BOOLEAN DEFAULT false,
+    qdrant_point_id UUID,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_points_base ON knowledge_points(knowledge_base_id, synced_to_qdrant);
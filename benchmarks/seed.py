@@ -0,0 +1,251 @@
+"""
+Generador de datos sintéticos para los benchmarks
+
+    python -m benchmarks.seed --reset --prospectos 50000 --leads 5000
+
+Usa las mismas variables DB_* / KB_DB_* que la app. Por seguridad se niega
+a escribir en un host que no sea local salvo con --allow-remote. Guarda en
+benchmarks/.seed.json los datos que necesita benchmarks.run (teléfonos de
+muestra, ids de bases).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from psycopg2.extras import execute_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import get_db_connection  # noqa: E402
+from database_kb import get_kb_db_connection  # noqa: E402
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), '.seed.json')
+
+LOCAL_HOSTS = {'localhost', '127.0.0.1', '::1', 'postgres', 'db'}
+
+NOMBRES = ['Camila', 'Valentina', 'Javiera', 'Catalina', 'Fernanda', 'Matías', 'Benjamín',
+           'Vicente', 'Tomás', 'Joaquín', 'Sofía', 'Martina', 'Diego', 'Felipe', 'Ignacio']
+APELLIDOS = ['González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva',
+             'Martínez', 'Sepúlveda', 'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández']
+PROPIETARIOS = ['Ana Torres', 'Luis Vera', 'Marta Reyes', 'Pablo Castro', None]
+CANALES = ['facebook', 'instagram', 'google', 'referido', 'web']
+PROGRAMAS = ['Plan Regular', 'Plan Especial']
+CARRERAS = ['Ingeniería en Informática', 'Técnico en Enfermería', 'Administración de Empresas',
+            'Contabilidad General', 'Prevención de Riesgos', 'Trabajo Social', 'Psicopedagogía']
+URGENCIAS = ['Alta', 'Media', 'Baja', 'Inmediata', None]
+ESTADOS = ['nuevo', 'calificando', 'persuadiendo', 'listo_matricula', 'perdido', 'en_proceso']
+INTENCIONES = ['Sin intencion', 'Baja', 'Media', 'Alta']
+
+TABLES = ['n8n_chat_histories', 'leads', 'prospectos_raw', 'knowledge_points', 'knowledge_bases']
+
+
+def phone_for(index):
+    """Teléfono chileno determinista (9 dígitos, sin prefijo 56)"""
+    return f"9{index:08d}"
+
+
+def check_host(env_name, allow_remote):
+    host = os.getenv(env_name) or 'localhost'
+    if host not in LOCAL_HOSTS and not allow_remote:
+        raise SystemExit(
+            f"{env_name}={host} no parece una base de datos local; usa --allow-remote si es intencional"
+        )
+
+
+def apply_schema(conn, reset):
+    cursor = conn.cursor()
+    with open(SCHEMA_PATH) as f:
+        cursor.execute(f.read())
+    if reset:
+        cursor.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+    conn.commit()
+    cursor.close()
+
+
+def insert_rows(conn, sql, rows, page_size=1000):
+    cursor = conn.cursor()
+    for start in range(0, len(rows), page_size):
+        execute_values(cursor, sql, rows[start:start + page_size], page_size=page_size)
+    conn.commit()
+    cursor.close()
+
+
+def seed_prospectos(conn, rng, count, leads):
+    """Prospectos RAW; una fracción comparte teléfono con un lead (ya activados)"""
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(count):
+        nombre = rng.choice(NOMBRES)
+        apellido = rng.choice(APELLIDOS)
+        # ~10% de los prospectos ya existen como lead
+        if leads and rng.random() < 0.1:
+            telefono = phone_for(rng.randrange(leads))
+        else:
+            telefono = phone_for(leads + i)
+        rows.append((
+            nombre, apellido, now - timedelta(days=rng.randrange(365)),
+            rng.choice(PROPIETARIOS), rng.choice(CANALES),
+            f"{nombre}.{apellido}{i}@example.com".lower(), telefono,
+            rng.choice(PROGRAMAS), f"{rng.randrange(5_000_000, 25_000_000)}-{rng.randrange(10)}",
+            rng.choice(CARRERAS), f"{rng.randrange(0, 15)} años", rng.choice(URGENCIAS),
+            'seed.csv', f"seed_{i // 1000}",
+            json.dumps({'origen': 'benchmark', 'fila': i})
+        ))
+
+    insert_rows(conn, """
+        INSERT INTO prospectos_raw (
+            nombre, apellidos, fecha_creacion, propietario, canal, email_1, telefono_1,
+            programa, rut, carrera_postula, experiencia, urgencia,
+            archivo_origen, lote_importacion, datos_adicionales
+        ) VALUES %s
+    """, rows)
+
+
+def seed_leads(conn, rng, count, messages_per_lead):
+    now = datetime.now(timezone.utc)
+    rows = []
+    for i in range(count):
+        nombre = rng.choice(NOMBRES)
+        apellido = rng.choice(APELLIDOS)
+        primer_contacto = now - timedelta(days=rng.randrange(30), hours=rng.randrange(24))
+        dias = (now - primer_contacto).days
+        sent = [dias >= d for d in (3, 5, 6, 8)]
+        rows.append((
+            f"56{phone_for(i)}", nombre, apellido, f"{nombre}.{apellido}{i}@example.com".lower(),
+            phone_for(i), rng.choice(CARRERAS), rng.randrange(0, 15), rng.choice(PROGRAMAS),
+            rng.choice(INTENCIONES), rng.choice(ESTADOS), rng.choice(CANALES),
+            dias, rng.choice([0, 10, 15, 20]), primer_contacto,
+            sent[0], primer_contacto + timedelta(days=3) if sent[0] else None,
+            sent[1], primer_contacto + timedelta(days=5) if sent[1] else None,
+            sent[2], primer_contacto + timedelta(days=6) if sent[2] else None,
+            sent[3], primer_contacto + timedelta(days=8) if sent[3] else None,
+            rng.random() < 0.1, 'chatbot'
+        ))
+
+    insert_rows(conn, """
+        INSERT INTO leads (
+            session_id, nombre, apellido, email, telefono, carrera_interes,
+            experiencia_laboral, plan, nivel_intencion, estado, canal_origen,
+            dias_transcurridos, descuento_actual, fecha_primer_contacto,
+            followup_dia3_enviado, followup_dia3_fecha,
+            followup_dia5_enviado, followup_dia5_fecha,
+            followup_dia6_enviado, followup_dia6_fecha,
+            followup_dia8_enviado, followup_dia8_fecha,
+            derivado_a_humano, chat_status
+        ) VALUES %s
+    """, rows)
+
+    # Historial de chat con el formato de n8n (session_id = 56 + teléfono)
+    messages = []
+    for i in range(count):
+        started = now - timedelta(days=rng.randrange(30))
+        for m in range(rng.randrange(max(messages_per_lead // 2, 1), messages_per_lead * 2)):
+            kind = 'human' if m % 2 == 0 else 'ai'
+            content = f"Mensaje {m} de la conversación {i}. " * rng.randrange(1, 6)
+            messages.append((
+                f"56{phone_for(i)}",
+                json.dumps({'type': kind, 'content': content.strip(), 'additional_kwargs': {}}),
+                started + timedelta(minutes=m)
+            ))
+        if len(messages) >= 20000:
+            insert_rows(conn, "INSERT INTO n8n_chat_histories (session_id, message, timestamp) VALUES %s", messages)
+            messages = []
+    if messages:
+        insert_rows(conn, "INSERT INTO n8n_chat_histories (session_id, message, timestamp) VALUES %s", messages)
+
+
+def seed_knowledge_bases(conn, rng, bases, points, vector_dimension):
+    cursor = conn.cursor()
+    base_ids = []
+    for b in range(bases):
+        cursor.execute("""
+            INSERT INTO knowledge_bases (nombre, descripcion, qdrant_collection_name, vector_dimension)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, (f"Base benchmark {b}", 'Datos sintéticos', f"bench_base_{b}", vector_dimension))
+        base_ids.append(str(cursor.fetchone()['id']))
+    conn.commit()
+    cursor.close()
+
+    for base_id in base_ids:
+        rows = []
+        for p in range(points):
+            carrera = rng.choice(CARRERAS)
+            content = (f"Pregunta frecuente {p} sobre {carrera}: requisitos, aranceles, "
+                       f"modalidad y duración del programa. ") * rng.randrange(2, 8)
+            rows.append((base_id, content.strip(), json.dumps({'carrera': carrera, 'orden': p})))
+        insert_rows(conn, """
+            INSERT INTO knowledge_points (knowledge_base_id, page_content, metadata) VALUES %s
+        """, rows)
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE knowledge_bases kb
+        SET total_points = (SELECT COUNT(*) FROM knowledge_points kp WHERE kp.knowledge_base_id = kb.id)
+    """)
+    conn.commit()
+    cursor.close()
+    return base_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Poblar una base de datos local para benchmarks')
+    parser.add_argument('--prospectos', type=int, default=50000)
+    parser.add_argument('--leads', type=int, default=5000)
+    parser.add_argument('--messages-per-lead', type=int, default=20)
+    parser.add_argument('--kb-bases', type=int, default=2)
+    parser.add_argument('--kb-points', type=int, default=2000)
+    parser.add_argument('--vector-dimension', type=int, default=3072)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--reset', action='store_true', help='Vaciar las tablas antes de poblar')
+    parser.add_argument('--allow-remote', action='store_true')
+    args = parser.parse_args()
+
+    check_host('DB_HOST', args.allow_remote)
+    check_host('KB_DB_HOST', args.allow_remote)
+    rng = random.Random(args.seed)
+
+    conn = get_db_connection()
+    kb_conn = get_kb_db_connection()
+    if not conn or not kb_conn:
+        raise SystemExit('No se pudo conectar a la base de datos')
+
+    started = time.perf_counter()
+    apply_schema(conn, args.reset)
+    apply_schema(kb_conn, args.reset)
+
+    print(f"Leads: {args.leads} (≈{args.messages_per_lead} mensajes c/u)")
+    seed_leads(conn, rng, args.leads, args.messages_per_lead)
+    print(f"Prospectos RAW: {args.prospectos}")
+    seed_prospectos(conn, rng, args.prospectos, args.leads)
+    print(f"Knowledge bases: {args.kb_bases} x {args.kb_points} puntos")
+    base_ids = seed_knowledge_bases(kb_conn, rng, args.kb_bases, args.kb_points, args.vector_dimension)
+
+    for c in (conn, kb_conn):
+        cursor = c.cursor()
+        cursor.execute('ANALYZE')
+        c.commit()
+        cursor.close()
+        c.close()
+
+    sample = rng.sample(range(args.leads), min(args.leads, 200))
+    manifest = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'volumes': {key: value for key, value in vars(args).items() if key not in ('reset', 'allow_remote')},
+        'telefonos': [phone_for(i) for i in sample],
+        'knowledge_base_ids': base_ids
+    }
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Listo en {time.perf_counter() - started:.1f}s; manifiesto en {MANIFEST_PATH}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""
+Servicios simulados de OpenAI y Qdrant para los benchmarks
+
+    python -m benchmarks.stubs --port 8900 --openai-latency-ms 150
+
+Un solo servidor atiende ambos APIs: las rutas /v1/* imitan OpenAI y el
+resto la API REST de Qdrant (lo que usan QdrantManager y la sincronización).
+Configura la app con:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1  OPENAI_API_KEY=stub
+    QDRANT_URL=http://127.0.0.1:8900          QDRANT_API_KEY=stub
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_DIMENSIONS = {
+    'text-embedding-3-large': 3072,
+    'text-embedding-3-small': 1536,
+    'text-embedding-ada-002': 1536
+}
+
+
+def fake_embedding(text, dimensions):
+    """Vector determinista y normalizado a partir del texto"""
+    seed = int.from_bytes(hashlib.md5(text.encode('utf-8')).digest()[:8], 'little')
+    rng = random.Random(seed)
+    vector = [rng.uniform(-1, 1) for _ in range(dimensions)]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+class StubState:
+    """Colecciones, alias y puntos en memoria"""
+
+    def __init__(self, openai_latency, qdrant_latency, error_rate):
+        self.openai_latency = openai_latency
+        self.qdrant_latency = qdrant_latency
+        self.error_rate = error_rate
+        self.collections = {}
+        self.aliases = {}
+        self.lock = threading.Lock()
+        self.requests = {'openai': 0, 'qdrant': 0, 'errors': 0}
+
+    def resolve(self, name):
+        return self.aliases.get(name, name)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---------- helpers ----------
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _qdrant(self, result, status=200):
+        self._send(status, {'result': result, 'status': 'ok', 'time': 0.0})
+
+    def _qdrant_error(self, status, message):
+        self._send(status, {'status': {'error': message}, 'time': 0.0})
+
+    def _maybe_fail(self, service):
+        """Inyectar errores 503/429 para ejercitar reintentos y circuit breaker"""
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.state.requests['errors'] += 1
+            status = 429 if service == 'openai' else 503
+            body = json.dumps({'error': {'message': 'stub: error inyectado'}}).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Retry-After', '0.2')
+            self.end_headers()
+            self.wfile.write(body)
+            return True
+        return False
+
+    def _route(self, method):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        # Leer siempre el cuerpo para no dejar bytes pendientes en la conexión keep-alive
+        self.body = self._body()
+        service = 'openai' if path.startswith('/v1/') else 'qdrant'
+
+        with self.state.lock:
+            self.state.requests[service] += 1
+        latency = self.state.openai_latency if service == 'openai' else self.state.qdrant_latency
+        if latency:
+            time.sleep(latency / 1000.0)
+        if self._maybe_fail(service):
+            return
+
+        try:
+            if service == 'openai':
+                self._openai(method, path)
+            else:
+                self._qdrant_route(method, path)
+        except Exception as e:
+            self._send(500, {'error': {'message': str(e)}})
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_PUT(self):
+        self._route('PUT')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+    # ---------- OpenAI ----------
+
+    def _openai(self, method, path):
+        if method == 'GET' and path.startswith('/v1/models/'):
+            model = path[len('/v1/models/'):]
+            return self._send(200, {'id': model, 'object': 'model', 'created': 0, 'owned_by': 'stub'})
+
+        if method == 'POST' and path == '/v1/embeddings':
+            body = self.body
+            inputs = body.get('input')
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            model = body.get('model', 'text-embedding-3-large')
+            dimensions = body.get('dimensions') or DEFAULT_DIMENSIONS.get(model, 1536)
+            as_base64 = body.get('encoding_format') == 'base64'
+
+            data = []
+            tokens = 0
+            for index, text in enumerate(inputs):
+                text = text if isinstance(text, str) else ' '.join(map(str, text))
+                tokens += max(len(text) // 4, 1)
+                vector = fake_embedding(text, dimensions)
+                if as_base64:
+                    vector = base64.b64encode(struct.pack(f'<{len(vector)}f', *vector)).decode('ascii')
+                data.append({'object': 'embedding', 'index': index, 'embedding': vector})
+
+            return self._send(200, {
+                'object': 'list',
+                'data': data,
+                'model': model,
+                'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+            })
+
+        self._send(404, {'error': {'message': f'stub: ruta no soportada {method} {path}'}})
+
+    # ---------- Qdrant ----------
+
+    def _qdrant_route(self, method, path):
+        state = self.state
+
+        if method == 'GET' and path == '/collections':
+            with state.lock:
+                names = list(state.collections)
+            return self._qdrant({'collections': [{'name': name} for name in names]})
+
+        if method == 'GET' and path == '/aliases':
+            with state.lock:
+                aliases = [{'alias_name': a, 'collection_name': c} for a, c in state.aliases.items()]
+            return self._qdrant({'aliases': aliases})
+
+        if method == 'POST' and path == '/collections/aliases':
+            body = self.body
+            with state.lock:
+                for action in body.get('actions', []):
+                    if 'delete_alias' in action:
+                        state.aliases.pop(action['delete_alias']['alias_name'], None)
+                    elif 'create_alias' in action:
+                        op = action['create_alias']
+                        state.aliases[op['alias_name']] = op['collection_name']
+            return self._qdrant(True)
+
+        match = re.fullmatch(r'/collections/([^/]+)(/points(?:/(search|count|delete|scroll))?)?', path)
+        if not match:
+            return self._qdrant_error(404, f'stub: ruta no soportada {method} {path}')
+
+        name, points_path, action = match.group(1), match.group(2), match.group(3)
+
+        if not points_path:
+            if method == 'PUT':
+                with state.lock:
+                    state.collections.setdefault(name, {})
+                return self._qdrant(True)
+            if method == 'DELETE':
+                with state.lock:
+                    state.collections.pop(name, None)
+                return self._qdrant(True)
+            return self._qdrant_error(404, f'stub: ruta no soportada {method} {path}')
+
+        with state.lock:
+            points = state.collections.get(state.resolve(name))
+        if points is None:
+            return self._qdrant_error(404, f'Collection `{name}` not found')
+
+        body = self.body
+
+        if method == 'PUT' and action is None:
+            with state.lock:
+                for point in body.get('points', []):
+                    points[str(point['id'])] = point
+            return self._qdrant({'operation_id': 0, 'status': 'completed'})
+
+        if method == 'POST' and action is None:
+            ids = [str(i) for i in body.get('ids', [])]
+            with state.lock:
+                found = [points[i] for i in ids if i in points]
+            return self._qdrant([
+                {'id': p['id'], 'payload': p.get('payload'),
+                 'vector': p.get('vector') if body.get('with_vector') else None}
+                for p in found
+            ])
+
+        if action == 'count':
+            return self._qdrant({'count': len(points)})
+
+        if action == 'delete':
+            with state.lock:
+                for point_id in body.get('points', []):
+                    points.pop(str(point_id), None)
+            return self._qdrant({'operation_id': 0, 'status': 'completed'})
+
+        if action == 'search':
+            limit = body.get('limit', 10)
+            with state.lock:
+                sample = list(points.values())[:limit]
+            return self._qdrant([
+                {'id': p['id'], 'version': 0, 'score': 1.0 - i * 0.01, 'payload': p.get('payload')}
+                for i, p in enumerate(sample)
+            ])
+
+        if action == 'scroll':
+            limit = body.get('limit', 10)
+            with state.lock:
+                sample = list(points.values())[:limit]
+            return self._qdrant({
+                'points': [{'id': p['id'], 'payload': p.get('payload')} for p in sample],
+                'next_page_offset': None
+            })
+
+        self._qdrant_error(404, f'stub: ruta no soportada {method} {path}')
+
+
+def serve(host='127.0.0.1', port=8900, openai_latency=150, qdrant_latency=20, error_rate=0.0):
+    """Levantar el servidor simulado (bloqueante)"""
+    StubHandler.state = StubState(openai_latency, qdrant_latency, error_rate)
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    print(f"Stubs en http://{host}:{port} (OpenAI: /v1, Qdrant: /)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Requests atendidos: {StubHandler.state.requests}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI y Qdrant simulados para benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--openai-latency-ms', type=float, default=150)
+    parser.add_argument('--qdrant-latency-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fracción de requests que responden 429/503')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.openai_latency_ms, args.qdrant_latency_ms, args.error_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,168 @@
 import os
+import threading
+import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import pool as pg_pool
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection as pg_connection
 from dotenv import load_dotenv
+from metrics import InstrumentedCursor
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Esquemas de soporte ya verificados en este proceso
+_ensured_schemas = set()
+_schema_lock = threading.Lock()
+
+# Pools de conexiones por base de datos: {nombre: (pid, pool)}
+_pools = {}
+_pools_lock = threading.Lock()
+_last_used = {}
+
+def _pool_settings():
+    return {
+        'min': int(os.getenv('DB_POOL_MIN', '1')),
+        'max': int(os.getenv('DB_POOL_MAX', '10')),
+        # Segundos de inactividad tras los cuales se descarta una conexión
+        # (el pooler de Supabase cierra las conexiones ociosas)
+        'recycle': int(os.getenv('DB_POOL_RECYCLE', '300'))
+    }
+
+class LabeledConnection(pg_connection):
+    """Conexión de psycopg2 que recuerda de qué pool proviene ('main', 'kb')"""
+    
+    label = None
+
+class PooledConnection:
+    """
+    Conexión prestada por el pool
+
+    Se comporta como una conexión de psycopg2; close() la devuelve al pool
+    (con rollback si quedó una transacción abierta) en lugar de cerrarla.
+    """
+    
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+    
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError('connection already returned to pool')
+        return getattr(conn, name)
+    
+    def __setattr__(self, name, value):
+        # p. ej. conn.autocommit = True debe llegar a la conexión real
+        setattr(self._conn, name, value)
+    
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                discard = True
+        
+        try:
+            _last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=discard)
+        except pg_pool.PoolError:
+            conn.close()
+    
+    def __del__(self):
+        # Una conexión olvidada sin close() vuelve al pool al recolectarse
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def _get_pool(name, connect_kwargs):
+    """Pool del proceso actual; los pools heredados por fork se descartan"""
+    pid = os.getpid()
+    entry = _pools.get(name)
+    if entry and entry[0] == pid:
+        return entry[1]
+    
+    with _pools_lock:
+        entry = _pools.get(name)
+        if entry and entry[0] == pid:
+            return entry[1]
+        
+        settings = _pool_settings()
+        pool = pg_pool.ThreadedConnectionPool(
+            settings['min'], settings['max'],
+            connection_factory=LabeledConnection,
+            cursor_factory=InstrumentedCursor,
+            **connect_kwargs
+        )
+        _pools[name] = (pid, pool)
+        return pool
+
+def get_pooled_connection(name, connect_kwargs):
+    """
+    Obtener una conexión del pool `name`
+
+    Con DB_POOL_MAX=0, o si el pool está agotado, abre una conexión directa.
+    """
+    settings = _pool_settings()
+    if settings['max'] <= 0:
+        return _direct_connection(name, connect_kwargs)
+    
+    pool = _get_pool(name, connect_kwargs)
+    try:
+        conn = pool.getconn()
+    except pg_pool.PoolError:
+        print(f"Pool {name} agotado, usando conexión directa")
+        return _direct_connection(name, connect_kwargs)
+    
+    last_used = _last_used.get(id(conn))
+    if conn.closed or (last_used and time.monotonic() - last_used > settings['recycle']):
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    
+    conn.label = name
+    return PooledConnection(pool, conn)
+
+def _direct_connection(name, connect_kwargs):
+    conn = psycopg2.connect(
+        connection_factory=LabeledConnection,
+        cursor_factory=InstrumentedCursor,
+        **connect_kwargs
+    )
+    conn.label = name
+    return conn
+
+def reset_pools():
+    """
+    Olvidar los pools heredados tras un fork (p. ej. en cada worker de gunicorn)
+
+    Las conexiones no se cierran: sus sockets siguen perteneciendo al proceso
+    padre y cerrarlas desde el hijo cortaría las del padre.
+    """
+    with _pools_lock:
+        _pools.clear()
+        _last_used.clear()
+
 def get_db_connection():
     """
     Crea y retorna una conexión a la base de datos Supabase
     """
     try:
-        conn = psycopg2.connect(
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT'),
-            database=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            cursor_factory=RealDictCursor
-        )
-        return conn
+        return get_pooled_connection('main', {
+            'host': os.getenv('DB_HOST'),
+            'port': os.getenv('DB_PORT'),
+            'database': os.getenv('DB_NAME'),
+            'user': os.getenv('DB_USER'),
+            'password': os.getenv('DB_PASSWORD')
+        })
     except Exception as e:
         print(f"Error al conectar a la base de datos: {e}")
         return None
@@ -43,3 +186,41 @@ def test_connection():
             print(f"Error al ejecutar query: {e}")
             return False
     return False
+
+
+def ensure_schema(name, sql, connection_factory=None):
+    """
+    Ejecuta una sola vez por proceso el DDL idempotente de una tabla de soporte
+
+    Args:
+        name: Identificador del esquema (para no repetir la ejecución)
+        sql: Sentencias CREATE ... IF NOT EXISTS
+        connection_factory: Función que retorna una conexión (por defecto get_db_connection)
+
+    Returns:
+        True si el esquema está disponible
+    """
+    if name in _ensured_schemas:
+        return True
+
+    with _schema_lock:
+        if name in _ensured_schemas:
+            return True
+
+        conn = (connection_factory or get_db_connection)()
+        if not conn:
+            return False
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            conn.commit()
+            cursor.close()
+            _ensured_schemas.add(name)
+            return True
+        except Exception as e:
+            print(f"Error creando esquema {name}: {e}")
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
@@ -1,7 +1,6 @@
 import os
-import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
+from database import get_pooled_connection
 
 # Cargar variables de entorno
 load_dotenv()
@@ -11,15 +10,13 @@ def get_kb_db_connection():
     Crea y retorna una conexión a la base de datos de Knowledge Base (Supabase KB)
     """
     try:
-        conn = psycopg2.connect(
-            host=os.getenv('KB_DB_HOST'),
-            port=os.getenv('KB_DB_PORT'),
-            database=os.getenv('KB_DB_NAME'),
-            user=os.getenv('KB_DB_USER'),
-            password=os.getenv('KB_DB_PASSWORD'),
-            cursor_factory=RealDictCursor
-        )
-        return conn
+        return get_pooled_connection('kb', {
+            'host': os.getenv('KB_DB_HOST'),
+            'port': os.getenv('KB_DB_PORT'),
+            'database': os.getenv('KB_DB_NAME'),
+            'user': os.getenv('KB_DB_USER'),
+            'password': os.getenv('KB_DB_PASSWORD')
+        })
     except Exception as e:
         print(f"Error al conectar a la base de datos KB: {e}")
         return None
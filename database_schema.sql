@@ -37,6 +37,33 @@ CREATE INDEX IF NOT EXISTS idx_prospectos_raw_telefono_1 ON prospectos_raw(telef
 CREATE INDEX IF NOT EXISTS idx_prospectos_raw_rut ON prospectos_raw(rut);
 CREATE INDEX IF NOT EXISTS idx_prospectos_raw_fecha_creacion ON prospectos_raw(fecha_creacion);
 CREATE INDEX IF NOT EXISTS idx_prospectos_raw_lote ON prospectos_raw(lote_importacion);
+-- Búsqueda exacta por RUT sin importar puntos y guion
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_rut_norm
+    ON prospectos_raw (upper(regexp_replace(rut, '[^0-9kK]', '', 'g')));
+
+-- Detección de duplicados al importar (modules/prospectos/dedupe.py los crea si faltan)
+CREATE OR REPLACE FUNCTION public.normalize_phone_cl(phone text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN d ~ '^9[0-9]{8}$' THEN '56' || d
+        WHEN d ~ '^[0-9]{8}$' THEN '569' || d
+    END
+    FROM (
+        SELECT CASE WHEN left(digits, 2) = '56' THEN substr(digits, 3) ELSE digits END AS d
+        FROM (SELECT regexp_replace(coalesce(phone, ''), '[^0-9]', '', 'g') AS digits) s
+    ) t
+$$;
+
+ALTER TABLE prospectos_raw ADD COLUMN IF NOT EXISTS duplicado_de BIGINT;
+ALTER TABLE prospectos_raw ADD COLUMN IF NOT EXISTS duplicado_lead BIGINT;
+
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_phone_key
+    ON prospectos_raw (public.normalize_phone_cl(telefono_1));
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_email_key
+    ON prospectos_raw (lower(btrim(email_1)));
+
+-- Prospectos ya pasados a leads (lo escribe /prospectos/api/activar)
+ALTER TABLE prospectos_raw ADD COLUMN IF NOT EXISTS estado VARCHAR(50);
 
 -- Trigger para actualizar updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -55,4 +82,6 @@ CREATE TRIGGER update_prospectos_raw_updated_at
 -- Comentarios
 COMMENT ON TABLE prospectos_raw IS 'Tabla para almacenar prospectos importados de diferentes fuentes';
 COMMENT ON COLUMN prospectos_raw.datos_adicionales IS 'Columnas adicionales del archivo original en formato JSON';
+COMMENT ON COLUMN prospectos_raw.duplicado_de IS 'Prospecto existente (o fila anterior del mismo lote) con el mismo teléfono, email o RUT';
+COMMENT ON COLUMN prospectos_raw.duplicado_lead IS 'Lead existente con el mismo teléfono o email al momento de importar';
 COMMENT ON COLUMN prospectos_raw.lote_importacion IS 'ID único del lote de importación para poder rastrear y eliminar si es necesario';
@@ -0,0 +1,499 @@
+"""
+Caché de facetas: valores distintos y su conteo por columna
+
+Los filtros tipo Excel de prospectos y de activos leen de la tabla
+facet_values en lugar de recorrer prospectos_raw/leads en cada apertura.
+
+- Reconstrucción completa: una sola pasada con GROUPING SETS por fuente,
+  desde init_db.py o el warm-up al arrancar, y luego en segundo plano
+  cuando pasan FACET_TTL segundos (corrige cambios hechos fuera de la app,
+  p. ej. por n8n). Nunca corre dentro de un request.
+- Deltas incrementales: las escrituras de la app (import, activación,
+  cambio de estado) envuelven el cambio en track_facets(), que cuenta las
+  filas afectadas antes y después en la misma transacción y suma la
+  diferencia.
+- Totales: facet_totals guarda las filas de cada fuente y una versión que
+  sube con cada cambio, así /api/stats y sus ETags no recorren las tablas.
+
+Las tablas facet_values, facet_state y facet_totals las crea init_db.py.
+"""
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from psycopg2.extras import execute_values
+
+from database import get_db_connection
+
+FACET_TTL = int(os.getenv('FACET_TTL', '3600'))
+
+# Reintentos de una reconstrucción cuyos conteos quedaron viejos por un delta
+FACET_REBUILD_ATTEMPTS = int(os.getenv('FACET_REBUILD_ATTEMPTS', '3'))
+
+# Cada fuente: FROM/WHERE que define sus filas, columnas con faceta, columna
+# de fecha para first_at (opcional) y cada cuánto se reconstruye
+SOURCES = {
+    # Prospectos RAW que todavía no son leads (lo que muestra la tabla de prospectos)
+    'prospectos': {
+        'from_sql': """
+            prospectos_raw
+            WHERE NOT EXISTS (
+                SELECT 1 FROM leads
+                WHERE leads.telefono = prospectos_raw.telefono_1
+            )
+        """,
+        'columns': ['nombre', 'apellidos', 'email_1', 'telefono_1', 'programa', 'propietario',
+                    'lote_importacion'],
+        'first_at': 'fecha_importacion',
+        'ttl': FACET_TTL
+    },
+    # n8n también escribe en leads (estado): se reconstruye más seguido (la
+    # reconstrucción no bloquea los deltas mientras cuenta)
+    'leads': {
+        'from_sql': "leads WHERE 1=1",
+        'columns': ['carrera_interes', 'plan', 'estado'],
+        'ttl': int(os.getenv('FACET_TTL_LEADS', '60'))
+    }
+}
+
+# Clave del Counter de _aggregate con el total de filas
+TOTAL = ('*', None)
+
+VALUE_ORDERS = {
+    'value': 'value',
+    'count': 'count DESC, value',
+    'first_at': 'first_at DESC NULLS LAST, value'
+}
+
+
+def _aggregate(cursor, source, where_sql=None, params=()):
+    """
+    Conteo por (columna, valor) y total de filas en una sola pasada (GROUPING SETS)
+
+    Returns:
+        (Counter {(columna, valor o None): filas, TOTAL: filas},
+         dict {(columna, valor): primera fecha} si la fuente define first_at)
+    """
+    config = SOURCES[source]
+    columns = config['columns']
+    grouping = ', '.join(f"GROUPING({column}) AS g_{column}" for column in columns)
+    sets = ', '.join(f"({column})" for column in columns)
+    first_at = f"MIN({config['first_at']})" if config.get('first_at') else 'NULL'
+    extra = f" AND ({where_sql})" if where_sql else ''
+
+    cursor.execute(f"""
+        SELECT {', '.join(f'{column}::text AS {column}' for column in columns)},
+               {grouping}, COUNT(*) AS count, {first_at} AS first_at
+        FROM {config['from_sql']}{extra}
+        GROUP BY GROUPING SETS ({sets}, ())
+    """, list(params))
+
+    counts = Counter()
+    firsts = {}
+    for row in cursor.fetchall():
+        for column in columns:
+            # GROUPING() = 0 indica la columna agrupada en esta fila
+            if row[f'g_{column}'] == 0:
+                counts[(column, row[column])] += row['count']
+                if row['first_at'] is not None:
+                    firsts[(column, row[column])] = row['first_at']
+                break
+        else:
+            # Conjunto vacío (): total de filas
+            counts[TOTAL] += row['count']
+    return counts, firsts
+
+
+def _lock(cursor, source, shared):
+    """Los deltas toman el lock compartido y la reconstrucción el exclusivo"""
+    function = 'pg_advisory_xact_lock_shared' if shared else 'pg_advisory_xact_lock'
+    cursor.execute(f"SELECT {function}(hashtext(%s))", (f'facet_values:{source}',))
+
+
+def _write_delta(cursor, source, delta, firsts):
+    """Sumar un Counter de diferencias a facet_values/facet_state/facet_totals"""
+    total = delta.pop(TOTAL, 0)
+    # Orden fijo para que dos transacciones concurrentes no se bloqueen mutuamente
+    values = sorted((source, column, value, count, firsts.get((column, value)))
+                    for (column, value), count in delta.items() if value is not None and count)
+    nulls = sorted((source, column, count) for (column, value), count in delta.items() if value is None and count)
+
+    if not (values or nulls or total):
+        return
+
+    # first_at solo retrocede con los deltas; si se quitan filas se corrige al reconstruir
+    if values:
+        execute_values(cursor, """
+            INSERT INTO facet_values (source, column_name, value, count, first_at)
+            VALUES %s
+            ON CONFLICT (source, column_name, value)
+            DO UPDATE SET count = facet_values.count + EXCLUDED.count,
+                          first_at = LEAST(facet_values.first_at, EXCLUDED.first_at)
+        """, values)
+        cursor.execute("""
+            DELETE FROM facet_values
+            WHERE source = %s AND column_name = ANY(%s) AND value = ANY(%s) AND count <= 0
+        """, (source, list({row[1] for row in values}), list({row[2] for row in values})))
+
+    if nulls:
+        cursor.executemany("""
+            UPDATE facet_state SET null_count = GREATEST(null_count + %s, 0)
+            WHERE source = %s AND column_name = %s
+        """, [(count, source, column) for source, column, count in nulls])
+
+    cursor.execute("""
+        UPDATE facet_totals SET total = GREATEST(total + %s, 0), version = version + 1
+        WHERE source = %s
+    """, (total, source))
+
+
+# Se cachea solo cuando existen: tras correr init_db.py empiezan a usarse
+# sin reiniciar
+_tables_ready = None
+
+
+def _ready(cursor):
+    """Si existen las tablas de la caché (las crea init_db.py)"""
+    global _tables_ready
+    if not _tables_ready:
+        cursor.execute("SELECT to_regclass('facet_totals') IS NOT NULL AS ready")
+        ready = cursor.fetchone()['ready']
+        if not ready and _tables_ready is None:
+            print("⚠️ Caché de facetas sin tablas: ejecuta init_db.py")
+        _tables_ready = ready
+    return _tables_ready
+
+
+def _isolated(cursor, source, step):
+    """Ejecutar step() en un SAVEPOINT: un error de facetas no aborta la transacción del llamador"""
+    try:
+        cursor.execute("SAVEPOINT facet_delta")
+    except Exception as e:
+        # Transacción ya abortada: el llamador hará rollback de todos modos
+        print(f"Facetas de {source} omitidas: {e}")
+        return None
+    try:
+        result = step()
+        cursor.execute("RELEASE SAVEPOINT facet_delta")
+        return result
+    except Exception as e:
+        print(f"Error actualizando facetas de {source}: {e}")
+        cursor.execute("ROLLBACK TO SAVEPOINT facet_delta")
+        return None
+
+
+@contextmanager
+def track_facets(cursor, source, where_sql, params=()):
+    """
+    Aplicar a la caché de facetas el efecto de un cambio en la transacción actual
+
+        with track_facets(cursor, 'leads', "id = ANY(%s)", [ids]):
+            cursor.execute("UPDATE leads SET estado = ...")
+        conn.commit()
+
+    where_sql debe seleccionar las filas afectadas tanto antes como después
+    del cambio. Si la caché de la fuente todavía no existe no hace nada (se
+    construirá completa en segundo plano).
+    """
+    def snapshot():
+        if not _ready(cursor):
+            return None
+        cursor.execute("SELECT 1 FROM facet_totals WHERE source = %s", (source,))
+        if cursor.fetchone() is None:
+            return None
+        _lock(cursor, source, shared=True)
+        counts, _ = _aggregate(cursor, source, where_sql, params)
+        return counts
+
+    before = _isolated(cursor, source, snapshot)
+    yield
+
+    if before is not None:
+        def apply():
+            delta, firsts = _aggregate(cursor, source, where_sql, params)
+            delta.subtract(before)
+            _write_delta(cursor, source, delta, firsts)
+
+        _isolated(cursor, source, apply)
+
+
+class FacetCache:
+    """Lectura de facetas con reconstrucción completa cuando vencen"""
+
+    def __init__(self):
+        self._rebuilding = set()
+        self._lock = threading.Lock()
+
+    def rebuild(self, source):
+        """
+        Recalcular todas las facetas de una fuente en una sola pasada
+
+        El GROUPING SETS corre sin bloquear los deltas, en una transacción
+        REPEATABLE READ junto con la versión de facet_totals; el lock
+        exclusivo se toma solo para reemplazar las filas. Si un delta cambió
+        la versión entretanto, el conteo ya no corresponde y se repite (hasta
+        FACET_REBUILD_ATTEMPTS veces). Un solo proceso reconstruye cada fuente
+        a la vez; si otro ya lo está haciendo retorna False.
+        """
+        conn = get_db_connection()
+        if not conn:
+            return False
+
+        started = time.perf_counter()
+        rebuild_key = f'facet_rebuild:{source}'
+        try:
+            cursor = conn.cursor()
+            if not _ready(cursor):
+                cursor.close()
+                return False
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s)) AS locked", (rebuild_key,))
+            locked = cursor.fetchone()['locked']
+            conn.commit()
+            if not locked:
+                cursor.close()
+                return False
+
+            try:
+                for _ in range(FACET_REBUILD_ATTEMPTS):
+                    counts, firsts, version = self._count(cursor, source)
+                    conn.commit()
+                    if self._swap(cursor, source, counts, firsts, version):
+                        conn.commit()
+                        print(f"Facetas de {source} reconstruidas en {time.perf_counter() - started:.2f}s ({len(counts)} valores)")
+                        return True
+                    conn.rollback()
+                print(f"Facetas de {source} sin reconstruir: cambiaron en cada uno de {FACET_REBUILD_ATTEMPTS} intentos")
+                return False
+            finally:
+                # El lock es de sesión: sobrevive al rollback y hay que soltarlo
+                # antes de devolver la conexión al pool
+                conn.rollback()
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (rebuild_key,))
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            print(f"Error reconstruyendo facetas de {source}: {e}")
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
+
+    def _count(self, cursor, source):
+        """Conteos de la fuente y la versión de facet_totals que les corresponde (misma instantánea)"""
+        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        cursor.execute("SELECT version FROM facet_totals WHERE source = %s", (source,))
+        row = cursor.fetchone()
+        counts, firsts = _aggregate(cursor, source)
+        return counts, firsts, row['version'] if row else None
+
+    def _swap(self, cursor, source, counts, firsts, version):
+        """Reemplazar las facetas guardadas (sin commit); False si la versión ya cambió"""
+        _lock(cursor, source, shared=False)
+        cursor.execute("SELECT version FROM facet_totals WHERE source = %s", (source,))
+        row = cursor.fetchone()
+        if (row['version'] if row else None) != version:
+            return False
+
+        changed = self._changed(cursor, source, counts)
+
+        cursor.execute("DELETE FROM facet_values WHERE source = %s", (source,))
+        execute_values(cursor, """
+            INSERT INTO facet_values (source, column_name, value, count, first_at) VALUES %s
+        """, [(source, column, value, count, firsts.get((column, value)))
+              for (column, value), count in counts.items() if value is not None],
+            page_size=1000)
+
+        cursor.execute("DELETE FROM facet_state WHERE source = %s", (source,))
+        cursor.executemany("""
+            INSERT INTO facet_state (source, column_name, null_count, built_at)
+            VALUES (%s, %s, %s, NOW())
+        """, [(source, column, counts.get((column, None), 0)) for column in SOURCES[source]['columns']])
+
+        # La versión solo sube si algo cambió: las ETags de /api/stats siguen valiendo
+        cursor.execute("""
+            INSERT INTO facet_totals (source, total, version, built_at)
+            VALUES (%s, %s, 1, NOW())
+            ON CONFLICT (source) DO UPDATE
+            SET total = EXCLUDED.total,
+                version = facet_totals.version + %s,
+                built_at = NOW()
+        """, (source, counts[TOTAL], 1 if changed else 0))
+        return True
+
+    def _changed(self, cursor, source, counts):
+        """Si los conteos recién calculados difieren de los guardados"""
+        cursor.execute("""
+            SELECT column_name, value, count FROM facet_values WHERE source = %s
+            UNION ALL
+            SELECT column_name, NULL, null_count FROM facet_state WHERE source = %s
+            UNION ALL
+            SELECT %s, NULL, total FROM facet_totals WHERE source = %s
+        """, (source, source, TOTAL[0], source))
+        stored = Counter({(row['column_name'], row['value']): row['count'] for row in cursor.fetchall()})
+        return +stored != +counts
+
+    def _rebuild_in_background(self, source):
+        with self._lock:
+            if source in self._rebuilding:
+                return
+            self._rebuilding.add(source)
+
+        def runner():
+            try:
+                self.rebuild(source)
+            finally:
+                with self._lock:
+                    self._rebuilding.discard(source)
+
+        threading.Thread(target=runner, name=f'facets-{source}', daemon=True).start()
+
+    def start_background_warm_up(self):
+        """Construir en un hilo daemon las fuentes que aún no tienen facetas (desactivable con FACET_WARMUP=0)"""
+        if os.getenv('FACET_WARMUP', '1') == '0':
+            return None
+
+        def runner():
+            conn = get_db_connection()
+            if not conn:
+                return
+            try:
+                cursor = conn.cursor()
+                if not _ready(cursor):
+                    cursor.close()
+                    return
+                cursor.execute("SELECT source FROM facet_totals")
+                built = {row['source'] for row in cursor.fetchall()}
+                cursor.close()
+            finally:
+                conn.close()
+            for source in SOURCES:
+                if source not in built:
+                    self.rebuild(source)
+
+        thread = threading.Thread(target=runner, name='facets-warm-up', daemon=True)
+        thread.start()
+        return thread
+
+    def _state(self, cursor, source, column):
+        cursor.execute("""
+            SELECT null_count, EXTRACT(EPOCH FROM NOW() - built_at) AS age
+            FROM facet_state
+            WHERE source = %s AND column_name = %s
+        """, (source, column))
+        return cursor.fetchone()
+
+    def _fresh(self, conn, cursor, source, read):
+        """
+        Ejecutar read(cursor); si retorna None la fuente no está construida:
+        se construye en segundo plano y retorna None. Si la fila leída tiene
+        más de ttl segundos de antigüedad ('age') también se reconstruye en
+        segundo plano.
+        """
+        row = read(cursor)
+        if row is None:
+            # Aún no construida (init_db.py o el warm-up lo hacen): no se
+            # recorre la tabla dentro del request
+            self._rebuild_in_background(source)
+            return None
+
+        ttl = SOURCES[source]['ttl']
+        if ttl > 0 and row['age'] > ttl:
+            self._rebuild_in_background(source)
+        return row
+
+    def totals(self, source):
+        """
+        Total de filas y versión de una fuente (una fila de facet_totals)
+
+        La versión cambia con cada delta o reconstrucción que modifica los
+        conteos: sirve como versión para GET condicionales.
+
+        Returns:
+            Dict {'total', 'version'} o None si la caché no está disponible
+        """
+        conn = get_db_connection()
+        if not conn:
+            return None
+
+        def read(cursor):
+            cursor.execute("""
+                SELECT total, version, EXTRACT(EPOCH FROM NOW() - built_at) AS age
+                FROM facet_totals
+                WHERE source = %s
+            """, (source,))
+            return cursor.fetchone()
+
+        try:
+            cursor = conn.cursor()
+            row = self._fresh(conn, cursor, source, read) if _ready(cursor) else None
+            cursor.close()
+            return {'total': row['total'], 'version': row['version']} if row else None
+        finally:
+            conn.close()
+
+    def version(self, source):
+        """Versión de la fuente para conditional() (None si no está disponible)"""
+        totals = self.totals(source)
+        return totals['version'] if totals else None
+
+    def values(self, source, column, prefix=None, limit=500, order='value'):
+        """
+        Valores de una faceta ordenados, con su conteo
+
+        Args:
+            prefix: Solo valores que empiezan con este texto (sin distinguir mayúsculas)
+            limit: Máximo de valores a retornar
+            order: 'value' (alfabético), 'count' (más filas primero) o
+                'first_at' (más recientes primero)
+
+        Returns:
+            Dict con items [{'value', 'count', 'first_at'}], null_count y
+            truncated, o None si la caché no está disponible
+        """
+        if column not in SOURCES[source]['columns']:
+            raise ValueError(f"{column} no tiene faceta en {source}")
+        if order not in VALUE_ORDERS:
+            raise ValueError(f"Orden de facetas no soportado: {order}")
+        conn = get_db_connection()
+        if not conn:
+            return None
+
+        try:
+            cursor = conn.cursor()
+            if not _ready(cursor):
+                cursor.close()
+                return None
+            state = self._fresh(conn, cursor, source, lambda cursor: self._state(cursor, source, column))
+            if state is None:
+                return None
+
+            params = [source, column]
+            prefix_sql = ''
+            if prefix:
+                escaped = prefix.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                prefix_sql = "AND lower(value) LIKE %s"
+                params.append(escaped + '%')
+
+            cursor.execute(f"""
+                SELECT value, count, first_at
+                FROM facet_values
+                WHERE source = %s AND column_name = %s {prefix_sql}
+                ORDER BY {VALUE_ORDERS[order]}
+                LIMIT %s
+            """, params + [limit + 1])
+            rows = cursor.fetchall()
+            cursor.close()
+
+            return {
+                'items': [{'value': row['value'], 'count': row['count'], 'first_at': row['first_at']}
+                          for row in rows[:limit]],
+                'null_count': state['null_count'] if not prefix else 0,
+                'truncated': len(rows) > limit
+            }
+        finally:
+            conn.close()
+
+
+facet_cache = FacetCache()
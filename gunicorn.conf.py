@@ -0,0 +1,82 @@
+"""
+Configuración de gunicorn para producción
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Variables de entorno:
+    PORT                  Puerto (5000)
+    GUNICORN_WORKERS      Procesos worker (2 x CPU + 1)
+    GUNICORN_THREADS      Hilos por worker (4)
+    GUNICORN_TIMEOUT      Segundos antes de reiniciar un worker bloqueado (120)
+    GUNICORN_MAX_REQUESTS Requests antes de reciclar un worker (1000, 0 = nunca)
+    WEB_CONCURRENCY       Procesos que reparten los límites de OpenAI/Qdrant
+                          (por defecto los workers)
+
+Con preload_app el master ya importó la app: `kill -HUP <pid del master>`
+reemplaza los workers de forma ordenada pero con el mismo código cargado
+(sirve para reciclarlos, no para desplegar). Un despliegue necesita
+reiniciar el master (un contenedor nuevo) o una actualización en caliente:
+`kill -USR2 <pid del master>` arranca un master nuevo con el código actual
+y, cuando sus workers responden, `kill -QUIT <pid del master anterior>`.
+"""
+import multiprocessing
+import os
+
+# Indica a app.py que los hilos de fondo se inician por worker (post_fork)
+os.environ['APP_SERVER'] = 'gunicorn'
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Los workers reparten entre sí los límites de OpenAI/Qdrant (rate_governor.py)
+os.environ.setdefault('WEB_CONCURRENCY', str(workers))
+worker_class = 'gthread'
+
+# La app (blueprints y dependencias livianas) se importa una vez en el master y los
+# workers la heredan por copy-on-write
+preload_app = True
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# Reciclar workers periódicamente acota fugas de memoria
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """
+    Con HEAVY_IMPORTS=eager las dependencias pesadas se importan en el master
+
+    Corre antes de crear los workers, que las heredan ya cargadas y
+    comparten esas páginas de memoria por copy-on-write.
+    """
+    import startup
+
+    if startup.heavy_imports_mode() == 'eager':
+        timings = startup.import_heavy_modules()
+        server.log.info(f"Dependencias precargadas: {timings}")
+
+
+def post_fork(server, worker):
+    """
+    Estado por proceso: pools de conexiones, clientes HTTP e hilos de fondo
+
+    Lo creado en el master antes del fork no se comparte entre workers.
+    """
+    from database import reset_pools
+    from metrics import reset_metrics
+    from modules.knowledge_base.clients import reset_clients
+    from modules.knowledge_base.rate_governor import reset_governors
+    import app as dashboard
+
+    reset_pools()
+    reset_clients()
+    reset_governors()
+    reset_metrics()
+    dashboard.start_background_services()
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from database import get_db_connection
+
+
+def check_database():
+    """Conexión y versión de la base de datos principal"""
+    conn = get_db_connection()
+    if not conn:
+        return {'success': False, 'error': 'Could not connect to database'}
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT version();")
+        db_version = cursor.fetchone()
+        cursor.close()
+        return {'success': True, 'version': db_version}
+    finally:
+        conn.close()
+
+
+def check_kb_database():
+    """Conexión a la base de datos de Knowledge Base"""
+    from database_kb import get_kb_db_connection
+
+    conn = get_kb_db_connection()
+    if not conn:
+        return {'success': False, 'error': 'Could not connect to KB database'}
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM knowledge_bases")
+        kb_count = cursor.fetchone()['count']
+        cursor.close()
+        return {'success': True, 'knowledge_bases_count': kb_count}
+    finally:
+        conn.close()
+
+
+def check_qdrant():
+    """Listado de colecciones en Qdrant"""
+    from modules.knowledge_base.clients import get_qdrant_manager
+
+    return get_qdrant_manager().test_connection()
+
+
+def check_openai():
+    """
+    Disponibilidad de la API de OpenAI
+
+    Consulta los metadatos del modelo en vez de generar un embedding, así
+    el chequeo no consume tokens.
+    """
+    from modules.knowledge_base.clients import get_embedding_manager
+
+    embeddings = get_embedding_manager()
+    model = embeddings.governor.call(lambda: embeddings.client.models.retrieve(embeddings.model))
+    return {
+        'success': True,
+        'message': 'Conexión exitosa con OpenAI',
+        'model': model.id,
+        'dimensions': embeddings.dimensions
+    }
+
+
+class HealthMonitor:
+    """
+    Ejecuta los chequeos de dependencias en segundo plano y cachea el resultado
+
+    Los endpoints de salud leen solo el último resultado, por lo que un
+    probe del balanceador responde al instante y no genera tráfico hacia
+    OpenAI, Qdrant ni PostgreSQL.
+    """
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self._checks = {}
+        self._results = {}
+        self._last_run = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, name, check, critical=True):
+        """Registrar un chequeo; los críticos determinan la readiness"""
+        self._checks[name] = {'fn': check, 'critical': critical}
+
+    def run_checks(self):
+        """Ejecutar todos los chequeos ahora y actualizar la caché"""
+        with self._run_lock:
+            self._run_checks()
+
+    def _run_checks(self):
+        for name, check in self._checks.items():
+            started = time.perf_counter()
+            try:
+                result = check['fn']() or {'success': False}
+            except Exception as e:
+                result = {'success': False, 'error': str(e)}
+
+            result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            result['checked_at'] = datetime.now(timezone.utc).isoformat()
+
+            with self._lock:
+                self._results[name] = result
+
+        with self._lock:
+            self._last_run = time.time()
+
+    def _age(self):
+        with self._lock:
+            last_run = self._last_run
+        return time.time() - last_run if last_run else None
+
+    def refresh(self):
+        """
+        Chequeo a pedido (?refresh=1), como máximo uno por intervalo
+
+        Si el último tiene menos de interval segundos o ya hay uno en curso
+        se usa la caché: los endpoints de salud no requieren autenticación y
+        no deben permitir forzar tráfico hacia las dependencias.
+
+        Returns:
+            True si se ejecutaron los chequeos
+        """
+        age = self._age()
+        if age is not None and age < self.interval:
+            return False
+        if not self._run_lock.acquire(blocking=False):
+            return False
+        try:
+            # Otro request pudo terminar un chequeo mientras tanto
+            age = self._age()
+            if age is not None and age < self.interval:
+                return False
+            self._run_checks()
+            return True
+        finally:
+            self._run_lock.release()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_checks()
+            except Exception as e:
+                print(f"Error en health monitor: {str(e)}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Iniciar el hilo de chequeos (idempotente por proceso)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='health-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def result(self, name):
+        """Último resultado de un chequeo, o None si aún no se ejecuta"""
+        with self._lock:
+            result = self._results.get(name)
+            return dict(result) if result else None
+
+    def snapshot(self):
+        """Estado agregado desde la caché"""
+        with self._lock:
+            results = {name: dict(result) for name, result in self._results.items()}
+            last_run = self._last_run
+
+        age = round(time.time() - last_run, 1) if last_run else None
+        # Si el hilo se detuvo, la caché deja de ser confiable
+        stale = age is None or age > self.interval * 3
+
+        critical_ok = all(
+            results.get(name, {}).get('success')
+            for name, check in self._checks.items() if check['critical']
+        )
+
+        return {
+            'ready': critical_ok and not stale,
+            'stale': stale,
+            'age_seconds': age,
+            'interval_seconds': self.interval,
+            'services': results
+        }
+
+
+health_monitor = HealthMonitor(interval=int(os.getenv('HEALTH_CHECK_INTERVAL', '30')))
+health_monitor.register('database', check_database)
+health_monitor.register('kb_database', check_kb_database, critical=False)
+health_monitor.register('qdrant', check_qdrant, critical=False)
+health_monitor.register('openai', check_openai, critical=False)
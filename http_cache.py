@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import os
+import time
+from functools import wraps
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'text/html', 'text/css',
+    'text/plain', 'text/csv', 'text/javascript', 'image/svg+xml'
+}
+
+# Respuestas más chicas no compensan el costo de comprimir
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '4'))
+
+# Las ETags cambian al menos cada ETAG_MAX_AGE segundos aunque la versión de
+# los datos no cambie, por si algún cambio no sube la versión
+ETAG_MAX_AGE = int(os.getenv('ETAG_MAX_AGE', '300'))
+
+ENCODINGS = ('br', 'gzip')
+
+
+def _negotiate_encoding():
+    """Codificación preferida que acepta el cliente (br > gzip) o None"""
+    accepted = request.accept_encodings
+    for encoding in ENCODINGS:
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+def compress_response(response):
+    """Comprimir con brotli o gzip las respuestas de texto que lo justifiquen"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _negotiate_encoding()
+    if not encoding:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+
+    # Una ETag fuerte identifica los bytes exactos: cada codificación lleva la suya
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+
+def _make_etag(version):
+    window = int(time.time() // ETAG_MAX_AGE) if ETAG_MAX_AGE > 0 else 0
+    key = f"{request.endpoint}|{request.query_string.decode('latin-1')}|{version!r}|{window}"
+    return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+
+def _matching_etag(etag):
+    """Variante de la ETag (sin comprimir o por codificación) que ya tiene el cliente"""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    for candidate in (etag, *(f"{etag}-{encoding}" for encoding in ENCODINGS)):
+        if if_none_match.contains(candidate):
+            return candidate
+    return None
+
+
+def conditional(version_func):
+    """
+    Decorador de GET condicional para endpoints que se consultan periódicamente
+
+    version_func() retorna un valor que cambia cuando cambian los datos (p. ej.
+    la versión de facet_totals, ver facets.FacetCache.version). Si el cliente envía If-None-Match con la ETag vigente se
+    responde 304 sin ejecutar la vista; si no, la respuesta lleva la ETag y
+    Cache-Control: no-cache para que el navegador siempre revalide. Si la
+    versión no se puede obtener, la vista responde como siempre.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = version_func()
+            if version is None:
+                return view(*args, **kwargs)
+
+            etag = _make_etag(version)
+            matched = _matching_etag(etag)
+            if matched:
+                response = current_app.response_class(status=304)
+                etag = matched
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                # No cachear errores (incluidos los que responden 200 con success=False)
+                payload = response.get_json(silent=True) if response.is_json else None
+                if response.status_code != 200 or (isinstance(payload, dict) and payload.get('success') is False):
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """Registrar la compresión de respuestas"""
+    app.after_request(compress_response)
@@ -5,6 +5,8 @@ Crea la tabla prospectos_raw si no existe
 """
 
 from database import get_db_connection
+from facets import facet_cache, SOURCES as FACET_SOURCES
+from modules.followups.scheduler import CADENCE, STEPS, FINAL_STATES
 import sys
 
 SQL_SCHEMA = """
@@ -47,6 +49,9 @@ CREATE INDEX IF NOT EXISTS idx_prospectos_raw_telefono_1 ON prospectos_raw(telef
 CREATE INDEX IF NOT EXISTS idx_prospectos_raw_rut ON prospectos_raw(rut);
 CREATE INDEX IF NOT EXISTS idx_prospectos_raw_fecha_creacion ON prospectos_raw(fecha_creacion);
 CREATE INDEX IF NOT EXISTS idx_prospectos_raw_lote ON prospectos_raw(lote_importacion);
+-- Búsqueda exacta por RUT sin importar puntos y guion
+CREATE INDEX IF NOT EXISTS idx_prospectos_raw_rut_norm
+    ON prospectos_raw (upper(regexp_replace(rut, '[^0-9kK]', '', 'g')));
 
 -- Trigger para actualizar updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -64,6 +69,426 @@ CREATE TRIGGER update_prospectos_raw_updated_at
     EXECUTE FUNCTION update_updated_at_column();
 """
 
+# Detección de duplicados al importar (modules/prospectos/dedupe.py)
+PROSPECTOS_DEDUPE_SQL = """
+-- Misma regla que utils.normalize.normalize_phone
+CREATE OR REPLACE FUNCTION public.normalize_phone_cl(phone text) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN d ~ '^9[0-9]{8}$' THEN '56' || d
+        WHEN d ~ '^[0-9]{8}$' THEN '569' || d
+    END
+    FROM (
+        SELECT CASE WHEN left(digits, 2) = '56' THEN substr(digits, 3) ELSE digits END AS d
+        FROM (SELECT regexp_replace(coalesce(phone, ''), '[^0-9]', '', 'g') AS digits) s
+    ) t
+$$;
+
+ALTER TABLE prospectos_raw ADD COLUMN IF NOT EXISTS duplicado_de BIGINT;
+ALTER TABLE prospectos_raw ADD COLUMN IF NOT EXISTS duplicado_lead BIGINT;
+
+-- Prospectos ya pasados a leads (lo escribe /prospectos/api/activar)
+ALTER TABLE prospectos_raw ADD COLUMN IF NOT EXISTS estado VARCHAR(50);
+"""
+
+# Índices de claves de duplicados: CONCURRENTLY para no bloquear las
+# escrituras mientras se construyen (cada uno fuera de una transacción)
+PROSPECTOS_DEDUPE_INDEXES = [
+    ('idx_prospectos_raw_phone_key', """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prospectos_raw_phone_key
+            ON prospectos_raw (public.normalize_phone_cl(telefono_1))
+    """),
+    ('idx_prospectos_raw_email_key', """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_prospectos_raw_email_key
+            ON prospectos_raw (lower(btrim(email_1)))
+    """)
+]
+
+LEADS_DEDUPE_INDEXES = [
+    ('idx_leads_phone_key', """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_phone_key
+            ON leads (public.normalize_phone_cl(telefono))
+    """),
+    ('idx_leads_email_key', """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_leads_email_key
+            ON leads (lower(btrim(email)))
+    """)
+]
+
+BACKGROUND_JOBS_SQL = """
+CREATE TABLE IF NOT EXISTS background_jobs (
+    id UUID PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    reference VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    total BIGINT NOT NULL DEFAULT 0,
+    processed BIGINT NOT NULL DEFAULT 0,
+    errors BIGINT NOT NULL DEFAULT 0,
+    details JSONB,
+    error TEXT,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_background_jobs_type_ref
+    ON background_jobs(job_type, reference, created_at DESC);
+
+-- Lease de los trabajos activos (ver utils/background_jobs.py)
+ALTER TABLE background_jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE;
+
+-- Los que quedaron activos antes del heartbeat ya no tienen quien los termine
+UPDATE background_jobs
+SET status = 'failed', error = 'Trabajo interrumpido: el proceso que lo ejecutaba terminó',
+    finished_at = NOW(), updated_at = NOW()
+WHERE status IN ('pending', 'running') AND heartbeat_at IS NULL;
+
+-- Un solo trabajo activo por tipo y referencia (INSERT ... ON CONFLICT DO NOTHING)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_background_jobs_active
+    ON background_jobs(job_type, reference) WHERE status IN ('pending', 'running');
+"""
+
+# Tablas de soporte de la aplicación: se crean aquí y no en el primer request
+# Archivos subidos pendientes de importar (modules/prospectos/upload_registry.py)
+UPLOAD_REGISTRY_SQL = """
+CREATE TABLE IF NOT EXISTS upload_registry (
+    upload_id UUID PRIMARY KEY,
+    filepath TEXT NOT NULL,
+    filename VARCHAR(500) NOT NULL,
+    details JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_upload_registry_created_at ON upload_registry(created_at);
+"""
+
+# Sesiones con SESSION_BACKEND=postgres (sessions.py)
+FLASK_SESSIONS_SQL = """
+CREATE TABLE IF NOT EXISTS flask_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data JSONB NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_flask_sessions_expires_at ON flask_sessions(expires_at);
+"""
+
+# Caché de facetas de los filtros tipo Excel (facets.py)
+FACETS_SQL = """
+CREATE TABLE IF NOT EXISTS facet_values (
+    source VARCHAR(32) NOT NULL,
+    column_name VARCHAR(64) NOT NULL,
+    value TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (source, column_name, value)
+);
+
+-- Primera fecha de las filas con ese valor (p. ej. fecha de un lote)
+ALTER TABLE facet_values ADD COLUMN IF NOT EXISTS first_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_facet_values_prefix
+    ON facet_values (source, column_name, lower(value) text_pattern_ops);
+
+CREATE TABLE IF NOT EXISTS facet_state (
+    source VARCHAR(32) NOT NULL,
+    column_name VARCHAR(64) NOT NULL,
+    null_count INTEGER NOT NULL DEFAULT 0,
+    built_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (source, column_name)
+);
+
+CREATE TABLE IF NOT EXISTS facet_totals (
+    source VARCHAR(32) PRIMARY KEY,
+    total BIGINT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    built_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+"""
+
+# Perfilador de queries lentas con QUERY_PROFILER=1 (query_profiler.py)
+QUERY_PROFILES_SQL = """
+CREATE TABLE IF NOT EXISTS query_profiles (
+    fingerprint CHAR(32) PRIMARY KEY,
+    database VARCHAR(20) NOT NULL,
+    query TEXT NOT NULL,
+    sample_sql TEXT,
+    route TEXT,
+    samples INTEGER NOT NULL DEFAULT 0,
+    total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+    max_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+    last_ms DOUBLE PRECISION,
+    plan TEXT,
+    plan_analyzed BOOLEAN,
+    plan_planning_ms DOUBLE PRECISION,
+    plan_execution_ms DOUBLE PRECISION,
+    plan_error TEXT,
+    explained_at TIMESTAMP WITH TIME ZONE,
+    first_seen_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_seen_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_query_profiles_total_ms ON query_profiles(total_ms DESC);
+"""
+
+SUPPORT_SCHEMAS = [
+    ('background_jobs', BACKGROUND_JOBS_SQL),
+    ('upload_registry', UPLOAD_REGISTRY_SQL),
+    ('flask_sessions', FLASK_SESSIONS_SQL),
+    ('facet_values', FACETS_SQL),
+    ('query_profiles', QUERY_PROFILES_SQL)
+]
+
+# La tabla leads la crea n8n: estos índices se aplican solo si ya existe
+LEADS_INDEX_SQL = """
+-- Orden por días transcurridos (se calculan desde la fecha de primer contacto)
+CREATE INDEX IF NOT EXISTS idx_leads_fecha_primer_contacto ON leads (fecha_primer_contacto);
+"""
+
+# Contador de mensajes por lead: lo leen la lista, el orden y la exportación de
+# /prospectos_activos. Lo mantienen triggers, así cuentan también los mensajes
+# que n8n inserta directo en n8n_chat_histories (no solo /mensajes/api/ingest)
+LEADS_MENSAJES_SQL = """
+CREATE OR REPLACE FUNCTION leads_count_mensajes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    -- El orden fijo evita deadlocks entre inserts que tocan los mismos leads
+    PERFORM 1 FROM leads
+    WHERE session_id IN (SELECT session_id FROM nuevos_mensajes)
+    ORDER BY id
+    FOR UPDATE;
+
+    UPDATE leads l
+    SET mensaje_count = l.mensaje_count + c.n,
+        ultimo_mensaje_at = GREATEST(l.ultimo_mensaje_at, c.ultimo)
+    FROM (
+        SELECT session_id, COUNT(*) AS n, MAX(timestamp) AS ultimo
+        FROM nuevos_mensajes
+        GROUP BY session_id
+    ) c
+    WHERE l.session_id = c.session_id;
+    RETURN NULL;
+END
+$$;
+
+-- El primer mensaje suele llegar antes de que n8n cree el lead
+CREATE OR REPLACE FUNCTION leads_init_mensajes() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    SELECT COUNT(*), MAX(timestamp) INTO NEW.mensaje_count, NEW.ultimo_mensaje_at
+    FROM n8n_chat_histories
+    WHERE session_id = NEW.session_id;
+    RETURN NEW;
+END
+$$;
+
+DO $$
+BEGIN
+    IF to_regclass('n8n_chat_histories') IS NULL THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE leads
+        ADD COLUMN IF NOT EXISTS mensaje_count INTEGER NOT NULL DEFAULT 0,
+        ADD COLUMN IF NOT EXISTS ultimo_mensaje_at TIMESTAMP WITH TIME ZONE;
+
+    -- Solo si falta: el conteo completo se hace una vez, con los inserts
+    -- bloqueados hasta el commit para que no se pierda ni se duplique ninguno
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'n8n_chat_histories_mensaje_count'
+          AND tgrelid = 'n8n_chat_histories'::regclass
+    ) THEN
+        LOCK TABLE n8n_chat_histories IN SHARE ROW EXCLUSIVE MODE;
+
+        UPDATE leads l
+        SET mensaje_count = c.mensaje_count, ultimo_mensaje_at = c.ultimo_mensaje_at
+        FROM (
+            SELECT l2.id, coalesce(m.mensaje_count, 0) AS mensaje_count, m.ultimo AS ultimo_mensaje_at
+            FROM leads l2
+            LEFT JOIN (
+                SELECT session_id, COUNT(*) AS mensaje_count, MAX(timestamp) AS ultimo
+                FROM n8n_chat_histories
+                GROUP BY session_id
+            ) m ON m.session_id = l2.session_id
+        ) c
+        WHERE l.id = c.id
+          AND (l.mensaje_count, l.ultimo_mensaje_at) IS DISTINCT FROM (c.mensaje_count, c.ultimo_mensaje_at);
+
+        CREATE TRIGGER n8n_chat_histories_mensaje_count
+            AFTER INSERT ON n8n_chat_histories
+            REFERENCING NEW TABLE AS nuevos_mensajes
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION leads_count_mensajes();
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'leads_init_mensajes' AND tgrelid = 'leads'::regclass
+    ) THEN
+        CREATE TRIGGER leads_init_mensajes
+            BEFORE INSERT ON leads
+            FOR EACH ROW
+            EXECUTE FUNCTION leads_init_mensajes();
+    END IF;
+END
+$$;
+"""
+
+def _next_due_case():
+    # El próximo paso es el primero posterior al último enviado: los pasos que
+    # vencieron sin enviarse no se reprograman
+    whens = []
+    previous = None
+    for step, days in reversed(CADENCE):
+        if previous is None:
+            whens.append(f"WHEN coalesce(sent_{step}, false) THEN NULL")
+        else:
+            whens.append(f"WHEN coalesce(sent_{step}, false) THEN base + interval '{STEPS[previous]} days'")
+        previous = step
+    whens.append(f"ELSE base + interval '{CADENCE[0][1]} days'")
+    return "CASE WHEN base IS NULL THEN NULL " + ' '.join(whens) + " END"
+
+
+# Cola de follow-ups (modules/followups/scheduler.py). followup_next_due es
+# STABLE: sumar días a un timestamptz depende de la zona horaria de la sesión
+LEADS_FOLLOWUPS_SQL = f"""
+CREATE OR REPLACE FUNCTION followup_next_due(
+    base timestamptz, {', '.join(f'sent_{step} boolean' for step, _ in CADENCE)}
+) RETURNS timestamptz
+LANGUAGE sql STABLE AS $$
+    SELECT {_next_due_case()}
+$$;
+
+CREATE OR REPLACE FUNCTION leads_set_next_followup() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF NEW.derivado_a_humano IS TRUE OR NEW.estado IN ({', '.join(f"'{state}'" for state in FINAL_STATES)}) THEN
+        NEW.next_followup_at := NULL;
+    ELSE
+        NEW.next_followup_at := followup_next_due(
+            coalesce(NEW.fecha_primer_contacto::timestamptz, NEW.created_at::timestamptz),
+            {', '.join(f'NEW.followup_{step}_enviado' for step, _ in CADENCE)}
+        );
+    END IF;
+    RETURN NEW;
+END
+$$;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'leads' AND column_name = 'next_followup_at'
+    ) THEN
+        ALTER TABLE leads
+            ADD COLUMN next_followup_at TIMESTAMP WITH TIME ZONE,
+            ADD COLUMN followup_claimed_until TIMESTAMP WITH TIME ZONE,
+            ADD COLUMN followup_claimed_by VARCHAR(100);
+
+        -- Backfill una sola vez, al crear la columna
+        UPDATE leads SET next_followup_at = CASE
+            WHEN derivado_a_humano IS TRUE OR estado IN ({', '.join(f"'{state}'" for state in FINAL_STATES)}) THEN NULL
+            ELSE followup_next_due(
+                coalesce(fecha_primer_contacto::timestamptz, created_at::timestamptz),
+                {', '.join(f'followup_{step}_enviado' for step, _ in CADENCE)}
+            )
+        END;
+    END IF;
+END
+$$;
+
+-- Solo si falta: recrearlo en cada ejecución bloquearía leads
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'leads_next_followup' AND tgrelid = 'leads'::regclass
+    ) THEN
+        CREATE TRIGGER leads_next_followup
+            BEFORE INSERT OR UPDATE OF fecha_primer_contacto, estado, derivado_a_humano,
+                {', '.join(f'followup_{step}_enviado' for step, _ in CADENCE)}
+            ON leads
+            FOR EACH ROW
+            EXECUTE FUNCTION leads_set_next_followup();
+    END IF;
+END
+$$;
+
+-- Solo los leads con seguimiento pendiente
+CREATE INDEX IF NOT EXISTS idx_leads_next_followup
+    ON leads (next_followup_at) WHERE next_followup_at IS NOT NULL;
+"""
+
+
+LEADS_SEARCH_SQL = """
+-- Búsqueda de leads: trigramas sobre nombre, apellido, email y carrera sin acentos
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+-- unaccent() es STABLE y no sirve en un índice; el envoltorio IMMUTABLE fija
+-- el diccionario (con el esquema donde esté instalada la extensión)
+DO $$
+DECLARE
+    ext_schema text;
+BEGIN
+    SELECT n.nspname INTO ext_schema
+    FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+    WHERE e.extname = 'unaccent';
+
+    EXECUTE format($f$
+        CREATE OR REPLACE FUNCTION public.f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $body$ SELECT %1$I.unaccent('%1$I.unaccent'::regdictionary, $1) $body$
+    $f$, ext_schema);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION public.leads_search_text(nombre text, apellido text, email text, carrera text)
+RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT lower(public.f_unaccent(
+        coalesce(nombre, '') || ' ' || coalesce(apellido, '') || ' ' ||
+        coalesce(email, '') || ' ' || coalesce(carrera, '')
+    ))
+$$;
+
+-- Contiene (LIKE '%x%') y ranking con word_similarity
+CREATE INDEX IF NOT EXISTS idx_leads_search_trgm ON leads
+    USING gin (public.leads_search_text(nombre, apellido, email, carrera_interes) gin_trgm_ops);
+-- Autocompletar con 1-2 letras (LIKE 'x%')
+CREATE INDEX IF NOT EXISTS idx_leads_search_prefix ON leads
+    (public.leads_search_text(nombre, apellido, email, carrera_interes) text_pattern_ops);
+-- Búsqueda exacta por teléfono
+CREATE INDEX IF NOT EXISTS idx_leads_telefono ON leads (telefono);
+"""
+
+def create_indexes_concurrently(conn, indexes):
+    """
+    Crear índices con CREATE INDEX CONCURRENTLY (requiere autocommit)
+
+    Un CONCURRENTLY interrumpido deja el índice INVALID y IF NOT EXISTS lo
+    saltaría: se elimina y se vuelve a crear.
+    """
+    conn.commit()
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        for name, sql in indexes:
+            cursor.execute("""
+                SELECT NOT i.indisvalid AS invalid
+                FROM pg_index i
+                WHERE i.indexrelid = to_regclass(%s)
+            """, (name,))
+            row = cursor.fetchone()
+            if row and row['invalid']:
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            cursor.execute(sql)
+    finally:
+        cursor.close()
+        conn.autocommit = False
+
 def init_database():
     """Inicializa la base de datos creando las tablas necesarias"""
     print("=" * 60)
@@ -93,6 +518,11 @@ def init_database():
         
         print("✓ Tabla creada exitosamente")
         
+        cursor.execute(PROSPECTOS_DEDUPE_SQL)
+        conn.commit()
+        create_indexes_concurrently(conn, PROSPECTOS_DEDUPE_INDEXES)
+        print("✓ Índices de detección de duplicados creados")
+        
         # Verificar que la tabla existe
         print("\n3. Verificando tabla...")
         cursor.execute("""
@@ -114,6 +544,49 @@ def init_database():
             print("❌ Error: La tabla no se creó correctamente")
             return False
         
+        print("\n4. Creando tablas de soporte...")
+        for name, sql in SUPPORT_SCHEMAS:
+            cursor.execute(sql)
+            conn.commit()
+            print(f"✓ {name}")
+        
+        print("\n5. Creando índices de leads...")
+        cursor.execute("SELECT to_regclass('leads') IS NOT NULL AS exists")
+        if cursor.fetchone()['exists']:
+            cursor.execute(LEADS_INDEX_SQL)
+            conn.commit()
+            print("✓ Índice de fecha de primer contacto creado")
+            create_indexes_concurrently(conn, LEADS_DEDUPE_INDEXES)
+            print("✓ Índices de duplicados de leads creados")
+            cursor.execute(LEADS_MENSAJES_SQL)
+            conn.commit()
+            print("✓ Contador de mensajes por lead creado (reinicia la aplicación para usarlo)")
+            cursor.execute(LEADS_FOLLOWUPS_SQL)
+            conn.commit()
+            print("✓ Cola de follow-ups creada")
+            try:
+                cursor.execute(LEADS_SEARCH_SQL)
+                conn.commit()
+                print("✓ Índices de búsqueda creados (reinicia la aplicación para usarlos)")
+            except Exception as e:
+                # Sin permisos para extensiones la búsqueda sigue funcionando con ILIKE
+                conn.rollback()
+                print(f"⚠️ No se pudieron crear los índices de búsqueda: {e}")
+        else:
+            print("⚠️ La tabla leads aún no existe; vuelve a ejecutar este script cuando n8n la cree")
+        
+        print("\n6. Construyendo caché de facetas...")
+        cursor.execute("SELECT to_regclass('leads') IS NOT NULL AS exists")
+        if cursor.fetchone()['exists']:
+            conn.commit()
+            for source in FACET_SOURCES:
+                if facet_cache.rebuild(source):
+                    print(f"✓ Facetas de {source} construidas")
+                else:
+                    print(f"⚠️ No se pudieron construir las facetas de {source} (se construirán al arrancar la aplicación)")
+        else:
+            print("⚠️ Sin la tabla leads las facetas se construirán al arrancar la aplicación")
+        
         cursor.close()
         conn.close()
         
@@ -0,0 +1,86 @@
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    """Tipos que ni orjson ni json serializan por sí solos"""
+    if isinstance(obj, Decimal):
+        # str para no perder precisión (mismo criterio que Flask)
+        return str(obj)
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Proveedor JSON basado en orjson
+
+    Serializa datetime/date/time (ISO 8601, igual que .isoformat()), UUID,
+    dataclasses y filas RealDictRow sin pasar por el encoder de la stdlib, y
+    arma la respuesta directamente desde bytes.
+    """
+
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=self.option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.option
+        if self._app.debug:
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=option),
+            mimetype='application/json'
+        )
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """
+    Proveedor de la stdlib con el mismo formato que OrjsonProvider
+
+    Se usa cuando orjson no está instalado: fechas en ISO 8601 (Flask usa
+    por defecto el formato HTTP) para que las respuestas no cambien según
+    el proveedor.
+    """
+
+    sort_keys = False
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, (datetime, date, time)):
+            return obj.isoformat()
+        return DefaultJSONProvider.default(obj)
+
+
+def configure_json(app):
+    """
+    Registrar el proveedor JSON según JSON_PROVIDER
+
+    - orjson (por defecto): si el paquete está instalado; si no, stdlib.
+    - stdlib: json de la biblioteca estándar.
+    """
+    provider = os.getenv('JSON_PROVIDER', 'orjson')
+
+    if provider == 'orjson' and orjson is not None:
+        app.json = OrjsonProvider(app)
+    elif provider in ('orjson', 'stdlib'):
+        provider = 'stdlib'
+        app.json = StdlibJSONProvider(app)
+    else:
+        raise ValueError(f"JSON_PROVIDER no soportado: {provider}")
+
+    return provider
@@ -0,0 +1,344 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from psycopg2.extras import RealDictCursor
+
+# Umbral (ms) a partir del cual un request se registra en el log de lentos
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', '1000'))
+
+# Queries por request que se conservan para el log de lentos
+MAX_LOGGED_QUERIES = 20
+MAX_SQL_LENGTH = 2000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+slow_request_logger = logging.getLogger('dashboard.slow_requests')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Contador monotónico con labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self, extra_labels=()):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key)) + tuple(extra_labels)
+            yield f'{self.name}_total{_format_labels(labels)} {_format_number(value)}'
+
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][index] += 1
+                    break
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def collect(self, extra_labels=()):
+        with self._lock:
+            values = {key: dict(entry, buckets=list(entry['buckets'])) for key, entry in self._values.items()}
+        for key, entry in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key)) + tuple(extra_labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry['buckets']):
+                cumulative += count
+                bucket_labels = labels + (('le', _format_number(float(bound))),)
+                yield f'{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(labels)} {_format_number(round(entry["sum"], 6))}'
+            yield f'{self.name}_count{_format_labels(labels)} {entry["count"]}'
+
+
+class MetricsRegistry:
+    """Métricas del proceso, exportadas en formato de texto de Prometheus"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+    def render(self):
+        # Cada worker de gunicorn tiene sus propios contadores; el label worker
+        # evita que Prometheus mezcle series de procesos distintos
+        extra_labels = (('worker', os.getpid()),)
+        lines = []
+        for metric in self._metrics:
+            name = f'{metric.name}_total' if metric.type == 'counter' else metric.name
+            lines.append(f'# HELP {name} {metric.help}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.collect(extra_labels))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    'http_requests', 'Requests HTTP atendidos', ('method', 'route', 'status'))
+http_request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Latencia de requests HTTP', ('method', 'route'))
+http_response_size = registry.histogram(
+    'http_response_size_bytes', 'Tamaño del cuerpo de las respuestas', ('method', 'route'), SIZE_BUCKETS)
+request_db_queries = registry.histogram(
+    'http_request_db_queries', 'Queries SQL ejecutadas por request', ('route',), COUNT_BUCKETS)
+request_db_time = registry.histogram(
+    'http_request_db_seconds', 'Tiempo en la base de datos por request', ('route',))
+db_query_duration = registry.histogram(
+    'db_query_duration_seconds', 'Duración de cada query SQL', ('context',))
+db_query_errors = registry.counter(
+    'db_query_errors', 'Queries SQL que fallaron', ('context',))
+external_call_duration = registry.histogram(
+    'external_call_duration_seconds', 'Duración de llamadas a servicios externos (con reintentos)',
+    ('service', 'outcome'))
+slow_requests = registry.counter(
+    'http_slow_requests', 'Requests que superaron SLOW_REQUEST_MS', ('route',))
+
+
+# Estado del request en curso (por hilo, para no depender del contexto de Flask
+# en los cursores)
+_local = threading.local()
+
+
+class RequestStats:
+    """Acumulador de queries y llamadas externas de un request"""
+
+    __slots__ = ('route', 'db_queries', 'db_seconds', 'external_calls', 'external_seconds', 'queries')
+
+    def __init__(self, route=None):
+        self.route = route
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.external_calls = 0
+        self.external_seconds = 0.0
+        self.queries = []
+
+
+def current_stats():
+    """Estadísticas del request que atiende este hilo, o None"""
+    return getattr(_local, 'stats', None)
+
+
+def record_query(sql, seconds, failed=False):
+    """Registrar una query ejecutada por un cursor instrumentado"""
+    stats = current_stats()
+    context = 'request' if stats is not None else 'background'
+    db_query_duration.observe(seconds, context=context)
+    if failed:
+        db_query_errors.inc(context=context)
+
+    if stats is None:
+        return
+    stats.db_queries += 1
+    stats.db_seconds += seconds
+    if len(stats.queries) < MAX_LOGGED_QUERIES:
+        stats.queries.append({'sql': sql, 'ms': round(seconds * 1000, 2), 'failed': failed})
+    else:
+        # Conservar las más lentas
+        fastest = min(range(len(stats.queries)), key=lambda i: stats.queries[i]['ms'])
+        if stats.queries[fastest]['ms'] < seconds * 1000:
+            stats.queries[fastest] = {'sql': sql, 'ms': round(seconds * 1000, 2), 'failed': failed}
+
+
+# Función opcional que recibe (cursor, query, vars, seconds) tras cada query
+# exitosa; la usa query_profiler para muestrear queries lentas
+_query_sampler = None
+
+
+def set_query_sampler(sampler):
+    """Registrar (o quitar, con None) el muestreador de queries"""
+    global _query_sampler
+    _query_sampler = sampler
+
+
+def record_external_call(service, seconds, outcome):
+    """Registrar una llamada a OpenAI/Qdrant (ver RateGovernor.call)"""
+    external_call_duration.observe(seconds, service=service, outcome=outcome)
+    stats = current_stats()
+    if stats is not None:
+        stats.external_calls += 1
+        stats.external_seconds += seconds
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor que mide cada execute() y lo suma al request en curso"""
+
+    def _sql_text(self, query):
+        if hasattr(query, 'as_string'):
+            query = query.as_string(self)
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        return ' '.join(query.split())[:MAX_SQL_LENGTH]
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, vars)
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            record_query(self._sql_text(query), seconds, failed)
+            if _query_sampler is not None and not failed:
+                _query_sampler(self, query, vars, seconds)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().executemany(query, vars_list)
+            failed = False
+            return result
+        finally:
+            record_query(self._sql_text(query), time.perf_counter() - started, failed)
+
+
+def _route_label(request):
+    if request.url_rule is not None:
+        return request.url_rule.rule
+    return 'unmatched'
+
+
+def init_app(app):
+    """Registrar la medición de requests y el endpoint /metrics"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_metrics():
+        _local.stats = RequestStats(_route_label(request))
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request_metrics(response):
+        started = g.pop('_metrics_started', None)
+        stats = current_stats()
+        _local.stats = None
+        if started is None or request.endpoint == 'metrics':
+            return response
+
+        duration = time.perf_counter() - started
+        route = _route_label(request)
+        method = request.method
+
+        http_requests.inc(method=method, route=route, status=response.status_code)
+        http_request_duration.observe(duration, method=method, route=route)
+        if not response.is_streamed and response.content_length is not None:
+            http_response_size.observe(response.content_length, method=method, route=route)
+        if stats is not None:
+            request_db_queries.observe(stats.db_queries, route=route)
+            request_db_time.observe(stats.db_seconds, route=route)
+
+        if duration * 1000 >= SLOW_REQUEST_MS:
+            slow_requests.inc(route=route)
+            _log_slow_request(request, response, route, duration, stats)
+
+        return response
+
+    @app.teardown_request
+    def _clear_request_metrics(exc):
+        _local.stats = None
+
+    @app.route('/metrics')
+    def metrics():
+        """Métricas del worker en formato Prometheus"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _log_slow_request(request, response, route, duration, stats):
+    entry = {
+        'event': 'slow_request',
+        'method': request.method,
+        'route': route,
+        'path': request.full_path.rstrip('?'),
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 1),
+        'response_bytes': response.content_length,
+        'worker': os.getpid()
+    }
+    if stats is not None:
+        entry.update({
+            'db_queries': stats.db_queries,
+            'db_ms': round(stats.db_seconds * 1000, 1),
+            'external_calls': stats.external_calls,
+            'external_ms': round(stats.external_seconds * 1000, 1),
+            'queries': sorted(stats.queries, key=lambda q: q['ms'], reverse=True)
+        })
+    slow_request_logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+def reset_metrics():
+    """Descartar lo acumulado en el master antes del fork"""
+    registry.reset()
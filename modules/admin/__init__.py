@@ -0,0 +1,49 @@
+from flask import Blueprint, render_template, jsonify, request
+from query_profiler import query_profiler
+
+admin_bp = Blueprint('admin', __name__)
+
+@admin_bp.route('/queries')
+def query_profiles():
+    """Vista de queries lentas perfiladas"""
+    return render_template('modules/query_profiles.html', current_module='admin_queries')
+
+@admin_bp.route('/api/query-profiles')
+def list_query_profiles():
+    """Listar queries perfiladas ordenadas por costo"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 500)
+        order = request.args.get('order', 'total_ms')
+        profiles = query_profiler.list_profiles(limit=limit, order=order)
+        
+        return jsonify({
+            'success': True,
+            'profiles': profiles,
+            'profiler': query_profiler.status()
+        })
+    except Exception as e:
+        print(f"Error in list_query_profiles: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@admin_bp.route('/api/query-profiles/<fingerprint>')
+def get_query_profile(fingerprint):
+    """Detalle de una query perfilada con su plan"""
+    try:
+        profile = query_profiler.get_profile(fingerprint)
+        if not profile:
+            return jsonify({'success': False, 'error': 'Profile not found'}), 404
+        
+        return jsonify({'success': True, 'profile': profile})
+    except Exception as e:
+        print(f"Error in get_query_profile: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@admin_bp.route('/api/query-profiles', methods=['DELETE'])
+def clear_query_profiles():
+    """Borrar los perfiles acumulados"""
+    try:
+        deleted = query_profiler.clear()
+        return jsonify({'success': True, 'deleted': deleted})
+    except Exception as e:
+        print(f"Error in clear_query_profiles: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
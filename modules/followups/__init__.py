@@ -0,0 +1,120 @@
+from flask import Blueprint, jsonify, request
+from datetime import datetime, timezone
+from .scheduler import followup_scheduler, STEPS
+
+followups_bp = Blueprint('followups', __name__)
+
+
+def _parse_now(value):
+    """Hora simulada (ISO 8601) para dry-run; sin zona horaria se asume UTC"""
+    if not value:
+        return None
+    now = datetime.fromisoformat(value)
+    return now if now.tzinfo else now.replace(tzinfo=timezone.utc)
+
+
+@followups_bp.route('/api/due')
+def list_due():
+    """Leads con follow-up vencido (solo lectura, no los reserva)"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        now = _parse_now(request.args.get('now'))
+        leads = followup_scheduler.due(limit=limit, now=now)
+
+        return jsonify({
+            'success': True,
+            'leads': leads,
+            'count': len(leads)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in list_due: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@followups_bp.route('/api/claim', methods=['POST'])
+def claim():
+    """
+    Reservar un lote de leads vencidos para un worker
+
+    Body: {"worker": "n8n-1", "limit": 50, "dry_run": false, "now": "..."}
+    now solo se acepta con dry_run (para ver la cola en otra hora).
+    """
+    try:
+        data = request.get_json() or {}
+        worker = (data.get('worker') or '').strip()
+        if not worker:
+            return jsonify({'success': False, 'error': 'worker required'}), 400
+
+        limit = min(int(data.get('limit', 50)), 500)
+        dry_run = bool(data.get('dry_run'))
+        now = _parse_now(data.get('now'))
+        if now and not dry_run:
+            return jsonify({'success': False, 'error': 'now solo se permite con dry_run'}), 400
+
+        leads = followup_scheduler.claim(worker, limit=limit, dry_run=dry_run, now=now)
+
+        return jsonify({
+            'success': True,
+            'dry_run': dry_run,
+            'leads': leads,
+            'count': len(leads)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in claim: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@followups_bp.route('/api/sent', methods=['POST'])
+def mark_sent():
+    """
+    Registrar follow-ups enviados en bloque
+
+    Body: {"worker": "n8n-1", "items": [{"id": "123", "step": "dia3"}, ...]}
+    """
+    try:
+        data = request.get_json() or {}
+        items = data.get('items', [])
+        if not items:
+            return jsonify({'success': False, 'error': 'items required'}), 400
+
+        updated = followup_scheduler.mark_sent(items, worker=data.get('worker'))
+
+        return jsonify({
+            'success': True,
+            'updated': updated,
+            'skipped': len(items) - updated
+        })
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({
+            'success': False,
+            'error': f"items inválidos: {e} (pasos: {', '.join(STEPS)})"
+        }), 400
+    except Exception as e:
+        print(f"Error in mark_sent: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@followups_bp.route('/api/release', methods=['POST'])
+def release():
+    """Devolver a la cola leads reservados que no se llegaron a enviar"""
+    try:
+        data = request.get_json() or {}
+        ids = data.get('ids', [])
+        if not ids:
+            return jsonify({'success': False, 'error': 'ids required'}), 400
+
+        released = followup_scheduler.release(ids, worker=data.get('worker'))
+        return jsonify({'success': True, 'released': released})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error in release: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,260 @@
+"""
+Cola de follow-ups de leads (cadencia día 3, 5, 6 y 8)
+
+Cada lead guarda en leads.next_followup_at cuándo vence su próximo
+follow-up; un trigger lo recalcula cuando cambian la fecha de primer
+contacto, el estado o los flags followup_*_enviado (también si los cambia
+n8n); la columna, el trigger y el backfill los crea init_db.py. Los
+workers toman leads vencidos en lotes con FOR UPDATE SKIP LOCKED y un
+lease (followup_claimed_until), así varios pueden correr en paralelo sin
+enviar dos veces el mismo follow-up.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+from database import get_db_connection
+
+# (paso, días desde el primer contacto)
+CADENCE = [('dia3', 3), ('dia5', 5), ('dia6', 6), ('dia8', 8)]
+STEPS = dict(CADENCE)
+
+# Estados en los que ya no se hace seguimiento
+FINAL_STATES = ('perdido', 'listo_matricula')
+
+# Segundos que un lead reservado queda fuera de la cola si el worker no confirma
+CLAIM_LEASE = int(os.getenv('FOLLOWUP_CLAIM_LEASE', '600'))
+
+
+# Se cachea solo cuando existe: tras correr init_db.py la cola queda
+# disponible sin reiniciar
+_queue_ready = False
+
+LEAD_COLUMNS = """
+    l.id, l.session_id, l.nombre, l.apellido, l.telefono, l.estado,
+    l.carrera_interes, l.plan, l.fecha_primer_contacto, l.created_at,
+    l.next_followup_at, l.followup_claimed_by, l.followup_claimed_until,
+    {sent}
+""".format(sent=', '.join(f'l.followup_{step}_enviado' for step, _ in CADENCE))
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def _as_aware(value):
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def step_for(lead, now):
+    """
+    Paso a enviar ahora: el último vencido posterior al último enviado
+
+    Si un lead se atrasó (p. ej. está en el día 7 sin follow-ups) se envía
+    solo el más reciente (dia6), no todos los pendientes.
+
+    Returns:
+        'dia3' | 'dia5' | 'dia6' | 'dia8' o None si no hay nada vencido
+    """
+    base = _as_aware(lead.get('fecha_primer_contacto') or lead.get('created_at'))
+    if base is None:
+        return None
+    if not isinstance(base, datetime):
+        # fecha sin hora
+        base = datetime(base.year, base.month, base.day, tzinfo=timezone.utc)
+
+    last_sent = max((days for step, days in CADENCE if lead.get(f'followup_{step}_enviado')), default=0)
+    due = [step for step, days in CADENCE if days > last_sent and base + timedelta(days=days) <= now]
+    return due[-1] if due else None
+
+
+class FollowupScheduler:
+    """
+    Cola de follow-ups vencidos
+
+    clock permite fijar la hora en pruebas o en modo dry-run (por defecto
+    la hora UTC actual).
+    """
+
+    def __init__(self, connection_factory=None, clock=None):
+        self.connection_factory = connection_factory or get_db_connection
+        self.clock = clock or utc_now
+
+    def _connect(self):
+        global _queue_ready
+        conn = self.connection_factory()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        if not _queue_ready:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT EXISTS (
+                        SELECT 1 FROM information_schema.columns
+                        WHERE table_name = 'leads' AND column_name = 'next_followup_at'
+                    ) AS ready
+                """)
+                _queue_ready = cursor.fetchone()['ready']
+                cursor.close()
+                conn.rollback()
+            except Exception:
+                conn.close()
+                raise
+            if not _queue_ready:
+                conn.close()
+                raise RuntimeError('La cola de follow-ups no existe: ejecuta init_db.py')
+        return conn
+
+    def _format(self, lead, now):
+        return {
+            'id': str(lead['id']),
+            'session_id': lead['session_id'],
+            'nombre': lead['nombre'] or '',
+            'apellido': lead['apellido'] or '',
+            'telefono': lead['telefono'] or '',
+            'estado': lead['estado'] or '',
+            'carrera': lead['carrera_interes'] or '',
+            'plan': lead['plan'] or '',
+            'step': step_for(lead, now),
+            'due_at': lead['next_followup_at'],
+            'claimed_by': lead['followup_claimed_by'],
+            'claimed_until': lead['followup_claimed_until']
+        }
+
+    def due(self, limit=100, now=None):
+        """Leads con follow-up vencido, sin reservarlos (incluye los reservados)"""
+        now = now or self.clock()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {LEAD_COLUMNS}
+                FROM leads l
+                WHERE l.next_followup_at <= %s
+                ORDER BY l.next_followup_at
+                LIMIT %s
+            """, (now, limit))
+            leads = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return [self._format(lead, now) for lead in leads]
+
+    def claim(self, worker, limit=50, dry_run=False, now=None):
+        """
+        Reservar un lote de leads vencidos para un worker
+
+        Los leads bloqueados por otro worker se saltan (SKIP LOCKED) y los
+        reservados quedan fuera de la cola CLAIM_LEASE segundos. Con dry_run
+        se ejecuta la misma selección y se descarta (nada queda reservado).
+
+        Returns:
+            Lista de leads con el paso a enviar
+        """
+        now = now or self.clock()
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH due AS (
+                    SELECT id FROM leads
+                    WHERE next_followup_at <= %(now)s
+                      AND (followup_claimed_until IS NULL OR followup_claimed_until < %(now)s)
+                    ORDER BY next_followup_at
+                    LIMIT %(limit)s
+                    FOR UPDATE SKIP LOCKED
+                )
+                UPDATE leads l
+                SET followup_claimed_by = %(worker)s,
+                    followup_claimed_until = %(now)s + make_interval(secs => %(lease)s)
+                FROM due
+                WHERE l.id = due.id
+                RETURNING {LEAD_COLUMNS}
+            """, {'now': now, 'limit': limit, 'worker': worker, 'lease': CLAIM_LEASE})
+            leads = cursor.fetchall()
+            if dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        leads.sort(key=lambda lead: lead['next_followup_at'])
+        return [self._format(lead, now) for lead in leads]
+
+    def mark_sent(self, items, worker=None, now=None):
+        """
+        Registrar follow-ups enviados en bloque (una UPDATE por paso)
+
+        Args:
+            items: Lista [{'id', 'step'}]
+            worker: Si se indica, solo se marcan los leads que tiene reservados
+
+        Returns:
+            Cantidad de leads actualizados
+        """
+        now = now or self.clock()
+        by_step = {}
+        for item in items:
+            step = item.get('step')
+            if step not in STEPS:
+                raise ValueError(f"Paso de follow-up inválido: {step}")
+            by_step.setdefault(step, []).append(int(item['id']))
+
+        updated = 0
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            # Orden fijo de pasos e ids para no bloquearse con otro worker
+            for step in sorted(by_step, key=STEPS.get):
+                cursor.execute(f"""
+                    UPDATE leads
+                    SET followup_{step}_enviado = TRUE,
+                        followup_{step}_fecha = %s,
+                        followup_claimed_by = NULL,
+                        followup_claimed_until = NULL
+                    WHERE id = ANY(%s)
+                      AND followup_{step}_enviado IS NOT TRUE
+                      AND (%s::text IS NULL OR followup_claimed_by = %s)
+                """, (now, sorted(set(by_step[step])), worker, worker))
+                updated += cursor.rowcount
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return updated
+
+    def release(self, ids, worker=None):
+        """Devolver a la cola leads reservados que no se enviaron"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE leads
+                SET followup_claimed_by = NULL, followup_claimed_until = NULL
+                WHERE id = ANY(%s)
+                  AND (%s::text IS NULL OR followup_claimed_by = %s)
+            """, ([int(lead_id) for lead_id in ids], worker, worker))
+            released = cursor.rowcount
+            conn.commit()
+            cursor.close()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return released
+
+
+followup_scheduler = FollowupScheduler()
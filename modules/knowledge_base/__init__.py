@@ -4,9 +4,36 @@ import os
 import json
 from datetime import datetime
 import uuid
+from utils.background_jobs import jobs
+from utils.fields import parse_fields, columns_for, build_rows
+from http_cache import conditional
+from .migration_manager import CollectionMigration, JOB_TYPE as MIGRATION_JOB_TYPE
 
 knowledge_base_bp = Blueprint('knowledge_base', __name__)
 
+PREVIEW_LENGTH = 150
+
+
+def _content_preview(text):
+    return text[:PREVIEW_LENGTH] + '...' if len(text) > PREVIEW_LENGTH else text
+
+
+# Campos de /api/bases/<kb_id>/points: {campo: (columnas/expresiones SQL, formateador)}.
+# content_preview solo lee de la base los primeros caracteres del contenido.
+POINT_FIELDS = {
+    'id': (('id',), lambda p: str(p['id'])),
+    'page_content': (('page_content',), lambda p: p['page_content']),
+    'content_preview': (
+        (f'LEFT(page_content, {PREVIEW_LENGTH + 1}) AS preview_text',),
+        lambda p: _content_preview(p['preview_text'])
+    ),
+    'metadata': (('metadata',), lambda p: p['metadata'] or {}),
+    'synced': (('synced_to_qdrant',), lambda p: p['synced_to_qdrant']),
+    'qdrant_id': (('qdrant_point_id',), lambda p: str(p['qdrant_point_id']) if p['qdrant_point_id'] else None),
+    'created_at': (('created_at',), lambda p: p['created_at']),
+    'updated_at': (('updated_at',), lambda p: p['updated_at'])
+}
+
 @knowledge_base_bp.route('/')
 @knowledge_base_bp.route('/bases')
 def knowledge_bases():
@@ -24,7 +51,29 @@ def knowledge_base_detail(kb_id):
 # API ENDPOINTS - KNOWLEDGE BASES
 # ============================================
 
+def _bases_version():
+    """Hash del contenido de knowledge_bases (pocas filas; los contadores los mantienen triggers)"""
+    conn = get_kb_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT md5(COALESCE(string_agg(kb::text, '|' ORDER BY kb.id), '')) as version
+            FROM knowledge_bases kb
+        """)
+        version = cursor.fetchone()['version']
+        cursor.close()
+        return version
+    except Exception as e:
+        print(f"Error obteniendo versión de knowledge_bases: {e}")
+        conn.rollback()
+        return None
+    finally:
+        conn.close()
+
 @knowledge_base_bp.route('/api/bases/list')
+@conditional(_bases_version)
 def list_bases():
     """Listar todas las bases de conocimiento con estadísticas"""
     try:
@@ -290,6 +339,11 @@ def list_points(kb_id):
         page_size = int(request.args.get('page_size', 50))
         search = request.args.get('search', '').strip()
         
+        try:
+            fields = parse_fields(request.args.get('fields'), POINT_FIELDS)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
         conn = get_kb_db_connection()
         if not conn:
             return jsonify({'success': False, 'error': 'Database connection failed'}), 500
@@ -313,10 +367,9 @@ def list_points(kb_id):
         total_pages = (total + page_size - 1) // page_size
         offset = (page - 1) * page_size
         
+        columns = columns_for(fields, POINT_FIELDS) or ['id']
         cursor.execute(f"""
-            SELECT 
-                id, page_content, metadata, synced_to_qdrant,
-                qdrant_point_id, created_at, updated_at
+            SELECT {', '.join(columns)}
             FROM knowledge_points
             WHERE {where_clause}
             ORDER BY created_at DESC
@@ -327,22 +380,8 @@ def list_points(kb_id):
         cursor.close()
         conn.close()
         
-        # Formatear respuesta
-        points_list = []
-        for point in points:
-            # Truncar page_content para lista
-            content_preview = point['page_content'][:150] + '...' if len(point['page_content']) > 150 else point['page_content']
-            
-            points_list.append({
-                'id': str(point['id']),
-                'page_content': point['page_content'],
-                'content_preview': content_preview,
-                'metadata': point['metadata'] or {},
-                'synced': point['synced_to_qdrant'],
-                'qdrant_id': str(point['qdrant_point_id']) if point['qdrant_point_id'] else None,
-                'created_at': point['created_at'].isoformat() if point['created_at'] else None,
-                'updated_at': point['updated_at'].isoformat() if point['updated_at'] else None
-            })
+        # Formatear respuesta (las fechas las serializa el proveedor JSON)
+        points_list = build_rows(points, fields, POINT_FIELDS)
         
         return jsonify({
             'success': True,
@@ -643,8 +682,7 @@ def delete_point(point_id):
 def sync_base_to_qdrant(kb_id):
     """Sincronizar todos los puntos pendientes de una base con Qdrant"""
     try:
-        from .qdrant_manager import QdrantManager
-        from .embedding_manager import EmbeddingManager
+        from .clients import get_qdrant_manager, get_embedding_manager
         
         conn = get_kb_db_connection()
         if not conn:
@@ -691,9 +729,18 @@ def sync_base_to_qdrant(kb_id):
                 'synced': 0
             })
         
-        # Inicializar managers
-        qdrant = QdrantManager()
-        embeddings_mgr = EmbeddingManager()
+        # Durante una migración la colección activa está por cambiar
+        if jobs.find_active(MIGRATION_JOB_TYPE, str(kb_id)):
+            cursor.close()
+            conn.close()
+            return jsonify({
+                'success': False,
+                'error': 'Hay una migración de colección en curso para esta base'
+            }), 409
+        
+        # Managers compartidos del proceso con el modelo configurado en la base
+        qdrant = get_qdrant_manager()
+        embeddings_mgr = get_embedding_manager(base['embedding_model'], base['vector_dimension'])
         
         # Verificar/crear colección en Qdrant
         collection_name = base['qdrant_collection_name']
@@ -791,4 +838,91 @@ def sync_base_to_qdrant(kb_id):
         return jsonify({
             'success': False,
             'error': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+# ============================================
+# API ENDPOINTS - MIGRACIÓN DE COLECCIONES
+# ============================================
+
+@knowledge_base_bp.route('/api/bases/<kb_id>/migrate', methods=['POST'])
+def migrate_base(kb_id):
+    """Re-generar embeddings en una colección sombra y cambiar el alias al terminar"""
+    try:
+        data = request.get_json() or {}
+        
+        embedding_model = (data.get('embedding_model') or '').strip()
+        vector_dimension = data.get('vector_dimension')
+        
+        if not embedding_model or not vector_dimension:
+            return jsonify({
+                'success': False,
+                'error': 'embedding_model y vector_dimension son obligatorios'
+            }), 400
+        
+        migration = CollectionMigration(
+            kb_id,
+            embedding_model,
+            int(vector_dimension),
+            batch_size=int(data.get('batch_size', 50)),
+            drop_old_collection=bool(data.get('drop_old_collection', True))
+        )
+        result = migration.start()
+        
+        if not result['success']:
+            status = 409 if result.get('job') else 400
+            if result['error'] == 'Base de conocimiento no encontrada':
+                status = 404
+            return jsonify(result), status
+        
+        return jsonify({
+            'success': True,
+            'message': 'Migración iniciada',
+            'job_id': result['job_id']
+        }), 202
+        
+    except Exception as e:
+        print(f"Error en migrate_base: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@knowledge_base_bp.route('/api/bases/<kb_id>/migrations')
+def list_migrations(kb_id):
+    """Listar las migraciones de una base de conocimiento"""
+    try:
+        return jsonify({
+            'success': True,
+            'migrations': jobs.list(MIGRATION_JOB_TYPE, kb_id)
+        })
+        
+    except Exception as e:
+        print(f"Error en list_migrations: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@knowledge_base_bp.route('/api/migrations/<job_id>')
+def get_migration(job_id):
+    """Estado, throughput y ETA de una migración"""
+    try:
+        job = jobs.get(job_id)
+        
+        if not job or job['type'] != MIGRATION_JOB_TYPE:
+            return jsonify({'success': False, 'error': 'Migración no encontrada'}), 404
+        
+        return jsonify({
+            'success': True,
+            'migration': job
+        })
+        
+    except Exception as e:
+        print(f"Error en get_migration: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@knowledge_base_bp.route('/api/governor/metrics')
+def governor_metrics():
+    """Métricas de reintentos, throttling y circuit breaker de OpenAI/Qdrant"""
+    from .rate_governor import governor_metrics as collect_metrics
+    
+    return jsonify({
+        'success': True,
+        'governors': collect_metrics()
+    })
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Instancias compartidas por todo el proceso. QdrantClient y OpenAI usan
+# httpx.Client por debajo, que es thread-safe y mantiene su pool de
+# conexiones abierto entre requests.
+_lock = threading.Lock()
+_qdrant = None
+_openai_client = None
+_embedding_managers: Dict[tuple, Any] = {}
+
+
+def get_qdrant_manager():
+    """Obtener el QdrantManager compartido del proceso"""
+    global _qdrant
+
+    if _qdrant is not None:
+        return _qdrant
+
+    with _lock:
+        if _qdrant is None:
+            from .qdrant_manager import QdrantManager
+            _qdrant = QdrantManager()
+        return _qdrant
+
+
+def get_embedding_manager(model: Optional[str] = None, dimensions: Optional[int] = None):
+    """
+    Obtener el EmbeddingManager compartido para un modelo/dimensión
+
+    Todas las instancias reutilizan el mismo cliente HTTP de OpenAI.
+    """
+    global _openai_client
+
+    from .embedding_manager import DEFAULT_MODEL, EMBEDDING_MODELS
+
+    model = model or DEFAULT_MODEL
+    key = (model, dimensions or EMBEDDING_MODELS.get(model, {}).get('dimensions'))
+
+    manager = _embedding_managers.get(key)
+    if manager is not None:
+        return manager
+
+    with _lock:
+        if key not in _embedding_managers:
+            from .embedding_manager import EmbeddingManager
+
+            manager = EmbeddingManager(model, dimensions, client=_openai_client)
+            _openai_client = manager.client
+            _embedding_managers[key] = manager
+        return _embedding_managers[key]
+
+
+def reset_clients():
+    """
+    Descartar las instancias heredadas tras un fork
+
+    Cada worker debe crear sus propios clientes HTTP: los sockets y locks
+    copiados del proceso padre no son seguros de compartir.
+    """
+    global _qdrant, _openai_client
+
+    with _lock:
+        _qdrant = None
+        _openai_client = None
+        _embedding_managers.clear()
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Inicializar clientes, tokenizer y conexiones HTTP antes del primer uso
+
+    Returns:
+        Dict con el resultado y la duración (ms) de cada paso
+    """
+    result = {}
+
+    started = time.perf_counter()
+    try:
+        embeddings = get_embedding_manager()
+        embeddings.count_tokens('warm up')
+        # Petición sin costo de tokens para abrir la conexión TLS del pool
+        embeddings.client.models.retrieve(embeddings.model)
+        result['openai'] = {'success': True}
+    except Exception as e:
+        result['openai'] = {'success': False, 'error': str(e)}
+    result['openai']['ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    try:
+        get_qdrant_manager().client.get_collections()
+        result['qdrant'] = {'success': True}
+    except Exception as e:
+        result['qdrant'] = {'success': False, 'error': str(e)}
+    result['qdrant']['ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    return result
+
+
+def start_background_warm_up() -> Optional[threading.Thread]:
+    """Lanzar warm_up() en un hilo daemon (desactivable con KB_WARMUP=0)"""
+    if os.getenv('KB_WARMUP', '1') == '0':
+        return None
+
+    def runner():
+        result = warm_up()
+        print(f"Knowledge Base warm-up: {result}")
+
+    thread = threading.Thread(target=runner, name='kb-warm-up', daemon=True)
+    thread.start()
+    return thread
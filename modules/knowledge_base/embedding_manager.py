@@ -1,27 +1,77 @@
 import os
+import threading
 from openai import OpenAI
 from typing import List, Dict, Any
 import tiktoken
+from .rate_governor import get_governor
+
+DEFAULT_MODEL = "text-embedding-3-large"
+
+# Dimensión nativa y precio (USD por 1M tokens) de cada modelo soportado
+EMBEDDING_MODELS = {
+    'text-embedding-3-large': {'dimensions': 3072, 'cost_per_million': 0.13},
+    'text-embedding-3-small': {'dimensions': 1536, 'cost_per_million': 0.02},
+    'text-embedding-ada-002': {'dimensions': 1536, 'cost_per_million': 0.10}
+}
+
+def supports_shortening(model: str) -> bool:
+    """Los modelos text-embedding-3 permiten reducir dimensiones (Matryoshka)"""
+    return model.startswith('text-embedding-3')
+
+# Cargar un encoding de tiktoken es costoso (descarga/parseo del BPE), se
+# hace una sola vez por modelo y proceso
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+def get_encoding(model: str):
+    """Obtener (y cachear) el encoding de tiktoken para un modelo"""
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except:
+                # Fallback a cl100k_base si el modelo no está disponible
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        return _encodings[model]
 
 class EmbeddingManager:
     """Gestor de embeddings usando OpenAI"""
     
-    def __init__(self):
+    def __init__(self, model: str = None, dimensions: int = None, client: OpenAI = None):
         self.api_key = os.getenv('OPENAI_API_KEY')
         
         if not self.api_key:
             raise ValueError("OPENAI_API_KEY debe estar configurado en .env")
         
-        self.client = OpenAI(api_key=self.api_key)
-        self.model = "text-embedding-3-large"
-        self.dimensions = 3072
+        self.model = model or DEFAULT_MODEL
+        if self.model not in EMBEDDING_MODELS:
+            raise ValueError(f"Modelo de embeddings no soportado: {self.model}")
+        
+        native_dimensions = EMBEDDING_MODELS[self.model]['dimensions']
+        self.dimensions = dimensions or native_dimensions
+        if self.dimensions > native_dimensions or (
+            self.dimensions != native_dimensions and not supports_shortening(self.model)
+        ):
+            raise ValueError(f"Dimensión {self.dimensions} no soportada por {self.model}")
+        
+        # Los reintentos los gestiona el gobernador compartido, no el SDK
+        self.client = client or OpenAI(api_key=self.api_key, max_retries=0)
+        self.governor = get_governor('openai')
         
         # Encoding para contar tokens
-        try:
-            self.encoding = tiktoken.encoding_for_model(self.model)
-        except:
-            # Fallback a cl100k_base si el modelo no está disponible
-            self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.encoding = get_encoding(self.model)
+    
+    def _request_options(self) -> Dict[str, Any]:
+        """Parámetros de modelo para embeddings.create"""
+        options = {'model': self.model}
+        # ada-002 no acepta el parámetro dimensions
+        if supports_shortening(self.model):
+            options['dimensions'] = self.dimensions
+        return options
     
     def test_connection(self) -> Dict[str, Any]:
         """Probar conexión con OpenAI"""
@@ -29,8 +79,7 @@ class EmbeddingManager:
             # Generar un embedding de prueba
             response = self.client.embeddings.create(
                 input="test",
-                model=self.model,
-                dimensions=self.dimensions
+                **self._request_options()
             )
             
             return {
@@ -74,10 +123,9 @@ class EmbeddingManager:
                 }
             
             # Generar embedding
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.model,
-                dimensions=self.dimensions
+            response = self.governor.call(
+                lambda: self.client.embeddings.create(input=text, **self._request_options()),
+                tokens=token_count
             )
             
             embedding = response.data[0].embedding
@@ -135,10 +183,10 @@ class EmbeddingManager:
                 total_tokens += tokens
             
             # Generar embeddings
-            response = self.client.embeddings.create(
-                input=valid_texts,
-                model=self.model,
-                dimensions=self.dimensions
+            # El gobernador espera cupo y reintenta 429/timeouts con backoff
+            response = self.governor.call(
+                lambda: self.client.embeddings.create(input=valid_texts, **self._request_options()),
+                tokens=total_tokens
             )
             
             # Extraer embeddings en el mismo orden
@@ -230,9 +278,11 @@ class EmbeddingManager:
         
         Precios (a dic 2024):
         - text-embedding-3-large: $0.13 por 1M tokens
+        - text-embedding-3-small: $0.02 por 1M tokens
+        - text-embedding-ada-002: $0.10 por 1M tokens
         """
         try:
-            cost_per_million = 0.13
+            cost_per_million = EMBEDDING_MODELS[self.model]['cost_per_million']
             cost = (token_count / 1_000_000) * cost_per_million
             
             return {
@@ -254,6 +304,6 @@ class EmbeddingManager:
             'model': self.model,
             'dimensions': self.dimensions,
             'max_tokens': 8191,
-            'cost_per_million_tokens': 0.13,
-            'description': 'OpenAI text-embedding-3-large - Embeddings de alta calidad'
+            'cost_per_million_tokens': EMBEDDING_MODELS[self.model]['cost_per_million'],
+            'description': f'OpenAI {self.model}'
         }
\ No newline at end of file
@@ -0,0 +1,373 @@
+import math
+import time
+from typing import List, Dict, Any, Optional
+
+from database_kb import get_kb_db_connection
+from utils.background_jobs import jobs, ProgressThrottle
+
+JOB_TYPE = 'kb_migration'
+
+# Intentos de mover el alias antes de dar el cambio por fallido
+ALIAS_SWITCH_ATTEMPTS = 3
+
+
+def shorten_embedding(vector: List[float], dimensions: int) -> List[float]:
+    """
+    Reducir un embedding text-embedding-3 a menos dimensiones
+
+    Los modelos text-embedding-3 se entrenan para que el prefijo del vector
+    siga siendo válido; basta con truncar y volver a normalizar.
+    """
+    truncated = vector[:dimensions]
+    norm = math.sqrt(sum(value * value for value in truncated))
+    if norm == 0:
+        return truncated
+    return [value / norm for value in truncated]
+
+
+class CollectionMigration:
+    """
+    Re-embedding de una base de conocimiento hacia una colección sombra
+
+    El nombre guardado en knowledge_bases.qdrant_collection_name pasa a ser
+    un alias de Qdrant. La migración construye una colección nueva en
+    segundo plano, valida el conteo de puntos contra knowledge_points y
+    recién entonces mueve el alias, de modo que las búsquedas siguen
+    funcionando sobre la colección anterior durante todo el proceso.
+
+    La primera migración de una base creada antes de los alias tiene un
+    corte breve: la colección física con el nombre de la base debe
+    eliminarse para crear el alias, y entre ambas operaciones las búsquedas
+    fallan. Si el alias no se puede crear tras ALIAS_SWITCH_ATTEMPTS
+    intentos, knowledge_bases pasa a apuntar directo a la colección sombra
+    (ya validada y única copia).
+    """
+
+    def __init__(self, kb_id: str, embedding_model: str, vector_dimension: int,
+                 batch_size: int = 50, drop_old_collection: bool = True):
+        self.kb_id = kb_id
+        self.embedding_model = embedding_model
+        self.vector_dimension = vector_dimension
+        self.batch_size = batch_size
+        self.drop_old_collection = drop_old_collection
+
+    def start(self) -> Dict[str, Any]:
+        """Validar la solicitud y lanzar la migración en segundo plano"""
+        from .embedding_manager import EMBEDDING_MODELS, supports_shortening
+
+        model_info = EMBEDDING_MODELS.get(self.embedding_model)
+        if not model_info:
+            return {'success': False, 'error': f'Modelo no soportado: {self.embedding_model}'}
+
+        if self.vector_dimension > model_info['dimensions'] or (
+            self.vector_dimension != model_info['dimensions']
+            and not supports_shortening(self.embedding_model)
+        ):
+            return {
+                'success': False,
+                'error': f'Dimensión {self.vector_dimension} no soportada por {self.embedding_model}'
+            }
+
+        active = jobs.find_active(JOB_TYPE, self.kb_id)
+        if active:
+            return {
+                'success': False,
+                'error': 'Ya hay una migración en curso para esta base',
+                'job': active
+            }
+
+        base = self._get_base()
+        if not base:
+            return {'success': False, 'error': 'Base de conocimiento no encontrada'}
+
+        job_id = jobs.create(JOB_TYPE, self.kb_id, details={
+            'alias': base['qdrant_collection_name'],
+            'from_model': base['embedding_model'],
+            'from_dimension': base['vector_dimension'],
+            'to_model': self.embedding_model,
+            'to_dimension': self.vector_dimension
+        })
+        if not job_id:
+            # Otra solicitud registró una migración entre la verificación y el INSERT
+            return {
+                'success': False,
+                'error': 'Ya hay una migración en curso para esta base',
+                'job': jobs.find_active(JOB_TYPE, self.kb_id) or {'type': JOB_TYPE, 'reference': self.kb_id}
+            }
+        jobs.run_in_background(job_id, self.run)
+
+        return {'success': True, 'job_id': job_id}
+
+    def _get_base(self) -> Optional[Dict[str, Any]]:
+        conn = get_kb_db_connection()
+        if not conn:
+            raise RuntimeError('Error de conexión a la base de datos')
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT id, nombre, qdrant_collection_name, vector_dimension, embedding_model
+                FROM knowledge_bases
+                WHERE id = %s
+            """, (self.kb_id,))
+            base = cursor.fetchone()
+            cursor.close()
+            return base
+        finally:
+            conn.close()
+
+    def _vector_strategy(self, base: Dict[str, Any], source_collection: Optional[str]) -> str:
+        """
+        Decidir cómo obtener los vectores de la colección nueva
+
+        - copy: mismo modelo y dimensión, se reutilizan los vectores existentes
+        - shorten: mismo modelo text-embedding-3 con menos dimensiones
+
+        En copy y shorten los puntos con synced_to_qdrant = false se
+        re-generan igual (su vector en Qdrant es del texto anterior).
+        - embed: hay que generar embeddings nuevos con OpenAI
+        """
+        from .embedding_manager import supports_shortening
+
+        if not source_collection or base['embedding_model'] != self.embedding_model:
+            return 'embed'
+        if base['vector_dimension'] == self.vector_dimension:
+            return 'copy'
+        if supports_shortening(self.embedding_model) and self.vector_dimension < base['vector_dimension']:
+            return 'shorten'
+        return 'embed'
+
+    def _switch_alias(self, qdrant, alias: str, collection_name: str) -> Dict[str, Any]:
+        """switch_alias con reintentos (1 s, 2 s, ...) ante errores transitorios de Qdrant"""
+        for attempt in range(ALIAS_SWITCH_ATTEMPTS):
+            result = qdrant.switch_alias(alias, collection_name)
+            if result['success']:
+                return result
+            print(f"Error cambiando alias {alias} (intento {attempt + 1}): {result['error']}")
+            if attempt + 1 < ALIAS_SWITCH_ATTEMPTS:
+                time.sleep(2 ** attempt)
+        return result
+
+    def run(self, job_id: str):
+        """Ejecutar la migración completa (se llama desde el hilo del trabajo)"""
+        from .clients import get_qdrant_manager, get_embedding_manager
+
+        qdrant = get_qdrant_manager()
+        base = self._get_base()
+        if not base:
+            jobs.update(job_id, status='failed', error='Base de conocimiento no encontrada')
+            return
+
+        alias = base['qdrant_collection_name']
+
+        # Colección física que hoy responde al nombre de la base
+        if qdrant.get_alias_target(alias):
+            source_collection = qdrant.get_alias_target(alias)
+        elif qdrant.is_physical_collection(alias):
+            source_collection = alias
+        else:
+            source_collection = None
+
+        shadow_collection = f"{alias}_v{int(time.time())}"
+        strategy = self._vector_strategy(base, source_collection)
+
+        result = qdrant.create_collection(shadow_collection, self.vector_dimension)
+        if not result['success']:
+            jobs.update(job_id, status='failed', error=f"Error creando colección sombra: {result['error']}")
+            return
+
+        conn = get_kb_db_connection()
+        if not conn:
+            jobs.update(job_id, status='failed', error='Error de conexión a la base de datos')
+            return
+
+        # Las lecturas por lote no deben mantener una transacción abierta
+        # durante toda la migración
+        conn.autocommit = True
+        cursor = conn.cursor()
+
+        # Se migran los puntos existentes al inicio; los que se creen o editen
+        # después quedan pendientes para la próxima sincronización
+        cursor.execute("SELECT NOW() AS started_at")
+        started_at = cursor.fetchone()['started_at']
+
+        cursor.execute("""
+            SELECT COUNT(*) AS total
+            FROM knowledge_points
+            WHERE knowledge_base_id = %s AND created_at <= %s
+        """, (self.kb_id, started_at))
+        total = cursor.fetchone()['total']
+
+        jobs.update(job_id, total=total, details={
+            'source_collection': source_collection,
+            'shadow_collection': shadow_collection,
+            'strategy': strategy
+        })
+
+        embeddings_mgr = None
+        if strategy != 'copy':
+            embeddings_mgr = get_embedding_manager(self.embedding_model, self.vector_dimension)
+
+        processed = 0
+        reused = 0
+        embedded = 0
+        total_tokens = 0
+        last_id = None
+        legacy_deleted = False
+        throttle = ProgressThrottle()
+
+        try:
+            while True:
+                # Paginación por keyset para no usar OFFSET sobre tablas grandes
+                if last_id:
+                    cursor.execute("""
+                        SELECT id, page_content, metadata, synced_to_qdrant
+                        FROM knowledge_points
+                        WHERE knowledge_base_id = %s AND created_at <= %s AND id > %s
+                        ORDER BY id
+                        LIMIT %s
+                    """, (self.kb_id, started_at, last_id, self.batch_size))
+                else:
+                    cursor.execute("""
+                        SELECT id, page_content, metadata, synced_to_qdrant
+                        FROM knowledge_points
+                        WHERE knowledge_base_id = %s AND created_at <= %s
+                        ORDER BY id
+                        LIMIT %s
+                    """, (self.kb_id, started_at, self.batch_size))
+
+                batch = cursor.fetchall()
+                if not batch:
+                    break
+                last_id = batch[-1]['id']
+
+                vectors = {}
+                if strategy in ('copy', 'shorten'):
+                    # Un punto editado y aún sin sincronizar tiene en Qdrant el
+                    # embedding del texto anterior: se vuelve a generar
+                    synced = [str(p['id']) for p in batch if p['synced_to_qdrant']]
+                    stored = qdrant.retrieve_vectors(source_collection, synced) if synced else {}
+                    for point_id, vector in stored.items():
+                        vectors[point_id] = (
+                            vector if strategy == 'copy'
+                            else shorten_embedding(vector, self.vector_dimension)
+                        )
+                    reused += len(vectors)
+
+                missing = [p for p in batch if str(p['id']) not in vectors]
+                if missing:
+                    if embeddings_mgr is None:
+                        embeddings_mgr = get_embedding_manager(self.embedding_model, self.vector_dimension)
+
+                    embeddings_result = embeddings_mgr.generate_embeddings_batch(
+                        [p['page_content'] for p in missing]
+                    )
+                    if not embeddings_result['success']:
+                        raise RuntimeError(f"Error generando embeddings: {embeddings_result['error']}")
+
+                    for idx, point in enumerate(missing):
+                        vectors[str(point['id'])] = embeddings_result['embeddings'][idx]
+                    embedded += len(missing)
+                    total_tokens += embeddings_result.get('total_tokens', 0)
+
+                qdrant_points = [{
+                    'id': str(point['id']),
+                    'vector': vectors[str(point['id'])],
+                    'payload': {
+                        'page_content': point['page_content'],
+                        'metadata': point['metadata']
+                    }
+                } for point in batch]
+
+                upsert_result = qdrant.upsert_points_batch(shadow_collection, qdrant_points)
+                if not upsert_result['success']:
+                    raise RuntimeError(f"Error escribiendo en la colección sombra: {upsert_result['error']}")
+
+                processed += len(batch)
+                if throttle.ready():
+                    jobs.update(job_id, processed=processed, details={
+                        'reused_vectors': reused,
+                        'embedded_vectors': embedded
+                    })
+
+            jobs.update(job_id, processed=processed, details={
+                'reused_vectors': reused,
+                'embedded_vectors': embedded,
+                'total_tokens': total_tokens,
+                'phase': 'validating'
+            })
+
+            # Validar que la colección sombra tiene exactamente los puntos esperados
+            cursor.execute("""
+                SELECT COUNT(*) AS total
+                FROM knowledge_points
+                WHERE knowledge_base_id = %s AND created_at <= %s
+            """, (self.kb_id, started_at))
+            expected = cursor.fetchone()['total']
+
+            count_result = qdrant.count_points(shadow_collection, exact=True)
+            if not count_result['success'] or count_result['count'] != expected:
+                raise RuntimeError(
+                    f"Validación fallida: la colección sombra tiene "
+                    f"{count_result.get('count')} puntos y se esperaban {expected}"
+                )
+
+            # Una colección física con el nombre de la base impide crear el
+            # alias; se elimina justo antes del cambio (solo la primera vez,
+            # con un corte de búsquedas hasta que se crea el alias)
+            if source_collection == alias:
+                qdrant.client.delete_collection(collection_name=alias)
+                legacy_deleted = True
+
+            collection_name = alias
+            switch_result = self._switch_alias(qdrant, alias, shadow_collection)
+            if not switch_result['success']:
+                if not legacy_deleted:
+                    raise RuntimeError(f"Error cambiando alias: {switch_result['error']}")
+                # Ya no existe la colección original: la base usa la sombra por
+                # su nombre en vez de quedar apuntando a un alias inexistente
+                print(f"Alias {alias} sin crear; {self.kb_id} pasa a usar {shadow_collection}")
+                collection_name = shadow_collection
+
+            conn.autocommit = False
+            cursor.execute("""
+                UPDATE knowledge_bases
+                SET embedding_model = %s,
+                    vector_dimension = %s,
+                    qdrant_collection_name = %s,
+                    last_synced_at = NOW()
+                WHERE id = %s
+            """, (self.embedding_model, self.vector_dimension, collection_name, self.kb_id))
+
+            cursor.execute("""
+                UPDATE knowledge_points
+                SET synced_to_qdrant = (updated_at <= %s),
+                    qdrant_point_id = CASE WHEN updated_at <= %s THEN id ELSE qdrant_point_id END
+                WHERE knowledge_base_id = %s
+            """, (started_at, started_at, self.kb_id))
+
+            conn.commit()
+
+            if self.drop_old_collection and source_collection and source_collection != alias:
+                qdrant.delete_collection(source_collection)
+
+            cost = embeddings_mgr.estimate_cost(total_tokens) if embeddings_mgr and total_tokens else None
+            jobs.update(job_id, status='completed', processed=processed, details={
+                'phase': 'switched' if collection_name == alias else 'switched_without_alias',
+                'active_collection': shadow_collection,
+                'alias_error': None if collection_name == alias else switch_result['error'],
+                'cost': cost
+            })
+
+        except Exception as e:
+            print(f"Error en migración de {alias}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            conn.rollback()
+            # La colección sombra se descarta salvo que ya sea la única copia
+            if not legacy_deleted and qdrant.get_alias_target(alias) != shadow_collection:
+                qdrant.delete_collection(shadow_collection)
+            jobs.update(job_id, status='failed', processed=processed, error=str(e))
+
+        finally:
+            cursor.close()
+            conn.close()
@@ -1,8 +1,12 @@
 import os
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import (
+    Distance, VectorParams, PointStruct,
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+)
 from typing import List, Dict, Any, Optional
 import uuid
+from .rate_governor import get_governor
 
 class QdrantManager:
     """Gestor de conexión y operaciones con Qdrant"""
@@ -19,6 +23,7 @@ class QdrantManager:
             api_key=self.api_key,
             timeout=30
         )
+        self.governor = get_governor('qdrant')
     
     def test_connection(self) -> Dict[str, Any]:
         """Probar conexión con Qdrant"""
@@ -36,14 +41,59 @@ class QdrantManager:
             }
     
     def collection_exists(self, collection_name: str) -> bool:
-        """Verificar si una colección existe"""
+        """Verificar si una colección (o un alias hacia una colección) existe"""
         try:
             collections = self.client.get_collections()
-            return any(col.name == collection_name for col in collections.collections)
+            if any(col.name == collection_name for col in collections.collections):
+                return True
+            return self.get_alias_target(collection_name) is not None
         except Exception as e:
             print(f"Error verificando colección: {str(e)}")
             return False
     
+    def is_physical_collection(self, collection_name: str) -> bool:
+        """Verificar si el nombre corresponde a una colección real (no a un alias)"""
+        collections = self.client.get_collections()
+        return any(col.name == collection_name for col in collections.collections)
+    
+    def get_alias_target(self, alias_name: str) -> Optional[str]:
+        """Obtener la colección a la que apunta un alias, o None si no existe"""
+        aliases = self.client.get_aliases()
+        for alias in aliases.aliases:
+            if alias.alias_name == alias_name:
+                return alias.collection_name
+        return None
+    
+    def switch_alias(self, alias_name: str, collection_name: str) -> Dict[str, Any]:
+        """
+        Apuntar un alias a otra colección en una sola operación atómica
+        
+        Si el alias ya existe se elimina y recrea dentro de la misma
+        petición, por lo que las búsquedas nunca ven el alias vacío.
+        """
+        try:
+            operations = []
+            if self.get_alias_target(alias_name) is not None:
+                operations.append(DeleteAliasOperation(
+                    delete_alias=DeleteAlias(alias_name=alias_name)
+                ))
+            operations.append(CreateAliasOperation(
+                create_alias=CreateAlias(collection_name=collection_name, alias_name=alias_name)
+            ))
+            
+            self.client.update_collection_aliases(change_aliases_operations=operations)
+            
+            return {
+                'success': True,
+                'message': f'Alias "{alias_name}" apunta ahora a "{collection_name}"'
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
     def create_collection(self, collection_name: str, vector_size: int = 3072) -> Dict[str, Any]:
         """Crear una nueva colección en Qdrant"""
         try:
@@ -148,10 +198,10 @@ class QdrantManager:
             )
             
             # Upsert (insert or update)
-            self.client.upsert(
+            self.governor.call(lambda: self.client.upsert(
                 collection_name=collection_name,
                 points=[point]
-            )
+            ))
             
             return {
                 'success': True,
@@ -193,11 +243,11 @@ class QdrantManager:
                 )
                 point_structs.append(point)
             
-            # Upsert en batch
-            self.client.upsert(
+            # Upsert en batch (con reintentos ante 429/5xx/timeouts)
+            self.governor.call(lambda: self.client.upsert(
                 collection_name=collection_name,
                 points=point_structs
-            )
+            ))
             
             return {
                 'success': True,
@@ -285,12 +335,12 @@ class QdrantManager:
                 }
             
             # Realizar búsqueda
-            results = self.client.search(
+            results = self.governor.call(lambda: self.client.search(
                 collection_name=collection_name,
                 query_vector=query_vector,
                 limit=limit,
                 score_threshold=score_threshold
-            )
+            ))
             
             # Formatear resultados
             points = []
@@ -352,7 +402,17 @@ class QdrantManager:
                 'error': str(e)
             }
     
-    def count_points(self, collection_name: str) -> Dict[str, Any]:
+    def retrieve_vectors(self, collection_name: str, point_ids: List[str]) -> Dict[str, List[float]]:
+        """Obtener los vectores almacenados de varios puntos (id -> vector)"""
+        points = self.governor.call(lambda: self.client.retrieve(
+            collection_name=collection_name,
+            ids=point_ids,
+            with_payload=False,
+            with_vectors=True
+        ))
+        return {str(point.id): point.vector for point in points if point.vector}
+    
+    def count_points(self, collection_name: str, exact: bool = False) -> Dict[str, Any]:
         """Contar puntos en una colección"""
         try:
             if not self.collection_exists(collection_name):
@@ -361,6 +421,13 @@ class QdrantManager:
                     'error': f'La colección "{collection_name}" no existe'
                 }
             
+            if exact:
+                result = self.client.count(collection_name=collection_name, exact=True)
+                return {
+                    'success': True,
+                    'count': result.count
+                }
+            
             info = self.client.get_collection(collection_name=collection_name)
             
             return {
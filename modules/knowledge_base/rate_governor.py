@@ -0,0 +1,351 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from metrics import record_external_call
+
+# Status HTTP que vale la pena reintentar
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+# Errores de red/timeout de openai, httpx y qdrant_client (por nombre de clase
+# para no acoplar este módulo a las librerías)
+RETRYABLE_ERRORS = {
+    'APITimeoutError', 'APIConnectionError', 'RateLimitError', 'InternalServerError',
+    'TimeoutException', 'ConnectTimeout', 'ReadTimeout', 'WriteTimeout', 'PoolTimeout',
+    'ConnectError', 'ReadError', 'RemoteProtocolError', 'ResponseHandlingException'
+}
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: el servicio falló repetidamente y se evita llamarlo"""
+
+
+class TokenBucket:
+    """Token bucket con recarga continua (capacidad = un minuto de cupo)"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute or 0
+        self.rate = self.per_minute / 60.0
+        self.capacity = self.per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Reservar cupo y esperar lo necesario; retorna los segundos esperados"""
+        if self.rate <= 0:
+            return 0.0
+
+        amount = min(amount, self.capacity)
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Se permite saldo negativo: las llamadas siguientes esperan en fila
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """Circuit breaker clásico: closed -> open -> half_open -> closed"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._trial_owner = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._trial_in_flight = False
+            if self.state == 'half_open' and not self._trial_in_flight:
+                # Solo una llamada de prueba mientras el circuito está entreabierto
+                self._trial_in_flight = True
+                self._trial_owner = threading.get_ident()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Liberar la llamada de prueba de este hilo sin cambiar el estado (salida sin resultado)"""
+        with self._lock:
+            if self._trial_in_flight and self._trial_owner == threading.get_ident():
+                self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_flight = False
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        response = getattr(exc, 'response', None)
+        status = getattr(response, 'status_code', None)
+    return status
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Leer Retry-After (segundos o fecha HTTP) / retry-after-ms de la respuesta"""
+    headers = getattr(exc, 'headers', None)
+    if headers is None:
+        response = getattr(exc, 'response', None)
+        headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    try:
+        value_ms = headers.get('retry-after-ms')
+        if value_ms:
+            return float(value_ms) / 1000.0
+
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            retry_at = parsedate_to_datetime(value)
+            return max(retry_at.timestamp() - time.time(), 0.0)
+    except Exception:
+        return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Determinar si un error es transitorio (rate limit, timeout, 5xx)"""
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return type(exc).__name__ in RETRYABLE_ERRORS or isinstance(exc, (TimeoutError, ConnectionError))
+
+
+class RateGovernor:
+    """
+    Gobernador de llamadas a un servicio externo
+
+    Combina rate limiting (requests/min y tokens/min), reintentos con
+    backoff exponencial + jitter que respetan Retry-After y un circuit
+    breaker. Una instancia se comparte entre todos los hilos del proceso.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_retries: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._metrics = {
+            'calls': 0,
+            'successes': 0,
+            'failures': 0,
+            'retries': 0,
+            'rejected_open_circuit': 0,
+            'throttled_seconds': 0.0,
+            'backoff_seconds': 0.0,
+            'last_error': None
+        }
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self._metrics[key] += amount
+
+    def _pause(self, seconds: float):
+        """Tras un 429 todos los hilos esperan, no solo el que lo recibió"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _wait_for_capacity(self, tokens: int):
+        waited = 0.0
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+            waited += pause
+        waited += self.requests.acquire(1)
+        if tokens:
+            waited += self.tokens.acquire(tokens)
+        if waited:
+            self._count('throttled_seconds', waited)
+
+    def call(self, fn: Callable[[], Any], tokens: int = 0) -> Any:
+        """
+        Ejecutar fn() respetando los límites del servicio
+
+        Args:
+            fn: Función sin argumentos que realiza la llamada
+            tokens: Tokens que consume la llamada (para el límite tokens/min)
+
+        Raises:
+            CircuitOpenError si el circuito está abierto, o el último error
+            si se agotan los reintentos o el error no es transitorio
+        """
+        self._count('calls')
+
+        if not self.breaker.allow():
+            self._count('rejected_open_circuit')
+            record_external_call(self.name, 0.0, 'rejected')
+            raise CircuitOpenError(
+                f'{self.name}: circuito abierto tras fallos consecutivos, reintenta más tarde'
+            )
+
+        started = time.perf_counter()
+        try:
+            return self._call_with_retries(fn, tokens, started)
+        finally:
+            # Si la llamada de prueba del circuito entreabierto salió por un
+            # camino sin resultado (p. ej. una excepción al esperar capacidad),
+            # el siguiente llamador debe poder intentarlo
+            self.breaker.release_trial()
+
+    def _call_with_retries(self, fn: Callable[[], Any], tokens: int, started: float) -> Any:
+        attempt = 0
+        while True:
+            self._wait_for_capacity(tokens)
+            try:
+                result = fn()
+                self.breaker.record_success()
+                self._count('successes')
+                record_external_call(self.name, time.perf_counter() - started, 'success')
+                return result
+
+            except Exception as e:
+                retryable = is_retryable(e)
+                if not retryable or attempt >= self.max_retries:
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        # El servicio respondió (p. ej. un 400): no cuenta como caída
+                        self.breaker.record_success()
+                    self._count('failures')
+                    with self._lock:
+                        self._metrics['last_error'] = f'{type(e).__name__}: {str(e)[:200]}'
+                    record_external_call(self.name, time.perf_counter() - started, 'error')
+                    raise
+
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                retry_after = _retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.max_delay))
+                if _status_code(e) == 429:
+                    self._pause(delay)
+
+                attempt += 1
+                self._count('retries')
+                self._count('backoff_seconds', delay)
+                print(f"⚠️ {self.name}: {type(e).__name__}, reintento {attempt}/{self.max_retries} en {delay:.2f}s")
+                time.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['throttled_seconds'] = round(metrics['throttled_seconds'], 3)
+        metrics['backoff_seconds'] = round(metrics['backoff_seconds'], 3)
+        metrics['circuit_state'] = self.breaker.state
+        metrics['circuit_opened_count'] = self.breaker.times_opened
+        metrics['limits'] = {
+            'requests_per_minute': self.requests.per_minute,
+            'tokens_per_minute': self.tokens.per_minute
+        }
+        return metrics
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def _process_count() -> int:
+    """
+    Procesos que comparten los límites de cuenta de OpenAI/Qdrant
+
+    Cada proceso tiene sus propios buckets: el cupo se reparte entre
+    RATE_LIMIT_PROCESSES procesos (por defecto WEB_CONCURRENCY, que
+    gunicorn.conf.py define con su cantidad de workers). Con varios
+    contenedores, RATE_LIMIT_PROCESSES debe ser el total de workers.
+    """
+    return max(int(_env_number('RATE_LIMIT_PROCESSES', _env_number('WEB_CONCURRENCY', 1))), 1)
+
+
+def _per_process(name: str, default: float) -> float:
+    return _env_number(name, default) / _process_count()
+
+
+# Límites por servicio (de la cuenta, repartidos entre procesos); 0 desactiva
+# el bucket correspondiente
+GOVERNOR_SETTINGS = {
+    'openai': {
+        'requests_per_minute': lambda: _per_process('OPENAI_RPM', 3000),
+        'tokens_per_minute': lambda: _per_process('OPENAI_TPM', 1000000),
+        'max_retries': lambda: int(_env_number('OPENAI_MAX_RETRIES', 5))
+    },
+    'qdrant': {
+        'requests_per_minute': lambda: _per_process('QDRANT_RPM', 0),
+        'tokens_per_minute': lambda: 0,
+        'max_retries': lambda: int(_env_number('QDRANT_MAX_RETRIES', 5))
+    }
+}
+
+_governors: Dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(name: str) -> RateGovernor:
+    """Obtener el gobernador compartido de un servicio ('openai' o 'qdrant')"""
+    governor = _governors.get(name)
+    if governor:
+        return governor
+
+    with _governors_lock:
+        if name not in _governors:
+            settings = {key: factory() for key, factory in GOVERNOR_SETTINGS[name].items()}
+            _governors[name] = RateGovernor(name, **settings)
+        return _governors[name]
+
+
+def reset_governors():
+    """Descartar los gobernadores heredados tras un fork (locks y contadores)"""
+    global _governors_lock
+
+    _governors_lock = threading.Lock()
+    _governors.clear()
+
+
+def governor_metrics() -> Dict[str, Any]:
+    """Métricas de todos los gobernadores creados en este proceso"""
+    return {name: governor.metrics() for name, governor in list(_governors.items())}
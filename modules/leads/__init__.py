@@ -0,0 +1,79 @@
+from flask import Blueprint, jsonify, request
+import os
+from utils.webhook import webhook_authorized
+from .updates import lead_updater, ESTADOS, PLANES, NIVELES_INTENCION, UPDATE_FIELDS
+
+leads_bp = Blueprint('leads', __name__)
+
+# Segundos que un request espera a que su ventana quede aplicada
+LEAD_UPDATE_WAIT_TIMEOUT = float(os.getenv('LEAD_UPDATE_WAIT_TIMEOUT', '10'))
+
+# Máximo de actualizaciones por request
+LEAD_UPDATE_MAX_ITEMS = int(os.getenv('LEAD_UPDATE_MAX_ITEMS', '1000'))
+
+
+@leads_bp.route('/api/update', methods=['POST'])
+def update_leads():
+    """
+    Actualizar leads (herramienta 'Actualizar prospecto' del setter)
+
+    Body: una actualización {"session_id", "carrera_interes", "experiencia_laboral",
+    "plan", "nivel_intencion", "estado", "derivado_a_humano", "fecha_derivacion"},
+    una lista o {"updates": [...]}. Cada session_id vuelve con su resultado:
+    updated, unchanged (valores iguales, no se escribe) o not_found.
+    """
+    if not webhook_authorized():
+        return jsonify({'success': False, 'error': 'unauthorized'}), 401
+
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and 'updates' in data:
+            items = data['updates']
+        elif isinstance(data, dict):
+            items = [data]
+        else:
+            items = data
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'success': False, 'error': 'updates required'}), 400
+        if len(items) > LEAD_UPDATE_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f"Máximo {LEAD_UPDATE_MAX_ITEMS} actualizaciones por request"
+            }), 413
+
+        pending, sessions, rejected = lead_updater.submit(items)
+        pending.wait(LEAD_UPDATE_WAIT_TIMEOUT)
+        outcome = pending.result or {}
+
+        results = {session_id: outcome.get(session_id) for session_id in sessions if session_id}
+        counts = {status: list(results.values()).count(status) for status in ('updated', 'unchanged', 'not_found')}
+
+        # Todas rechazadas: error del llamador
+        success = bool(results) or not rejected
+        return jsonify({
+            'success': success,
+            'results': results,
+            **counts,
+            'rejected': rejected
+        }), 200 if success else 400
+    except TimeoutError:
+        # Siguen en cola y se aplicarán; el llamador no debe reenviarlas
+        return jsonify({'success': True, 'queued': True}), 202
+    except Exception as e:
+        print(f"Error in update_leads: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@leads_bp.route('/api/update/schema')
+def update_schema():
+    """Campos y valores permitidos (para configurar la herramienta del agente)"""
+    return jsonify({
+        'success': True,
+        'fields': list(UPDATE_FIELDS),
+        'estados': ESTADOS,
+        'planes': PLANES,
+        'niveles_intencion': NIVELES_INTENCION
+    })
@@ -0,0 +1,274 @@
+"""
+Actualización de leads desde la clasificación del setter (n8n)
+
+El agente llama a la herramienta 'Actualizar prospecto' después de cada
+turno con los mismos campos, casi siempre sin cambios. Las actualizaciones
+se validan, se agrupan con un WriteBuffer por una ventana corta (las del
+mismo session_id se combinan: gana la última por campo) y se aplican con
+un solo UPDATE de varias filas que no toca los leads cuyos valores ya son
+iguales (ni su updated_at, ni los triggers, ni la caché de facetas).
+"""
+import json
+import os
+import re
+import unicodedata
+from datetime import datetime, timezone
+
+from psycopg2.extras import execute_values
+
+from database import get_db_connection
+from facets import track_facets
+from utils.write_buffer import WriteBuffer
+
+ESTADOS = ['nuevo', 'calificando', 'persuadiendo', 'listo_matricula', 'perdido', 'en_proceso']
+PLANES = ['Plan Regular', 'Plan Especial']
+NIVELES_INTENCION = ['Sin intencion', 'Baja', 'Media', 'Alta']
+
+LEAD_UPDATE_BATCH_ROWS = int(os.getenv('LEAD_UPDATE_BATCH_ROWS', '500'))
+LEAD_UPDATE_WINDOW_MS = int(os.getenv('LEAD_UPDATE_WINDOW_MS', '200'))
+
+# columna -> (tipo SQL, expresión del valor nuevo; {value} es el valor del patch)
+UPDATE_FIELDS = {
+    'carrera_interes': ('text', '{value}'),
+    'experiencia_laboral': ('integer', '{value}'),
+    'plan': ('text', '{value}'),
+    'nivel_intencion': ('text', '{value}'),
+    'estado': ('text', '{value}'),
+    'derivado_a_humano': ('boolean', '{value}'),
+    # El agente repite la derivación en cada turno: se conserva la primera fecha
+    'fecha_derivacion': ('timestamptz', 'COALESCE(l.fecha_derivacion, {value})'),
+}
+
+
+def _new_value(column):
+    sql_type, template = UPDATE_FIELDS[column]
+    return template.format(value=f"(v.patch->>'{column}')::{sql_type}")
+
+
+UPDATE_SQL = """
+    UPDATE leads l
+    SET {assignments},
+        updated_at = NOW()
+    FROM (VALUES %s) v (session_id, patch)
+    WHERE l.session_id = v.session_id
+      AND ({changed})
+    RETURNING l.session_id
+""".format(
+    assignments=',\n        '.join(
+        f"{column} = CASE WHEN v.patch ? '{column}' THEN {_new_value(column)} ELSE l.{column} END"
+        for column in UPDATE_FIELDS
+    ),
+    changed=' OR '.join(
+        f"(v.patch ? '{column}' AND {_new_value(column)} IS DISTINCT FROM l.{column})"
+        for column in UPDATE_FIELDS
+    )
+)
+
+
+class InvalidUpdate(ValueError):
+    pass
+
+
+def _fold(value):
+    # Sin acentos ni mayúsculas, para comparar opciones escritas por el LLM
+    value = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode()
+    return ' '.join(value.lower().replace('_', ' ').split())
+
+
+def _choice(field, value, options):
+    folded = _fold(value)
+    for option in options:
+        if _fold(option) == folded:
+            return option
+    raise InvalidUpdate(f"{field} inválido: {value} (permitidos: {', '.join(options)})")
+
+
+def _experiencia(value):
+    # Años acreditables; 'sin experiencia' e 'insuficiente' (no acreditable) cuentan como 0
+    if isinstance(value, bool):
+        raise InvalidUpdate(f"experiencia_laboral inválida: {value}")
+    if isinstance(value, int):
+        years = value
+    else:
+        match = re.search(r'\d+', str(value))
+        if match:
+            years = int(match.group())
+        elif _fold(value).startswith(('sin', 'insu', 'insi', 'no ')):
+            years = 0
+        else:
+            raise InvalidUpdate(f"experiencia_laboral inválida: {value}")
+    if not 0 <= years <= 80:
+        raise InvalidUpdate(f"experiencia_laboral fuera de rango: {value}")
+    return years
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    folded = _fold(value)
+    if folded in ('true', '1', 'si', 'yes'):
+        return True
+    if folded in ('false', '0', 'no'):
+        return False
+    raise InvalidUpdate(f"derivado_a_humano inválido: {value}")
+
+
+def _fecha(value):
+    text = str(value).strip()
+    try:
+        fecha = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        for fmt in ('%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y', '%d-%m-%Y'):
+            try:
+                fecha = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise InvalidUpdate(f"fecha_derivacion inválida: {value}")
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+def parse_update(item, received_at):
+    """
+    Validar una actualización del setter
+
+    Los campos vacíos o null se omiten (el prompt pide mantener el valor
+    original). El estado 'Derivado a un agente' se guarda como
+    listo_matricula con derivado_a_humano; si se deriva sin fecha se usa la
+    hora de recepción.
+
+    Returns:
+        (session_id, patch) con los valores ya normalizados
+
+    Raises:
+        InvalidUpdate: si falta el session_id o un valor no es válido
+    """
+    if not isinstance(item, dict):
+        raise InvalidUpdate('cada actualización debe ser un objeto')
+
+    # Tal como lo guardó n8n en leads.session_id (el setter lo recibe del lead)
+    session_id = str(item.get('session_id') or '').strip()
+    if not session_id:
+        raise InvalidUpdate('session_id requerido')
+
+    values = {key: value for key, value in item.items()
+              if key in UPDATE_FIELDS and value is not None and value != ''}
+
+    patch = {}
+    if 'carrera_interes' in values:
+        carrera = str(values['carrera_interes']).strip()
+        if len(carrera) > 255:
+            raise InvalidUpdate('carrera_interes supera 255 caracteres')
+        patch['carrera_interes'] = carrera
+    if 'experiencia_laboral' in values:
+        patch['experiencia_laboral'] = _experiencia(values['experiencia_laboral'])
+    if 'plan' in values:
+        patch['plan'] = _choice('plan', values['plan'], PLANES)
+    if 'nivel_intencion' in values:
+        patch['nivel_intencion'] = _choice('nivel_intencion', values['nivel_intencion'], NIVELES_INTENCION)
+    if 'estado' in values:
+        if _fold(values['estado']).startswith('derivado'):
+            patch['estado'] = 'listo_matricula'
+            patch['derivado_a_humano'] = True
+        else:
+            patch['estado'] = _choice('estado', values['estado'], ESTADOS)
+    if 'derivado_a_humano' in values:
+        patch['derivado_a_humano'] = _bool(values['derivado_a_humano'])
+    if 'fecha_derivacion' in values:
+        patch['fecha_derivacion'] = _fecha(values['fecha_derivacion']).isoformat()
+    elif patch.get('derivado_a_humano'):
+        patch['fecha_derivacion'] = received_at.isoformat()
+
+    if not patch:
+        raise InvalidUpdate(f"sin campos para actualizar (permitidos: {', '.join(UPDATE_FIELDS)})")
+    return session_id, patch
+
+
+def apply_updates(conn, updates):
+    """
+    Aplicar actualizaciones en un solo UPDATE (sin commit)
+
+    Args:
+        updates: Lista [(session_id, patch)]; las del mismo session_id se combinan en orden
+
+    Returns:
+        Dict session_id -> 'updated' | 'unchanged' | 'not_found'
+    """
+    patches = {}
+    for session_id, patch in updates:
+        patches.setdefault(session_id, {}).update(patch)
+    sessions = sorted(patches)
+
+    cursor = conn.cursor()
+    # Bloqueo en orden fijo para no cruzarse con otro worker o con n8n
+    cursor.execute("""
+        SELECT session_id FROM leads
+        WHERE session_id = ANY(%s)
+        ORDER BY id
+        FOR UPDATE
+    """, (sessions,))
+    existing = {row['session_id'] for row in cursor.fetchall()}
+
+    values = [(session_id, json.dumps(patches[session_id])) for session_id in sessions if session_id in existing]
+    updated = set()
+    if values:
+        with track_facets(cursor, 'leads', "session_id = ANY(%s)", [[sid for sid, _ in values]]):
+            rows = execute_values(cursor, UPDATE_SQL, values, template='(%s, %s::jsonb)',
+                                  page_size=len(values), fetch=True)
+        updated = {row['session_id'] for row in rows}
+    cursor.close()
+
+    return {
+        session_id: 'updated' if session_id in updated else
+                    'unchanged' if session_id in existing else 'not_found'
+        for session_id in sessions
+    }
+
+
+class LeadUpdater:
+    """Agrupa las actualizaciones del setter por ventana (ver WriteBuffer)"""
+
+    def __init__(self, connection_factory=None, max_rows=LEAD_UPDATE_BATCH_ROWS,
+                 window=LEAD_UPDATE_WINDOW_MS / 1000):
+        self.connection_factory = connection_factory or get_db_connection
+        self.buffer = WriteBuffer(self._flush, max_rows=max_rows, max_delay=window,
+                                  name='lead-updates')
+
+    def _flush(self, updates):
+        conn = self.connection_factory()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        try:
+            result = apply_updates(conn, updates)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def submit(self, items):
+        """
+        Validar y encolar actualizaciones
+
+        Returns:
+            (PendingWrite, session_ids en el orden de items (None si se
+            rechazó), rechazados [{'index', 'error'}])
+        """
+        received_at = datetime.now(timezone.utc)
+        updates, sessions, rejected = [], [], []
+        for index, item in enumerate(items):
+            try:
+                update = parse_update(item, received_at)
+            except InvalidUpdate as e:
+                rejected.append({'index': index, 'error': str(e)})
+                sessions.append(None)
+                continue
+            updates.append(update)
+            sessions.append(update[0])
+        return self.buffer.add(updates), sessions, rejected
+
+
+lead_updater = LeadUpdater()
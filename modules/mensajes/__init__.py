@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify, request
+import os
+from utils.webhook import webhook_authorized
+from .ingest import message_ingestor
+
+mensajes_bp = Blueprint('mensajes', __name__)
+
+# Segundos que un request espera a que su lote quede escrito
+INGEST_WAIT_TIMEOUT = float(os.getenv('INGEST_WAIT_TIMEOUT', '10'))
+
+# Máximo de mensajes por request
+INGEST_MAX_MESSAGES = int(os.getenv('INGEST_MAX_MESSAGES', '5000'))
+
+
+@mensajes_bp.route('/api/ingest', methods=['POST'])
+def ingest():
+    """
+    Webhook de mensajes de WhatsApp
+
+    Body: un mensaje {"session_id", "message": {"type", "content"}, "timestamp"},
+    una lista de mensajes o {"messages": [...]}. Responde cuando los mensajes
+    válidos están guardados; los inválidos se informan en rejected.
+    """
+    if not webhook_authorized():
+        return jsonify({'success': False, 'error': 'unauthorized'}), 401
+
+    try:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict) and 'messages' in data:
+            events = data['messages']
+        elif isinstance(data, dict):
+            events = [data]
+        else:
+            events = data
+
+        if not isinstance(events, list) or not events:
+            return jsonify({'success': False, 'error': 'messages required'}), 400
+        if len(events) > INGEST_MAX_MESSAGES:
+            return jsonify({
+                'success': False,
+                'error': f"Máximo {INGEST_MAX_MESSAGES} mensajes por request"
+            }), 413
+
+        accepted, rejected = message_ingestor.ingest(events, INGEST_WAIT_TIMEOUT)
+
+        # Todos rechazados: error del llamador
+        success = bool(accepted) or not rejected
+        return jsonify({
+            'success': success,
+            'accepted': accepted,
+            'rejected': rejected
+        }), 200 if success else 400
+    except TimeoutError:
+        # Siguen en cola y se escribirán; el llamador no debe reenviarlos
+        return jsonify({'success': True, 'queued': True}), 202
+    except Exception as e:
+        print(f"Error in ingest: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -0,0 +1,168 @@
+"""
+Ingesta de mensajes de WhatsApp en n8n_chat_histories
+
+Los mensajes llegan al webhook sueltos o en lotes, con el session_id
+normalizado a 569XXXXXXXX (el formato que ya usa n8n), y se escriben con un
+WriteBuffer: un INSERT de varias filas por lote. Si el lote falla por un
+mensaje que la base rechaza se reintenta uno por uno y solo ese vuelve en
+rejected. El contador de mensajes de cada lead (leads.mensaje_count y
+leads.ultimo_mensaje_at) lo suma un trigger que crea init_db.py.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from database import get_db_connection
+from utils.normalize import normalize_phone
+from utils.write_buffer import WriteBuffer
+
+INGEST_BATCH_ROWS = int(os.getenv('INGEST_BATCH_ROWS', '500'))
+INGEST_MAX_DELAY_MS = int(os.getenv('INGEST_MAX_DELAY_MS', '50'))
+
+# Roles aceptados y su tipo en el formato de mensajes de n8n (LangChain)
+MESSAGE_TYPES = {
+    'human': 'human', 'user': 'human',
+    'ai': 'ai', 'assistant': 'ai',
+    'system': 'system', 'tool': 'tool'
+}
+
+class InvalidMessage(ValueError):
+    pass
+
+
+def parse_message(event, received_at):
+    """
+    Convertir un evento del webhook en una fila de n8n_chat_histories
+
+    Acepta el formato de n8n ({"session_id", "message": {"type", "content"}})
+    o uno plano ({"session_id" | "telefono", "role", "content"}).
+
+    Returns:
+        (session_id, message_json, timestamp)
+
+    Raises:
+        InvalidMessage: si falta el teléfono o el contenido
+    """
+    if not isinstance(event, dict):
+        raise InvalidMessage('cada mensaje debe ser un objeto')
+
+    session_id = normalize_phone(event.get('session_id') or event.get('telefono'))
+    if not session_id:
+        raise InvalidMessage('session_id no es un teléfono válido')
+
+    message = event.get('message')
+    if isinstance(message, dict):
+        message = dict(message)
+    else:
+        message = {
+            'type': event.get('type') or event.get('role') or 'human',
+            'content': event.get('content') if message is None else message,
+            'additional_kwargs': {},
+            'response_metadata': {}
+        }
+
+    kind = MESSAGE_TYPES.get(str(message.get('type', '')).lower())
+    if not kind:
+        raise InvalidMessage(f"tipo de mensaje inválido: {message.get('type')}")
+    message['type'] = kind
+    if not isinstance(message.get('content'), str) or not message['content']:
+        raise InvalidMessage('content requerido')
+
+    timestamp = event.get('timestamp')
+    if timestamp:
+        try:
+            timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+        except ValueError:
+            raise InvalidMessage(f"timestamp inválido: {timestamp}")
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+    else:
+        timestamp = received_at
+
+    return session_id, json.dumps(message, ensure_ascii=False), timestamp
+
+
+def write_messages(conn, rows):
+    """
+    Insertar mensajes en n8n_chat_histories (sin commit)
+
+    Args:
+        rows: Lista [(session_id, message_json, timestamp)]
+    """
+    cursor = conn.cursor()
+    execute_values(cursor, """
+        INSERT INTO n8n_chat_histories (session_id, message, timestamp) VALUES %s
+    """, rows, template='(%s, %s::jsonb, %s)', page_size=len(rows))
+    cursor.close()
+
+
+class MessageIngestor:
+    """Escribe los mensajes del webhook por lotes (ver WriteBuffer)"""
+
+    def __init__(self, connection_factory=None, max_rows=INGEST_BATCH_ROWS,
+                 max_delay=INGEST_MAX_DELAY_MS / 1000):
+        self.connection_factory = connection_factory or get_db_connection
+        # Errores de un mensaje (texto con \u0000, timestamp fuera de rango),
+        # no de conexión: solo con esos vale la pena reintentar uno por uno
+        self.buffer = WriteBuffer(self._flush, max_rows=max_rows, max_delay=max_delay,
+                                  name='message-ingest',
+                                  retry_rows_on=(psycopg2.DataError, psycopg2.IntegrityError))
+
+    def _flush(self, rows):
+        conn = self.connection_factory()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        try:
+            write_messages(conn, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _parse(self, events):
+        received_at = datetime.now(timezone.utc)
+        rows, indexes, rejected = [], [], []
+        for index, event in enumerate(events):
+            try:
+                rows.append(parse_message(event, received_at))
+                indexes.append(index)
+            except InvalidMessage as e:
+                rejected.append({'index': index, 'error': str(e)})
+        return rows, indexes, rejected
+
+    def submit(self, events):
+        """
+        Validar y encolar eventos
+
+        Returns:
+            (PendingWrite, rechazados [{'index', 'error'}])
+        """
+        rows, _, rejected = self._parse(events)
+        return self.buffer.add(rows), rejected
+
+    def ingest(self, events, timeout=None):
+        """
+        Validar, encolar y esperar a que los eventos estén guardados
+
+        Returns:
+            (aceptados, rechazados [{'index', 'error'}]), incluidos los que
+            rechazó la base
+
+        Raises:
+            TimeoutError: si siguen en cola después de timeout
+        """
+        rows, indexes, rejected = self._parse(events)
+        pending = self.buffer.add(rows)
+        accepted = pending.wait(timeout)
+        rejected.extend({'index': indexes[position], 'error': str(error).strip()}
+                        for position, error in pending.failed)
+        rejected.sort(key=lambda item: item['index'])
+        return accepted, rejected
+
+
+message_ingestor = MessageIngestor()
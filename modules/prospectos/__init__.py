@@ -1,16 +1,25 @@
-from flask import Blueprint, render_template, jsonify, request, session
+from flask import Blueprint, render_template, jsonify, request
 from werkzeug.utils import secure_filename
 from database import get_db_connection
+from http_cache import conditional
+from facets import facet_cache, track_facets
 from utils.file_processor import FileProcessor
+from utils.normalize import normalize_phone
+from utils.export import export_formats, export_response, iter_query
+from .upload_registry import uploads
+from . import dedupe, lotes
+from utils.background_jobs import jobs
 import os
 import uuid
 from datetime import datetime
 import json
 import re
+from psycopg2.extras import execute_values
 
 prospectos_bp = Blueprint('prospectos', __name__)
 
-UPLOAD_FOLDER = '/tmp/uploads'
+# Con varios contenedores debe ser un volumen compartido
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', '/tmp/uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Campos objetivo y sus sinónimos para mapeo automático
@@ -32,31 +41,107 @@ TARGET_FIELDS = {
     'urgencia': ['urgencia', 'con que urgencia', '¿con que urgencia quieres matricularte?']
 }
 
-def normalize_phone(phone):
-    """Normaliza teléfono a formato 569XXXXXXXX"""
-    if not phone:
-        return None
-    
-    phone_str = str(phone).strip()
-    phone_clean = re.sub(r'[^0-9]', '', phone_str)
-    
-    if phone_clean.startswith('56'):
-        phone_clean = phone_clean[2:]
-    
-    if phone_clean.startswith('9') and len(phone_clean) == 9:
-        return '56' + phone_clean
-    
-    if len(phone_clean) == 8:
-        return '569' + phone_clean
-    
-    return None
-
 @prospectos_bp.route('/')
 @prospectos_bp.route('/raw')
 def prospectos_raw():
     """Vista principal de prospectos RAW"""
     return render_template('modules/prospectos_raw.html', current_module='prospectos')
 
+# Columnas por las que /api/list y /api/export pueden ordenar y filtrar
+SORT_COLUMNS = ['nombre', 'apellidos', 'email_1', 'telefono_1',
+                'programa', 'propietario', 'fecha_creacion', 'created_at']
+FILTER_COLUMNS = ['nombre', 'apellidos', 'email_1', 'telefono_1', 'programa', 'propietario']
+
+# Columnas de /api/export: (encabezado, función fila -> valor)
+EXPORT_COLUMNS = [
+    ('ID', lambda p: p['id']),
+    ('Nombre', lambda p: p['nombre']),
+    ('Apellidos', lambda p: p['apellidos']),
+    ('Email 1', lambda p: p['email_1']),
+    ('Email 2', lambda p: p['email_2']),
+    ('Teléfono 1', lambda p: p['telefono_1']),
+    ('Teléfono 2', lambda p: p['telefono_2']),
+    ('RUT', lambda p: p['rut']),
+    ('Programa', lambda p: p['programa']),
+    ('Carrera a la que postula', lambda p: p['carrera_postula']),
+    ('Experiencia', lambda p: p['experiencia']),
+    ('Urgencia', lambda p: p['urgencia']),
+    ('Propietario', lambda p: p['propietario']),
+    ('Canal', lambda p: p['canal']),
+    ('Fecha de creación', lambda p: p['fecha_creacion']),
+    ('Lote', lambda p: p['lote_importacion']),
+    ('Fecha de importación', lambda p: p['fecha_importacion'])
+]
+
+# Columnas que escribe /api/import (los campos mapeables más los metadatos)
+IMPORT_COLUMNS = list(TARGET_FIELDS) + [
+    'archivo_origen', 'lote_importacion', 'datos_adicionales', 'duplicado_de', 'duplicado_lead'
+]
+IMPORT_TEMPLATE = '(' + ', '.join(
+    'COALESCE(%s::timestamptz, CURRENT_TIMESTAMP)' if column == 'fecha_creacion' else
+    '%s::jsonb' if column == 'datos_adicionales' else '%s'
+    for column in IMPORT_COLUMNS
+) + ')'
+IMPORT_CHUNK_ROWS = int(os.getenv('IMPORT_CHUNK_ROWS', '1000'))
+
+def _list_query(args):
+    """
+    WHERE y ORDER BY de la lista de prospectos según los parámetros del request
+
+    Returns:
+        (where_sql, params, sort_column, sort_order)
+    """
+    # Ordenamiento
+    sort_column = args.get('sort_column', 'created_at')
+    sort_order = args.get('sort_order', 'DESC')
+    
+    # Validar columnas permitidas para ordenar
+    if sort_column not in SORT_COLUMNS:
+        sort_column = 'created_at'
+    
+    # Validar orden
+    if sort_order.upper() not in ['ASC', 'DESC']:
+        sort_order = 'DESC'
+    
+    # Filtros
+    filters = {}
+    for key in FILTER_COLUMNS:
+        value = args.get(key)
+        if value:
+            try:
+                filters[key] = json.loads(value)
+            except:
+                filters[key] = value
+    
+    where_clauses = []
+    params = []
+    
+    # FILTRO: Excluir prospectos que ya fueron activados (que existen en leads)
+    where_clauses.append("""
+        NOT EXISTS (
+            SELECT 1 FROM leads 
+            WHERE leads.telefono = prospectos_raw.telefono_1
+        )
+    """)
+    
+    for column, value in filters.items():
+        if isinstance(value, list):
+            if None in value:
+                value_list = [v for v in value if v is not None]
+                if value_list:
+                    placeholders = ','.join(['%s'] * len(value_list))
+                    where_clauses.append(f"({column} IN ({placeholders}) OR {column} IS NULL)")
+                    params.extend(value_list)
+                else:
+                    where_clauses.append(f"{column} IS NULL")
+            else:
+                placeholders = ','.join(['%s'] * len(value))
+                where_clauses.append(f"{column} IN ({placeholders})")
+                params.extend(value)
+    
+    where_sql = ' AND '.join(where_clauses) if where_clauses else '1=1'
+    return where_sql, params, sort_column, sort_order
+
 @prospectos_bp.route('/api/list')
 def list_prospectos():
     """API para listar prospectos con paginación y filtros"""
@@ -64,29 +149,7 @@ def list_prospectos():
         page = int(request.args.get('page', 1))
         page_size = int(request.args.get('page_size', 50))
         
-        # Ordenamiento
-        sort_column = request.args.get('sort_column', 'created_at')
-        sort_order = request.args.get('sort_order', 'DESC')
-        
-        # Validar columnas permitidas para ordenar
-        valid_sort_columns = ['nombre', 'apellidos', 'email_1', 'telefono_1', 
-                             'programa', 'propietario', 'fecha_creacion', 'created_at']
-        if sort_column not in valid_sort_columns:
-            sort_column = 'created_at'
-        
-        # Validar orden
-        if sort_order.upper() not in ['ASC', 'DESC']:
-            sort_order = 'DESC'
-        
-        # Filtros
-        filters = {}
-        for key in ['nombre', 'apellidos', 'email_1', 'telefono_1', 'programa', 'propietario']:
-            value = request.args.get(key)
-            if value:
-                try:
-                    filters[key] = json.loads(value)
-                except:
-                    filters[key] = value
+        where_sql, params, sort_column, sort_order = _list_query(request.args)
         
         conn = get_db_connection()
         if not conn:
@@ -113,34 +176,6 @@ def list_prospectos():
                 'total_pages': 0
             })
         
-        where_clauses = []
-        params = []
-        
-        # FILTRO: Excluir prospectos que ya fueron activados (que existen en leads)
-        where_clauses.append("""
-            NOT EXISTS (
-                SELECT 1 FROM leads 
-                WHERE leads.telefono = prospectos_raw.telefono_1
-            )
-        """)
-        
-        for column, value in filters.items():
-            if isinstance(value, list):
-                if None in value:
-                    value_list = [v for v in value if v is not None]
-                    if value_list:
-                        placeholders = ','.join(['%s'] * len(value_list))
-                        where_clauses.append(f"({column} IN ({placeholders}) OR {column} IS NULL)")
-                        params.extend(value_list)
-                    else:
-                        where_clauses.append(f"{column} IS NULL")
-                else:
-                    placeholders = ','.join(['%s'] * len(value))
-                    where_clauses.append(f"{column} IN ({placeholders})")
-                    params.extend(value)
-        
-        where_sql = ' AND '.join(where_clauses) if where_clauses else '1=1'
-        
         cursor.execute(f"SELECT COUNT(*) as total FROM prospectos_raw WHERE {where_sql}", params)
         total = cursor.fetchone()['total']
         
@@ -183,10 +218,50 @@ def list_prospectos():
             'total_pages': 0
         })
 
+@prospectos_bp.route('/api/export')
+def export_prospectos():
+    """Descarga CSV/XLSX de los prospectos con los mismos filtros y orden que /api/list"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export_formats():
+        return jsonify({'success': False, 'error': f"Formato no soportado: {fmt}"}), 400
+    
+    try:
+        where_sql, params, sort_column, sort_order = _list_query(request.args)
+        
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('prospectos_raw') IS NOT NULL AS exists")
+        table_exists = cursor.fetchone()['exists']
+        cursor.close()
+        
+        if not table_exists:
+            conn.close()
+            return export_response(fmt, 'prospectos', EXPORT_COLUMNS, [], sheet_title='Prospectos')
+        
+        # id como desempate: el orden es estable aunque sort_column se repita
+        rows = iter_query(conn, f"""
+            SELECT id, nombre, apellidos, email_1, email_2, telefono_1, telefono_2, rut,
+                   programa, carrera_postula, experiencia, urgencia, propietario, canal,
+                   fecha_creacion, lote_importacion, fecha_importacion
+            FROM prospectos_raw
+            WHERE {where_sql}
+            ORDER BY {sort_column} {sort_order}, id
+        """, params)
+        return export_response(fmt, 'prospectos', EXPORT_COLUMNS, rows, sheet_title='Prospectos')
+    
+    except Exception as e:
+        print(f"Error in export_prospectos: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 
 @prospectos_bp.route('/api/column-values')
 def get_column_values():
-    """Obtiene valores únicos de una columna para filtros"""
+    """Obtiene valores únicos de una columna para filtros (desde la caché de facetas)"""
     try:
         column = request.args.get('column')
         if not column:
@@ -196,56 +271,98 @@ def get_column_values():
         if column not in valid_columns:
             return jsonify({'success': False, 'error': 'Invalid column'}), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor()
-        
-        query = f"""
-            SELECT DISTINCT {column} as value
-            FROM prospectos_raw
-            WHERE {column} IS NOT NULL
-              AND NOT EXISTS (
-                SELECT 1 FROM leads 
-                WHERE leads.telefono = prospectos_raw.telefono_1
-              )
-            ORDER BY {column}
-            LIMIT 500
-        """
-        cursor.execute(query)
+        # prefix: búsqueda dentro de la faceta para columnas con muchos valores
+        prefix = request.args.get('prefix', '').strip() or None
+        limit = min(int(request.args.get('limit', 500)), 2000)
         
-        results = cursor.fetchall()
-        values = [row['value'] for row in results]
+        facet = facet_cache.values('prospectos', column, prefix=prefix, limit=limit)
+        if facet is None:
+            # Se está construyendo en segundo plano (ver facets.FacetCache._fresh)
+            return jsonify({'success': False, 'error': 'Facet cache unavailable, retry shortly'}), 503
         
-        cursor.execute(f"""
-            SELECT COUNT(*) as count 
-            FROM prospectos_raw 
-            WHERE {column} IS NULL
-              AND NOT EXISTS (
-                SELECT 1 FROM leads 
-                WHERE leads.telefono = prospectos_raw.telefono_1
-              )
-        """)
-        null_count = cursor.fetchone()['count']
-        if null_count > 0:
+        values = [item['value'] for item in facet['items']]
+        if facet['null_count'] > 0:
             values.append(None)
         
-        cursor.close()
-        conn.close()
-        
         return jsonify({
             'success': True,
-            'values': values
+            'values': values,
+            'counts': [item['count'] for item in facet['items']] + ([facet['null_count']] if facet['null_count'] > 0 else []),
+            'truncated': facet['truncated']
         })
         
     except Exception as e:
         print(f"Error in get_column_values: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _cache_upload(upload_id, filepath, sheet=None, sheets=None):
+    """
+    Leer el archivo una sola vez a la caché del upload (la vista previa, la
+    revisión de duplicados y la importación leen la caché)
+
+    Returns:
+        (vista previa, details del upload)
+    """
+    cache_path = f"{filepath}.rows.jsonl"
+    preview = FileProcessor.write_cache(filepath, cache_path, sheet)
+    details = {'cache': cache_path, 'sheet': sheet, 'total_rows': preview['total_rows']}
+    if sheets is not None:
+        details['sheets'] = sheets
+    uploads.update_details(upload_id, details)
+    return preview, details
+
+def _upload_rows(filepath, details, column_mapping):
+    """Filas mapeadas de un upload, desde la caché si existe"""
+    details = details or {}
+    return FileProcessor.iter_mapped(filepath, column_mapping, details.get('cache'), details.get('sheet'))
+
+def _preview_response(file_id, filename, filepath, preview, details):
+    suggested_mapping = FileProcessor.suggest_mapping(
+        preview['columns'], 
+        TARGET_FIELDS
+    )
+    
+    # Convertir NaN a None para serialización JSON
+    import math
+    def clean_nan(obj):
+        if isinstance(obj, dict):
+            return {k: clean_nan(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [clean_nan(item) for item in obj]
+        elif isinstance(obj, float) and math.isnan(obj):
+            return None
+        return obj
+    
+    preview_clean = clean_nan(preview)
+    suggested_mapping_clean = clean_nan(suggested_mapping)
+    
+    # Duplicados con el mapeo sugerido; la vista previa no falla si no se pueden contar
+    try:
+        duplicates = _duplicate_report(filepath, details, suggested_mapping)
+    except Exception as e:
+        print(f"No se pudieron contar duplicados: {e}")
+        duplicates = None
+    
+    return {
+        'success': True,
+        'file_id': file_id,
+        'filename': filename,
+        'preview': preview_clean,
+        'sheets': details.get('sheets') or [],
+        'sheet': details.get('sheet'),
+        'suggested_mapping': suggested_mapping_clean,
+        'target_fields': list(TARGET_FIELDS.keys()),
+        'duplicates': duplicates,
+        'duplicate_modes': list(dedupe.DUPLICATE_MODES)
+    }
+
 @prospectos_bp.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Endpoint para subir archivo y obtener vista previa"""
+    """
+    Endpoint para subir archivo y obtener vista previa
+
+    sheet (opcional): hoja de un Excel; por defecto la primera
+    """
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'error': 'No file provided'}), 400
@@ -266,41 +383,45 @@ def upload_file():
         filepath = os.path.join(UPLOAD_FOLDER, f"{file_id}_{filename}")
         file.save(filepath)
         
-        session['upload_file'] = filepath
-        session['upload_filename'] = filename
-        session['upload_id'] = file_id
+        uploads.register(file_id, filepath, filename)
         
-        preview = FileProcessor.get_preview(filepath, rows=5)
-        suggested_mapping = FileProcessor.suggest_mapping(
-            preview['columns'], 
-            TARGET_FIELDS
-        )
+        sheets = FileProcessor.sheet_names(filepath)
+        sheet = request.form.get('sheet') or None
+        if sheet is not None and sheet not in sheets:
+            return jsonify({'success': False, 'error': f"Hoja no encontrada: {sheet}"}), 400
         
-        # Convertir NaN a None para serialización JSON
-        import math
-        def clean_nan(obj):
-            if isinstance(obj, dict):
-                return {k: clean_nan(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [clean_nan(item) for item in obj]
-            elif isinstance(obj, float) and math.isnan(obj):
-                return None
-            return obj
+        preview, details = _cache_upload(file_id, filepath, sheet or (sheets[0] if sheets else None), sheets)
+        return jsonify(_preview_response(file_id, filename, filepath, preview, details))
+    
+    except Exception as e:
+        print(f"Error in upload_file: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@prospectos_bp.route('/api/upload/sheet', methods=['POST'])
+def select_sheet():
+    """Cambiar la hoja del Excel subido y obtener su vista previa"""
+    try:
+        data = request.get_json() or {}
+        file_id = data.get('file_id')
+        sheet = data.get('sheet')
         
-        preview_clean = clean_nan(preview)
-        suggested_mapping_clean = clean_nan(suggested_mapping)
+        upload = uploads.get(file_id) if file_id else None
+        if not upload:
+            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+        if not os.path.exists(upload['filepath']):
+            return jsonify({'success': False, 'error': 'File not found'}), 404
         
-        return jsonify({
-            'success': True,
-            'file_id': file_id,
-            'filename': filename,
-            'preview': preview_clean,
-            'suggested_mapping': suggested_mapping_clean,
-            'target_fields': list(TARGET_FIELDS.keys())
-        })
+        sheets = (upload['details'] or {}).get('sheets') or []
+        if sheet not in sheets:
+            return jsonify({'success': False, 'error': f"Hoja no encontrada: {sheet}"}), 400
+        
+        preview, details = _cache_upload(file_id, upload['filepath'], sheet, sheets)
+        return jsonify(_preview_response(file_id, upload['filename'], upload['filepath'], preview, details))
     
     except Exception as e:
-        print(f"Error in upload_file: {str(e)}")
+        print(f"Error in select_sheet: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -338,9 +459,9 @@ def create_prospecto():
                 values.append(data[field])
         
         # Agregar metadatos
+        lote_id = f"manual_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         columns.extend(['archivo_origen', 'lote_importacion', 'fecha_creacion'])
-        values.extend(['Manual', f"manual_{datetime.now().strftime('%Y%m%d_%H%M%S')}", 
-                      datetime.now().strftime('%Y-%m-%d')])
+        values.extend(['Manual', lote_id, datetime.now().strftime('%Y-%m-%d')])
         
         if not columns:
             return jsonify({'success': False, 'error': 'No hay datos para insertar'}), 400
@@ -349,8 +470,9 @@ def create_prospecto():
         columns_str = ', '.join(columns)
         
         query = f"INSERT INTO prospectos_raw ({columns_str}) VALUES ({placeholders}) RETURNING id"
-        cursor.execute(query, values)
-        result = cursor.fetchone()
+        with track_facets(cursor, 'prospectos', "lote_importacion = %s", [lote_id]):
+            cursor.execute(query, values)
+            result = cursor.fetchone()
         prospecto_id = result['id'] if isinstance(result, dict) else result[0]
         
         conn.commit()
@@ -369,82 +491,230 @@ def create_prospecto():
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _connect_dedupe():
+    # normalize_phone_cl, duplicado_de/duplicado_lead y los índices de claves los crea init_db.py
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    return conn
+
+def _target_mapping(column_mapping):
+    # Solo campos conocidos: las claves del mapeo terminan como columnas del INSERT
+    return {field: column for field, column in (column_mapping or {}).items() if field in TARGET_FIELDS}
+
+def _duplicate_report(filepath, details, column_mapping):
+    """Conteo de duplicados del archivo con un mapeo (solo lectura)"""
+    keys = [dedupe.record_keys(record)
+            for record in _upload_rows(filepath, details, _target_mapping(column_mapping))]
+    conn = _connect_dedupe()
+    try:
+        cursor = conn.cursor()
+        matches = dedupe.find_duplicates(cursor, keys)
+        cursor.close()
+    finally:
+        # Descarta la tabla temporal
+        conn.rollback()
+        conn.close()
+    return dedupe.summarize(matches)
+
+def _import_row(record, filename, lote_id):
+    record = dict(record)
+    # Las columnas son de texto: un Excel entrega números (teléfonos, RUT) y
+    # un VALUES de varias filas no admite números y texto en la misma columna
+    for field in TARGET_FIELDS:
+        if record.get(field) is not None:
+            record[field] = dedupe.text_value(record[field])
+    record['archivo_origen'] = filename
+    record['lote_importacion'] = lote_id
+    if record.get('datos_adicionales'):
+        record['datos_adicionales'] = json.dumps(record['datos_adicionales'])
+    return tuple(record.get(column) for column in IMPORT_COLUMNS)
+
+def _insert_records(cursor, rows):
+    """
+    INSERT de varias filas por bloque; si un bloque falla se reintenta fila
+    por fila para omitir solo las inválidas
+
+    Returns:
+        (insertadas, errores)
+    """
+    query = f"INSERT INTO prospectos_raw ({', '.join(IMPORT_COLUMNS)}) VALUES %s"
+    inserted, errors = 0, 0
+    for start in range(0, len(rows), IMPORT_CHUNK_ROWS):
+        chunk = rows[start:start + IMPORT_CHUNK_ROWS]
+        cursor.execute("SAVEPOINT import_chunk")
+        try:
+            execute_values(cursor, query, chunk, template=IMPORT_TEMPLATE, page_size=len(chunk))
+            cursor.execute("RELEASE SAVEPOINT import_chunk")
+            inserted += len(chunk)
+            continue
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT import_chunk")
+            cursor.execute("RELEASE SAVEPOINT import_chunk")
+            print(f"Bloque con errores ({e}); reintentando fila por fila")
+        
+        for row in chunk:
+            cursor.execute("SAVEPOINT import_row")
+            try:
+                execute_values(cursor, query, [row], template=IMPORT_TEMPLATE)
+                inserted += 1
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT import_row")
+                print(f"Error en fila: {str(e)}")
+                errors += 1
+            cursor.execute("RELEASE SAVEPOINT import_row")
+    return inserted, errors
+
+@prospectos_bp.route('/api/import/check', methods=['POST'])
+def check_import():
+    """Duplicados del archivo subido con el mapeo elegido (antes de confirmar)"""
+    try:
+        data = request.get_json() or {}
+        file_id = data.get('file_id')
+        
+        upload = uploads.get(file_id) if file_id else None
+        if not upload:
+            return jsonify({'success': False, 'error': 'No file uploaded'}), 400
+        if not os.path.exists(upload['filepath']):
+            return jsonify({'success': False, 'error': 'File not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'duplicates': _duplicate_report(upload['filepath'], upload['details'], data.get('mapping', {}))
+        })
+    except Exception as e:
+        print(f"Error en check_import: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @prospectos_bp.route('/api/import', methods=['POST'])
 def import_data():
-    """Endpoint para importar datos con el mapeo confirmado"""
+    """
+    Endpoint para importar datos con el mapeo confirmado
+
+    duplicates: 'flag' (por defecto, importa y marca duplicado_de/duplicado_lead),
+    'skip' (no importa los duplicados) o 'merge' (completa el prospecto existente)
+    """
     try:
         data = request.get_json()
-        column_mapping = data.get('mapping', {})
+        column_mapping = _target_mapping(data.get('mapping', {}))
+        file_id = data.get('file_id')
+        duplicate_mode = data.get('duplicates') or 'flag'
         
-        if 'upload_file' not in session:
+        if duplicate_mode not in dedupe.DUPLICATE_MODES:
+            return jsonify({
+                'success': False,
+                'error': f"duplicates inválido (permitidos: {', '.join(dedupe.DUPLICATE_MODES)})"
+            }), 400
+        
+        upload = uploads.get(file_id) if file_id else None
+        if not upload:
             return jsonify({'success': False, 'error': 'No file uploaded'}), 400
         
-        filepath = session['upload_file']
-        filename = session.get('upload_filename', 'unknown')
+        filepath = upload['filepath']
+        filename = upload['filename']
         
         if not os.path.exists(filepath):
             return jsonify({'success': False, 'error': 'File not found'}), 404
         
-        mapped_data = FileProcessor.process_and_map(filepath, column_mapping)
-        lote_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{session.get('upload_id', 'unknown')}"
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        details = upload['details'] or {}
+        lote_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{file_id}"
         
+        conn = _connect_dedupe()
         cursor = conn.cursor()
-        inserted_count = 0
         
-        for record in mapped_data:
-            try:
-                record['archivo_origen'] = filename
-                record['lote_importacion'] = lote_id
-                datos_adicionales = record.pop('datos_adicionales', None)
-                
-                columns = []
-                values = []
+        # Las filas se leen de la caché por pasadas en lugar de tenerlas en
+        # memoria: primero solo las claves de duplicado
+        matches = dedupe.find_duplicates(cursor, (
+            dedupe.record_keys(record) for record in _upload_rows(filepath, details, column_mapping)
+        ))
+        
+        # merge: las filas repetidas solo dentro del archivo completan la
+        # primera antes de que se inserte o combine; si esa primera fila se
+        # omite (es un lead) sus repetidas se omiten con ella
+        file_fills = {}
+        if duplicate_mode == 'merge':
+            rows = _upload_rows(filepath, details, column_mapping)
+            for index, (record, match) in enumerate(zip(rows, matches)):
+                if match['archivo'] is not None and match['prospecto'] is None and match['lead'] is None:
+                    root = dedupe.file_root(matches, index)
+                    if not dedupe.omitted_in_merge(matches[root]):
+                        dedupe.fill_empty(file_fills.setdefault(root, {}), record)
+        merge_ids = sorted({match['prospecto'] for match in matches if match['prospecto'] is not None}) \
+            if duplicate_mode == 'merge' else []
+        
+        merges = {}
+        skipped = merged = 0
+        inserted_count = error_count = 0
+        batch = []
+        
+        def insert_batch():
+            nonlocal inserted_count, error_count
+            inserted, errors = _insert_records(cursor, batch)
+            inserted_count += inserted
+            error_count += errors
+            batch.clear()
+        
+        # Las facetas se actualizan con el conteo de las filas nuevas del lote
+        # y de los prospectos completados
+        with track_facets(cursor, 'prospectos', "lote_importacion = %s", [lote_id]), \
+             track_facets(cursor, 'prospectos', "id = ANY(%s)", [merge_ids]):
+            rows = _upload_rows(filepath, details, column_mapping)
+            for index, (record, match) in enumerate(zip(rows, matches)):
+                if index in file_fills:
+                    dedupe.fill_empty(record, file_fills.pop(index))
                 
-                for key, value in record.items():
-                    if key and value is not None:
-                        columns.append(key)
-                        values.append(value)
-                
-                if datos_adicionales:
-                    columns.append('datos_adicionales')
-                    values.append(json.dumps(datos_adicionales))
-                
-                if not columns:
-                    continue
-                
-                placeholders = ', '.join(['%s'] * len(values))
-                columns_str = ', '.join(columns)
-                
-                query = f"INSERT INTO prospectos_raw ({columns_str}) VALUES ({placeholders})"
-                cursor.execute(query, values)
-                inserted_count += 1
+                if duplicate_mode == 'flag':
+                    record['duplicado_de'] = match['prospecto']
+                    record['duplicado_lead'] = match['lead']
+                    batch.append(_import_row(record, filename, lote_id))
+                elif not dedupe.is_duplicate(match):
+                    batch.append(_import_row(record, filename, lote_id))
+                elif duplicate_mode == 'merge' and match['prospecto'] is not None:
+                    if match['prospecto'] in merges:
+                        dedupe.fill_empty(merges[match['prospecto']], record)
+                    else:
+                        merges[match['prospecto']] = record
+                    merged += 1
+                elif duplicate_mode == 'merge' and match['lead'] is None and \
+                        not dedupe.omitted_in_merge(matches[dedupe.file_root(matches, index)]):
+                    # Ya completó la primera fila del archivo
+                    merged += 1
+                else:
+                    skipped += 1
                 
-            except Exception as e:
-                print(f"Error en fila: {str(e)}")
-                continue
+                if len(batch) >= IMPORT_CHUNK_ROWS:
+                    insert_batch()
+            if batch:
+                insert_batch()
+            dedupe.merge_into_existing(cursor, merges)
+        
+        if duplicate_mode == 'flag':
+            dedupe.flag_file_duplicates(cursor, lote_id)
         
         conn.commit()
         cursor.close()
         conn.close()
         
-        try:
-            os.remove(filepath)
-        except:
-            pass
+        uploads.remove(file_id)
         
-        session.pop('upload_file', None)
-        session.pop('upload_filename', None)
-        session.pop('upload_id', None)
+        message = f'Se importaron {inserted_count} registros exitosamente'
+        if skipped:
+            message += f' ({skipped} duplicados omitidos)'
+        if merged:
+            message += f' ({merged} duplicados combinados con prospectos existentes)'
         
         return jsonify({
             'success': True,
-            'message': f'Se importaron {inserted_count} registros exitosamente',
+            'message': message,
             'lote_id': lote_id,
-            'imported_count': inserted_count
+            'imported_count': inserted_count,
+            'error_count': error_count,
+            'skipped_count': skipped,
+            'merged_count': merged,
+            'duplicates': dedupe.summarize(matches),
+            'duplicate_mode': duplicate_mode
         })
     
     except Exception as e:
@@ -453,6 +723,96 @@ def import_data():
         traceback.print_exc()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@prospectos_bp.route('/api/lotes')
+def list_lotes():
+    """Lotes de importación con su cantidad de filas y la eliminación en curso, si hay"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        
+        conn = lotes.connect()
+        try:
+            cursor = conn.cursor()
+            rows = lotes.list_lotes(cursor, limit)
+            cursor.close()
+        finally:
+            conn.close()
+        
+        running = {job['reference']: job for job in reversed(jobs.list(lotes.JOB_TYPE, limit=50))
+                   if job['status'] in ('pending', 'running')}
+        return jsonify({
+            'success': True,
+            'lotes': [{**row, 'eliminacion': running.get(row['lote_id'])} for row in rows]
+        })
+    
+    except Exception as e:
+        print(f"Error en list_lotes: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@prospectos_bp.route('/api/lotes/<lote_id>')
+def get_lote(lote_id):
+    """Filas, activadas y duplicadas de un lote, con sus eliminaciones"""
+    try:
+        conn = lotes.connect()
+        try:
+            cursor = conn.cursor()
+            summary = lotes.lote_summary(cursor, lote_id)
+            cursor.close()
+        finally:
+            conn.close()
+        
+        deletions = jobs.list(lotes.JOB_TYPE, lote_id, limit=5)
+        if not summary and not deletions:
+            return jsonify({'success': False, 'error': 'Lote no encontrado'}), 404
+        
+        return jsonify({
+            'success': True,
+            'lote': summary,
+            'eliminaciones': deletions
+        })
+    
+    except Exception as e:
+        print(f"Error en get_lote: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@prospectos_bp.route('/api/lotes/<lote_id>', methods=['DELETE'])
+def delete_lote(lote_id):
+    """
+    Eliminar un lote por bloques en segundo plano (202 con job_id)
+
+    activados: 'refuse' (por defecto, 409 si el lote tiene prospectos ya
+    activados), 'keep' (los conserva) o 'cascade' (elimina también sus leads)
+    """
+    try:
+        activados = request.args.get('activados') or (request.get_json(silent=True) or {}).get('activados') or 'refuse'
+        result, status = lotes.LoteDeletion(lote_id, activados).start()
+        return jsonify(result), status
+    
+    except Exception as e:
+        print(f"Error en delete_lote: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@prospectos_bp.route('/api/lotes/jobs/<job_id>')
+def get_lote_job(job_id):
+    """Progreso, throughput y ETA de una eliminación de lote"""
+    try:
+        job = jobs.get(job_id)
+        
+        if not job or job['type'] != lotes.JOB_TYPE:
+            return jsonify({'success': False, 'error': 'Eliminación no encontrada'}), 404
+        
+        return jsonify({
+            'success': True,
+            'job': job
+        })
+    
+    except Exception as e:
+        print(f"Error en get_lote_job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @prospectos_bp.route('/api/activar', methods=['POST'])
 def activar_prospectos():
     """Activa prospectos seleccionados y los pasa a la tabla leads"""
@@ -470,111 +830,116 @@ def activar_prospectos():
         cursor = conn.cursor()
         
         # Obtener prospectos
-        placeholders = ','.join(['%s'] * len(ids))
-        query = f"""
+        query = """
             SELECT id, nombre, apellidos, email_1, telefono_1, programa, 
                    propietario, carrera_postula, experiencia, urgencia, canal
             FROM prospectos_raw
-            WHERE id IN ({placeholders})
+            WHERE id = ANY(%s::bigint[])
         """
-        cursor.execute(query, ids)
+        cursor.execute(query, (list(ids),))
         prospectos = cursor.fetchall()
         
         activated = 0
         skipped = 0
         errors = []
         
-        for prospecto in prospectos:
-            # Normalizar teléfono
-            session_id = normalize_phone(prospecto['telefono_1'])
-            
-            if not session_id:
-                skipped += 1
-                errors.append(f"ID {prospecto['id']}: teléfono inválido")
-                print(f"⚠️ Prospecto ID {prospecto['id']} teléfono inválido: '{prospecto['telefono_1']}'")
-                continue
-            
-            print(f"✓ Normalizando: {prospecto['telefono_1']} → {session_id}")
-            
-            try:
-                # Mapear experiencia a integer si es posible
-                experiencia_int = None
-                if prospecto['experiencia']:
-                    try:
-                        # Intentar extraer número de la experiencia
-                        exp_str = str(prospecto['experiencia'])
-                        exp_num = re.search(r'\d+', exp_str)
-                        if exp_num:
-                            experiencia_int = int(exp_num.group())
-                    except:
-                        pass
-                
-                # Mapear nivel de intención según urgencia
-                nivel_intencion_map = {
-                    'alta': 'decidido',
-                    'media': 'explorando',
-                    'baja': 'cotizando',
-                    'muy alta': 'listo',
-                    'inmediata': 'listo'
-                }
+        # Los prospectos activados salen de las facetas de prospectos (todas las filas
+        # con ese teléfono) y entran o cambian en las de leads
+        telefonos = [p['telefono_1'] for p in prospectos if p['telefono_1']]
+        session_ids = [sid for sid in (normalize_phone(t) for t in telefonos) if sid]
+        with track_facets(cursor, 'prospectos', "telefono_1 = ANY(%s)", [telefonos]), \
+             track_facets(cursor, 'leads', "session_id = ANY(%s)", [session_ids]):
+            for prospecto in prospectos:
+                # Normalizar teléfono
+                session_id = normalize_phone(prospecto['telefono_1'])
                 
-                urgencia_lower = (prospecto['urgencia'] or '').lower()
-                nivel_intencion = None
-                for key, value in nivel_intencion_map.items():
-                    if key in urgencia_lower:
-                        nivel_intencion = value
-                        break
-                
-                # Insertar en leads usando tu esquema exacto
-                cursor.execute("""
-                    INSERT INTO leads (
-                        session_id, nombre, apellido, email, telefono,
-                        carrera_interes, experiencia_laboral, plan,
-                        nivel_intencion, estado, canal_origen
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (session_id) DO UPDATE SET
-                        nombre = EXCLUDED.nombre,
-                        apellido = EXCLUDED.apellido,
-                        email = EXCLUDED.email,
-                        telefono = EXCLUDED.telefono,
-                        carrera_interes = EXCLUDED.carrera_interes,
-                        experiencia_laboral = EXCLUDED.experiencia_laboral,
-                        plan = EXCLUDED.plan,
-                        nivel_intencion = EXCLUDED.nivel_intencion,
-                        canal_origen = EXCLUDED.canal_origen,
-                        updated_at = NOW()
-                """, (
-                    session_id,                          # session_id (VARCHAR)
-                    prospecto['nombre'],                 # nombre
-                    prospecto['apellidos'],              # apellido
-                    prospecto['email_1'],                # email
-                    prospecto['telefono_1'],             # telefono (original)
-                    prospecto['carrera_postula'],        # carrera_interes
-                    experiencia_int,                     # experiencia_laboral (INTEGER)
-                    prospecto['programa'],               # plan (Regular/Especial)
-                    nivel_intencion,                     # nivel_intencion
-                    'nuevo',                             # estado
-                    prospecto['canal'] or 'importacion' # canal_origen
-                ))
-                
-                # Actualizar estado en prospectos_raw
-                cursor.execute("""
-                    UPDATE prospectos_raw 
-                    SET estado = 'activado', updated_at = NOW()
-                    WHERE id = %s
-                """, (prospecto['id'],))
+                if not session_id:
+                    skipped += 1
+                    errors.append(f"ID {prospecto['id']}: teléfono inválido")
+                    print(f"⚠️ Prospecto ID {prospecto['id']} teléfono inválido: '{prospecto['telefono_1']}'")
+                    continue
                 
-                activated += 1
-                print(f"✅ Prospecto ID {prospecto['id']} → Lead {session_id}")
+                print(f"✓ Normalizando: {prospecto['telefono_1']} → {session_id}")
                 
-            except Exception as e:
-                skipped += 1
-                error_msg = f"ID {prospecto['id']}: {str(e)}"
-                errors.append(error_msg)
-                print(f"❌ Error: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                continue
+                try:
+                    # Mapear experiencia a integer si es posible
+                    experiencia_int = None
+                    if prospecto['experiencia']:
+                        try:
+                            # Intentar extraer número de la experiencia
+                            exp_str = str(prospecto['experiencia'])
+                            exp_num = re.search(r'\d+', exp_str)
+                            if exp_num:
+                                experiencia_int = int(exp_num.group())
+                        except:
+                            pass
+                    
+                    # Mapear nivel de intención según urgencia
+                    nivel_intencion_map = {
+                        'alta': 'decidido',
+                        'media': 'explorando',
+                        'baja': 'cotizando',
+                        'muy alta': 'listo',
+                        'inmediata': 'listo'
+                    }
+                    
+                    urgencia_lower = (prospecto['urgencia'] or '').lower()
+                    nivel_intencion = None
+                    for key, value in nivel_intencion_map.items():
+                        if key in urgencia_lower:
+                            nivel_intencion = value
+                            break
+                    
+                    # Insertar en leads usando tu esquema exacto
+                    cursor.execute("""
+                        INSERT INTO leads (
+                            session_id, nombre, apellido, email, telefono,
+                            carrera_interes, experiencia_laboral, plan,
+                            nivel_intencion, estado, canal_origen
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (session_id) DO UPDATE SET
+                            nombre = EXCLUDED.nombre,
+                            apellido = EXCLUDED.apellido,
+                            email = EXCLUDED.email,
+                            telefono = EXCLUDED.telefono,
+                            carrera_interes = EXCLUDED.carrera_interes,
+                            experiencia_laboral = EXCLUDED.experiencia_laboral,
+                            plan = EXCLUDED.plan,
+                            nivel_intencion = EXCLUDED.nivel_intencion,
+                            canal_origen = EXCLUDED.canal_origen,
+                            updated_at = NOW()
+                    """, (
+                        session_id,                          # session_id (VARCHAR)
+                        prospecto['nombre'],                 # nombre
+                        prospecto['apellidos'],              # apellido
+                        prospecto['email_1'],                # email
+                        prospecto['telefono_1'],             # telefono (original)
+                        prospecto['carrera_postula'],        # carrera_interes
+                        experiencia_int,                     # experiencia_laboral (INTEGER)
+                        prospecto['programa'],               # plan (Regular/Especial)
+                        nivel_intencion,                     # nivel_intencion
+                        'nuevo',                             # estado
+                        prospecto['canal'] or 'importacion' # canal_origen
+                    ))
+                    
+                    # Actualizar estado en prospectos_raw
+                    cursor.execute("""
+                        UPDATE prospectos_raw 
+                        SET estado = 'activado', updated_at = NOW()
+                        WHERE id = %s
+                    """, (prospecto['id'],))
+                    
+                    activated += 1
+                    print(f"✅ Prospecto ID {prospecto['id']} → Lead {session_id}")
+                    
+                except Exception as e:
+                    skipped += 1
+                    error_msg = f"ID {prospecto['id']}: {str(e)}"
+                    errors.append(error_msg)
+                    print(f"❌ Error: {str(e)}")
+                    import traceback
+                    traceback.print_exc()
+                    continue
         
         conn.commit()
         cursor.close()
@@ -610,27 +975,18 @@ def activar_prospectos():
             'skipped': 0
         }), 500
     
+def _stats_version():
+    # Versión de la caché de facetas: cambia con cada import/activación sin recorrer las tablas
+    return facet_cache.version('prospectos')
+
 @prospectos_bp.route('/api/stats')
+@conditional(_stats_version)
 def get_stats():
-    """Obtiene estadísticas de prospectos"""
+    """Obtiene estadísticas de prospectos (desde la caché de facetas)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'prospectos_raw'
-            );
-        """)
-        table_exists = cursor.fetchone()['exists']
-        
-        if not table_exists:
-            cursor.close()
-            conn.close()
+        # None si la caché no está disponible (p. ej. aún no existe prospectos_raw)
+        totals = facet_cache.totals('prospectos')
+        if not totals:
             return jsonify({
                 'success': True,
                 'stats': {
@@ -640,52 +996,22 @@ def get_stats():
                 }
             })
         
-        cursor.execute("""
-            SELECT COUNT(*) as total 
-            FROM prospectos_raw
-            WHERE NOT EXISTS (
-                SELECT 1 FROM leads 
-                WHERE leads.telefono = prospectos_raw.telefono_1
-            )
-        """)
-        total = cursor.fetchone()['total']
-        
-        cursor.execute("""
-            SELECT propietario, COUNT(*) as count 
-            FROM prospectos_raw 
-            WHERE propietario IS NOT NULL
-              AND NOT EXISTS (
-                SELECT 1 FROM leads 
-                WHERE leads.telefono = prospectos_raw.telefono_1
-              )
-            GROUP BY propietario 
-            ORDER BY count DESC 
-            LIMIT 5
-        """)
-        por_propietario = cursor.fetchall()
+        propietarios = facet_cache.values('prospectos', 'propietario', limit=5, order='count')
+        lotes = facet_cache.values('prospectos', 'lote_importacion', limit=5, order='first_at')
         
-        cursor.execute("""
-            SELECT lote_importacion, COUNT(*) as count, 
-                   MIN(fecha_importacion) as fecha
-            FROM prospectos_raw 
-            WHERE lote_importacion IS NOT NULL
-              AND NOT EXISTS (
-                SELECT 1 FROM leads 
-                WHERE leads.telefono = prospectos_raw.telefono_1
-              )
-            GROUP BY lote_importacion 
-            ORDER BY fecha DESC 
-            LIMIT 5
-        """)
-        ultimos_lotes = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
+        por_propietario = [
+            {'propietario': item['value'], 'count': item['count']}
+            for item in (propietarios['items'] if propietarios else [])
+        ]
+        ultimos_lotes = [
+            {'lote_importacion': item['value'], 'count': item['count'], 'fecha': item['first_at']}
+            for item in (lotes['items'] if lotes else [])
+        ]
         
         return jsonify({
             'success': True,
             'stats': {
-                'total': total,
+                'total': totals['total'],
                 'por_propietario': por_propietario,
                 'ultimos_lotes': ultimos_lotes
             }
@@ -0,0 +1,239 @@
+"""
+Detección de duplicados al importar prospectos
+
+Una fila es duplicada si comparte teléfono normalizado (569XXXXXXXX), email
+en minúsculas o RUT normalizado con una fila anterior del mismo archivo,
+con un prospecto existente o con un lead. Las claves de la base se comparan
+por índices de expresión (no hay columnas que rellenar ni mantener, y
+cubren también lo que escribe n8n; los crea init_db.py); las del archivo
+se cargan en una tabla temporal y se cruzan con un join por clave.
+
+Modos de importación:
+- flag: se importan todas y se marcan duplicado_de (prospecto) y
+  duplicado_lead (lead)
+- skip: los duplicados no se importan
+- merge: los duplicados completan los campos vacíos del prospecto existente
+  (o de la primera fila del archivo) en lugar de crear otra fila
+"""
+import json
+
+from psycopg2.extras import execute_values
+
+from utils.normalize import normalize_phone, normalize_rut
+
+DUPLICATE_MODES = ('flag', 'skip', 'merge')
+
+PHONE_KEY_SQL = "public.normalize_phone_cl({column})"
+EMAIL_KEY_SQL = "lower(btrim({column}))"
+RUT_KEY_SQL = "upper(regexp_replace({column}, '[^0-9kK]', '', 'g'))"
+
+# Campos que merge completa en el prospecto existente (solo si están vacíos)
+MERGE_FIELDS = [
+    'nombre', 'apellidos', 'propietario', 'canal', 'referrer', 'email_1', 'email_2',
+    'telefono_1', 'telefono_2', 'programa', 'rut', 'carrera_postula', 'experiencia', 'urgencia'
+]
+
+
+def text_value(value):
+    # Excel entrega teléfonos y RUT sin DV como float (912345678.0)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value) if value is not None else None
+
+
+def record_keys(record):
+    """Claves de duplicado de una fila mapeada: (teléfono, email, RUT), None si faltan"""
+    email = (text_value(record.get('email_1')) or '').strip().lower() or None
+    return (
+        normalize_phone(text_value(record.get('telefono_1'))),
+        email,
+        normalize_rut(text_value(record.get('rut')))
+    )
+
+
+def _file_duplicates(keys):
+    # Índice de la primera fila del archivo con alguna clave en común
+    first_seen = {}
+    firsts = []
+    for index, row_keys in enumerate(keys):
+        first = None
+        for kind, key in zip('ter', row_keys):
+            if key is None:
+                continue
+            seen = first_seen.setdefault((kind, key), index)
+            if seen != index and (first is None or seen < first):
+                first = seen
+        firsts.append(first)
+    return firsts
+
+
+def find_duplicates(cursor, keys):
+    """
+    Buscar duplicados de las filas de un archivo (en una transacción abierta)
+
+    Args:
+        keys: Claves de cada fila (record_keys), en el orden del archivo; se
+            reciben las claves y no las filas para no tener el archivo en memoria
+
+    Returns:
+        Lista paralela a keys con {'archivo': índice de la primera fila igual
+        o None, 'prospecto': id o None, 'lead': id o None}
+    """
+    keys = list(keys)
+    matches = [{'archivo': first, 'prospecto': None, 'lead': None} for first in _file_duplicates(keys)]
+
+    rows = [(index,) + row_keys for index, row_keys in enumerate(keys) if any(row_keys)]
+    if not rows:
+        return matches
+
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS import_keys (
+            fila INTEGER, telefono TEXT, email TEXT, rut TEXT
+        ) ON COMMIT DROP
+    """)
+    cursor.execute("TRUNCATE import_keys")
+    execute_values(cursor, "INSERT INTO import_keys VALUES %s", rows, page_size=1000)
+    cursor.execute("ANALYZE import_keys")
+
+    cursor.execute(f"""
+        SELECT fila, MIN(id) AS id FROM (
+            SELECT k.fila, p.id FROM import_keys k
+            JOIN prospectos_raw p ON {PHONE_KEY_SQL.format(column='p.telefono_1')} = k.telefono
+            UNION ALL
+            SELECT k.fila, p.id FROM import_keys k
+            JOIN prospectos_raw p ON {EMAIL_KEY_SQL.format(column='p.email_1')} = k.email
+            UNION ALL
+            SELECT k.fila, p.id FROM import_keys k
+            JOIN prospectos_raw p ON {RUT_KEY_SQL.format(column='p.rut')} = k.rut
+        ) m
+        GROUP BY fila
+    """)
+    for row in cursor.fetchall():
+        matches[row['fila']]['prospecto'] = row['id']
+
+    cursor.execute("SELECT to_regclass('leads') IS NOT NULL AS exists")
+    if cursor.fetchone()['exists']:
+        cursor.execute(f"""
+            SELECT fila, MIN(id) AS id FROM (
+                SELECT k.fila, l.id FROM import_keys k
+                JOIN leads l ON l.session_id = k.telefono
+                UNION ALL
+                SELECT k.fila, l.id FROM import_keys k
+                JOIN leads l ON {PHONE_KEY_SQL.format(column='l.telefono')} = k.telefono
+                UNION ALL
+                SELECT k.fila, l.id FROM import_keys k
+                JOIN leads l ON {EMAIL_KEY_SQL.format(column='l.email')} = k.email
+            ) m
+            GROUP BY fila
+        """)
+        for row in cursor.fetchall():
+            matches[row['fila']]['lead'] = row['id']
+
+    return matches
+
+
+def is_duplicate(match):
+    return match['archivo'] is not None or match['prospecto'] is not None or match['lead'] is not None
+
+
+def file_root(matches, index):
+    """
+    Primera fila del archivo a la que se suma una fila repetida
+
+    Sigue la cadena de 'archivo' (la fila igual puede ser a su vez repetida
+    de otra anterior) hasta una fila que no repite a ninguna.
+    """
+    while matches[index]['archivo'] is not None:
+        index = matches[index]['archivo']
+    return index
+
+
+def omitted_in_merge(match):
+    """Si la fila se omite en modo merge: coincide con un lead y con ningún prospecto"""
+    return match['lead'] is not None and match['prospecto'] is None
+
+
+def summarize(matches):
+    """Conteos para la vista previa"""
+    return {
+        'total': len(matches),
+        'duplicados': sum(1 for match in matches if is_duplicate(match)),
+        'en_archivo': sum(1 for match in matches if match['archivo'] is not None),
+        'en_prospectos': sum(1 for match in matches if match['prospecto'] is not None),
+        'en_leads': sum(1 for match in matches if match['lead'] is not None)
+    }
+
+
+def fill_empty(target, source):
+    """Completar en target los campos vacíos con los de source"""
+    for field in MERGE_FIELDS:
+        if target.get(field) in (None, '') and source.get(field) not in (None, ''):
+            target[field] = source[field]
+    extra = source.get('datos_adicionales')
+    if extra:
+        target['datos_adicionales'] = {**extra, **(target.get('datos_adicionales') or {})}
+
+
+def merge_into_existing(cursor, merges):
+    """
+    Completar prospectos existentes con los datos de filas duplicadas
+
+    Args:
+        merges: Dict {prospecto_id: record} (ya combinados si eran varias filas)
+
+    Returns:
+        Prospectos actualizados
+    """
+    if not merges:
+        return 0
+
+    rows = [
+        (prospecto_id, *[text_value(record.get(field)) for field in MERGE_FIELDS],
+         json.dumps(record['datos_adicionales']) if record.get('datos_adicionales') else None)
+        for prospecto_id, record in sorted(merges.items())
+    ]
+    assignments = ',\n            '.join(
+        f"{field} = COALESCE(NULLIF(p.{field}, ''), v.{field})" for field in MERGE_FIELDS
+    )
+    execute_values(cursor, f"""
+        UPDATE prospectos_raw p
+        SET {assignments},
+            datos_adicionales = CASE WHEN v.datos_adicionales IS NULL THEN p.datos_adicionales
+                                     ELSE v.datos_adicionales::jsonb || COALESCE(p.datos_adicionales, '{{}}'::jsonb) END
+        FROM (VALUES %s) v (id, {', '.join(MERGE_FIELDS)}, datos_adicionales)
+        WHERE p.id = v.id::bigint
+    """, rows, page_size=1000)
+    return len(rows)
+
+
+def flag_file_duplicates(cursor, lote_id):
+    """
+    Marcar duplicado_de en las filas de un lote que repiten una clave de
+    una fila anterior del mismo lote (las ya marcadas contra la base se respetan)
+    """
+    cursor.execute(f"""
+        WITH keys AS (
+            SELECT id, unnest(ARRAY[
+                't' || {PHONE_KEY_SQL.format(column='telefono_1')},
+                'e' || {EMAIL_KEY_SQL.format(column='email_1')},
+                'r' || {RUT_KEY_SQL.format(column='rut')}
+            ]) AS k
+            FROM prospectos_raw
+            WHERE lote_importacion = %s
+        ),
+        firsts AS (
+            SELECT id, MIN(first_id) AS first_id
+            FROM (
+                SELECT id, MIN(id) OVER (PARTITION BY k) AS first_id
+                FROM keys
+                WHERE k IS NOT NULL AND k NOT IN ('e', 'r')
+            ) w
+            WHERE first_id < id
+            GROUP BY id
+        )
+        UPDATE prospectos_raw p
+        SET duplicado_de = f.first_id
+        FROM firsts f
+        WHERE p.id = f.id AND p.duplicado_de IS NULL
+    """, (lote_id,))
+    return cursor.rowcount
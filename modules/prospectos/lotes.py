@@ -0,0 +1,237 @@
+"""
+Lotes de importación: listado y eliminación por bloques
+
+Un DELETE de un lote de 200k filas bloquea esas filas durante toda la
+transacción y deja el trabajo de limpieza para un solo VACUUM. La
+eliminación corre en segundo plano (background_jobs) y borra de a
+LOTE_DELETE_CHUNK_ROWS filas por transacción, así autovacuum recupera el
+espacio entre bloques y el progreso se puede consultar.
+
+Filas ya activadas (estado 'activado' o con un lead con ese teléfono):
+- refuse (por defecto): no se elimina el lote si tiene filas activadas
+- keep: se eliminan las demás y las activadas se conservan
+- cascade: se eliminan también los leads con ese teléfono, salvo los que
+  correspondan a prospectos de otros lotes
+"""
+import os
+
+from database import get_db_connection
+from facets import track_facets
+from utils.background_jobs import jobs, ProgressThrottle
+
+JOB_TYPE = 'lote_delete'
+
+ACTIVATED_MODES = ('refuse', 'keep', 'cascade')
+
+LOTE_DELETE_CHUNK_ROWS = int(os.getenv('LOTE_DELETE_CHUNK_ROWS', '5000'))
+
+
+def connect():
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
+    return conn
+
+
+def _leads_exist(cursor):
+    cursor.execute("SELECT to_regclass('leads') IS NOT NULL AS exists")
+    return cursor.fetchone()['exists']
+
+
+def _activated_sql(cursor):
+    """
+    Condición de fila activada sobre prospectos_raw p (el mismo criterio que /api/list)
+
+    Nunca es NULL: las filas importadas tienen estado NULL y NOT (NULL) las
+    dejaría fuera también de las no activadas.
+    """
+    activated = "p.estado IS NOT DISTINCT FROM 'activado'"
+    if not _leads_exist(cursor):
+        return activated
+    return f"({activated} OR EXISTS (SELECT 1 FROM leads l WHERE l.telefono = p.telefono_1))"
+
+
+def list_lotes(cursor, limit=100):
+    """
+    Lotes con su cantidad de filas, los más recientes primero
+
+    El conteo sale de idx_prospectos_raw_lote (index-only scan); el archivo
+    y la fecha se leen de una sola fila por lote.
+    """
+    cursor.execute("""
+        SELECT c.lote_id, c.total, f.archivo_origen, f.fecha_importacion
+        FROM (
+            SELECT lote_importacion AS lote_id, COUNT(*) AS total
+            FROM prospectos_raw
+            WHERE lote_importacion IS NOT NULL
+            GROUP BY lote_importacion
+        ) c
+        CROSS JOIN LATERAL (
+            SELECT archivo_origen, fecha_importacion
+            FROM prospectos_raw
+            WHERE lote_importacion = c.lote_id
+            LIMIT 1
+        ) f
+        ORDER BY f.fecha_importacion DESC NULLS LAST, c.lote_id DESC
+        LIMIT %s
+    """, (limit,))
+    return cursor.fetchall()
+
+
+def lote_summary(cursor, lote_id):
+    """Filas, activadas y duplicadas de un lote, o None si no existe"""
+    cursor.execute(f"""
+        SELECT COUNT(*) AS total,
+               COUNT(*) FILTER (WHERE {_activated_sql(cursor)}) AS activados,
+               COUNT(*) FILTER (WHERE p.duplicado_de IS NOT NULL OR p.duplicado_lead IS NOT NULL) AS duplicados,
+               MIN(p.archivo_origen) AS archivo_origen,
+               MIN(p.fecha_importacion) AS fecha_importacion
+        FROM prospectos_raw p
+        WHERE p.lote_importacion = %s
+    """, (lote_id,))
+    summary = cursor.fetchone()
+    if not summary['total']:
+        return None
+    return {'lote_id': lote_id, **summary}
+
+
+class LoteDeletion:
+    """Eliminación de un lote por bloques en segundo plano"""
+
+    def __init__(self, lote_id, activados='refuse', chunk_rows=LOTE_DELETE_CHUNK_ROWS):
+        self.lote_id = lote_id
+        self.activados = activados
+        self.chunk_rows = chunk_rows
+
+    def start(self):
+        """Validar la solicitud y lanzar la eliminación en segundo plano"""
+        if self.activados not in ACTIVATED_MODES:
+            return {
+                'success': False,
+                'error': f"activados inválido (permitidos: {', '.join(ACTIVATED_MODES)})"
+            }, 400
+
+        active = jobs.find_active(JOB_TYPE, self.lote_id)
+        if active:
+            return {'success': False, 'error': 'Ya hay una eliminación en curso para este lote', 'job': active}, 409
+
+        conn = connect()
+        try:
+            cursor = conn.cursor()
+            summary = lote_summary(cursor, self.lote_id)
+            cursor.close()
+        finally:
+            conn.close()
+
+        if not summary:
+            return {'success': False, 'error': 'Lote no encontrado'}, 404
+        if summary['activados'] and self.activados == 'refuse':
+            return {
+                'success': False,
+                'error': (f"El lote tiene {summary['activados']} prospectos ya activados; "
+                          f"usa activados=keep para conservarlos o activados=cascade para eliminar también sus leads"),
+                'lote': summary
+            }, 409
+
+        total = summary['total'] - summary['activados'] if self.activados != 'cascade' else summary['total']
+        job_id = jobs.create(JOB_TYPE, self.lote_id, total=total, details={
+            'activados': self.activados,
+            'activados_en_lote': summary['activados'],
+            'archivo_origen': summary['archivo_origen']
+        })
+        if not job_id:
+            # Otra solicitud registró una eliminación entre la verificación y el INSERT
+            return {
+                'success': False,
+                'error': 'Ya hay una eliminación en curso para este lote',
+                'job': jobs.find_active(JOB_TYPE, self.lote_id)
+            }, 409
+        jobs.run_in_background(job_id, self.run)
+
+        return {'success': True, 'job_id': job_id, 'total': total}, 202
+
+    def _delete_chunk(self, cursor, activated_sql, cascade):
+        """Eliminar un bloque (en la transacción actual); retorna (prospectos, leads)"""
+        keep_activated = '' if cascade else f"AND NOT {activated_sql}"
+        cursor.execute(f"""
+            SELECT p.id, p.telefono_1
+            FROM prospectos_raw p
+            WHERE p.lote_importacion = %s {keep_activated}
+            ORDER BY p.id
+            LIMIT %s
+            FOR UPDATE
+        """, (self.lote_id, self.chunk_rows))
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, 0
+
+        ids = [row['id'] for row in rows]
+        lead_ids = []
+        if cascade and _leads_exist(cursor):
+            phones = sorted({row['telefono_1'] for row in rows if row['telefono_1']})
+            # Bloqueo en orden fijo, como /leads/api/update
+            cursor.execute("""
+                SELECT l.id FROM leads l
+                WHERE l.telefono = ANY(%s)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM prospectos_raw o
+                      WHERE o.telefono_1 = l.telefono
+                        AND o.lote_importacion IS DISTINCT FROM %s
+                  )
+                ORDER BY l.id
+                FOR UPDATE
+            """, (phones, self.lote_id))
+            lead_ids = [row['id'] for row in cursor.fetchall()]
+
+        with track_facets(cursor, 'prospectos', "id = ANY(%s)", [ids]):
+            if lead_ids:
+                with track_facets(cursor, 'leads', "id = ANY(%s)", [lead_ids]):
+                    cursor.execute("DELETE FROM leads WHERE id = ANY(%s)", (lead_ids,))
+            cursor.execute("DELETE FROM prospectos_raw WHERE id = ANY(%s)", (ids,))
+        return len(ids), len(lead_ids)
+
+    def run(self, job_id):
+        """Eliminar el lote bloque por bloque (se llama desde el hilo del trabajo)"""
+        conn = connect()
+        cursor = conn.cursor()
+        processed = leads_deleted = 0
+        throttle = ProgressThrottle()
+        cascade = self.activados == 'cascade'
+
+        try:
+            activated_sql = _activated_sql(cursor)
+            while True:
+                deleted, deleted_leads = self._delete_chunk(cursor, activated_sql, cascade)
+                # Una transacción por bloque: los bloqueos duran un bloque
+                conn.commit()
+                if not deleted:
+                    break
+                processed += deleted
+                leads_deleted += deleted_leads
+                if throttle.ready():
+                    jobs.update(job_id, processed=processed, details={'leads_eliminados': leads_deleted})
+
+            cursor.execute(
+                "SELECT COUNT(*) AS remaining FROM prospectos_raw WHERE lote_importacion = %s",
+                (self.lote_id,)
+            )
+            remaining = cursor.fetchone()['remaining']
+            conn.commit()
+
+            jobs.update(job_id, status='completed', processed=processed, details={
+                'leads_eliminados': leads_deleted,
+                'conservados': remaining
+            })
+
+        except Exception as e:
+            print(f"Error eliminando lote {self.lote_id}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            conn.rollback()
+            # Los bloques ya confirmados quedan eliminados; se puede reintentar
+            jobs.update(job_id, status='failed', processed=processed, error=str(e),
+                        details={'leads_eliminados': leads_deleted})
+
+        finally:
+            cursor.close()
+            conn.close()
@@ -0,0 +1,126 @@
+import json
+import os
+import uuid
+
+from database import get_db_connection
+
+# Horas tras las cuales un archivo subido y no importado se elimina
+UPLOAD_TTL_HOURS = int(os.getenv('UPLOAD_TTL_HOURS', '24'))
+
+
+class UploadRegistry:
+    """
+    Registro de archivos subidos pendientes de importar, por upload_id
+
+    Reemplaza el estado que antes se guardaba en la sesión: cualquier
+    worker puede continuar una importación iniciada en otro. La tabla la
+    crea init_db.py.
+    """
+
+    def _connect(self):
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        return conn
+
+    def register(self, upload_id, filepath, filename, details=None):
+        """Registrar un archivo subido"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO upload_registry (upload_id, filepath, filename, details)
+                VALUES (%s, %s, %s, %s)
+            """, (upload_id, filepath, filename, json.dumps(details or {})))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        self.sweep()
+
+    def get(self, upload_id):
+        """Obtener un upload vigente, o None (también si upload_id no es un UUID)"""
+        # Un file_id arbitrario del cliente haría fallar el cast a UUID en la query
+        try:
+            uuid.UUID(str(upload_id))
+        except ValueError:
+            return None
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT upload_id, filepath, filename, details, created_at
+                FROM upload_registry
+                WHERE upload_id = %s
+                  AND created_at > NOW() - make_interval(hours => %s)
+            """, (upload_id, UPLOAD_TTL_HOURS))
+            upload = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return upload
+
+    def update_details(self, upload_id, details):
+        """Agregar o reemplazar claves en details de un upload"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE upload_registry
+                SET details = COALESCE(details, '{}'::jsonb) || %s::jsonb
+                WHERE upload_id = %s
+            """, (json.dumps(details), upload_id))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def remove(self, upload_id):
+        """Eliminar el registro, el archivo y la caché de un upload"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM upload_registry
+                WHERE upload_id = %s
+                RETURNING filepath, details->>'cache' AS cache
+            """, (upload_id,))
+            removed = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        self._remove_files(path for row in removed for path in (row['filepath'], row['cache']) if path)
+
+    def sweep(self):
+        """Eliminar uploads expirados (registro, archivo y caché)"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM upload_registry
+                WHERE created_at < NOW() - make_interval(hours => %s)
+                RETURNING filepath, details->>'cache' AS cache
+            """, (UPLOAD_TTL_HOURS,))
+            expired = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        self._remove_files(path for row in expired for path in (row['filepath'], row['cache']) if path)
+
+    @staticmethod
+    def _remove_files(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+uploads = UploadRegistry()
@@ -1,9 +1,312 @@
 from flask import Blueprint, render_template, jsonify, request
 from database import get_db_connection
 from datetime import datetime
+from utils.fields import parse_fields, columns_for, build_rows
+from http_cache import conditional
+from facets import facet_cache, track_facets
+from utils.normalize import looks_like_rut, normalize_rut, phone_variants
+from utils.export import export_formats, export_response, iter_query
+from modules.leads.updates import ESTADOS
+from utils.background_jobs import jobs
+from . import bulk
+import re
 
 prospectos_activos_bp = Blueprint('prospectos_activos', __name__)
 
+
+def _dias_transcurridos(p):
+    """Días desde el primer contacto (se calcula al leer; leads ya no guarda un contador diario)"""
+    fecha = p['fecha_primer_contacto']
+    if not fecha:
+        return 0
+    if isinstance(fecha, datetime):
+        # Fecha local de la zona en que la entrega la base
+        return (datetime.now(fecha.tzinfo).date() - fecha.date()).days
+    return (datetime.now().date() - fecha).days
+
+
+def _followups(p):
+    return {
+        dia: {
+            'enviado': p[f'followup_{dia}_enviado'] or False,
+            'fecha': p[f'followup_{dia}_fecha']
+        }
+        for dia in ('dia3', 'dia5', 'dia6', 'dia8')
+    }
+
+
+# Campos de /api/list: {campo: (columnas de leads, formateador)}
+ACTIVO_FIELDS = {
+    'id': (('id',), lambda p: str(p['id'])),
+    'nombre': (('nombre',), lambda p: p['nombre'] or ''),
+    'apellido': (('apellido',), lambda p: p['apellido'] or ''),
+    'email': (('email',), lambda p: p['email'] or ''),
+    'telefono': (('telefono',), lambda p: p['telefono'] or ''),
+    'carrera': (('carrera_interes',), lambda p: p['carrera_interes'] or ''),
+    'experiencia': (('experiencia_laboral',), lambda p: p['experiencia_laboral'] or 0),
+    'plan': (('plan',), lambda p: p['plan'] or ''),
+    'estado': (('estado',), lambda p: p['estado'] or ''),
+    'nivel_intencion': (('nivel_intencion',), lambda p: p['nivel_intencion'] or ''),
+    'dias_transcurridos': (('fecha_primer_contacto',), _dias_transcurridos),
+    'descuento_actual': (('descuento_actual',), lambda p: p['descuento_actual'] or 0),
+    'fecha_primer_contacto': (
+        ('fecha_primer_contacto',),
+        lambda p: p['fecha_primer_contacto'].strftime('%d/%m/%Y') if p['fecha_primer_contacto'] else ''
+    ),
+    'mensaje_count': ((), lambda p: p['mensaje_count'] or 0),
+    'followups': (
+        tuple(f'followup_{dia}_{campo}' for dia in ('dia3', 'dia5', 'dia6', 'dia8') for campo in ('enviado', 'fecha')),
+        _followups
+    ),
+    'derivado_a_humano': (('derivado_a_humano',), lambda p: p['derivado_a_humano'] or False),
+    'agente_asignado': (('agente_asignado',), lambda p: p['agente_asignado']),
+    'chat_status': (('chat_status',), lambda p: p['chat_status'] or ''),
+    'notas': (('notas',), lambda p: p['notas'] or ''),
+    'fecha_derivacion': (('fecha_derivacion',), lambda p: p['fecha_derivacion']),
+    'razon_derivacion': (('razon_derivacion',), lambda p: p['razon_derivacion'] or ''),
+    'created_at': (('created_at',), lambda p: p['created_at']),
+    'updated_at': (('updated_at',), lambda p: p['updated_at'])
+}
+
+# Texto de búsqueda indexado (ver init_db.LEADS_SEARCH_SQL): debe ser la misma
+# expresión del índice para que PostgreSQL lo use
+SEARCH_TEXT_SQL = "leads_search_text(l.nombre, l.apellido, l.email, l.carrera_interes)"
+
+_PHONE_RE = re.compile(r'^\+?[\d\s().-]{8,}$')
+
+# Se detectan una vez por proceso (reiniciar tras correr init_db.py)
+_search_capabilities = None
+
+
+def _get_search_capabilities(cursor):
+    """Si existen la función/índice de trigramas y prospectos_raw (para buscar por RUT)"""
+    global _search_capabilities
+    if _search_capabilities is None:
+        cursor.execute("""
+            SELECT to_regprocedure('leads_search_text(text,text,text,text)') IS NOT NULL AS trigram,
+                   to_regclass('prospectos_raw') IS NOT NULL AS rut
+        """)
+        row = cursor.fetchone()
+        _search_capabilities = {'trigram': row['trigram'], 'rut': row['rut']}
+        if not row['trigram']:
+            print("⚠️ Búsqueda de leads sin índice de trigramas: ejecuta init_db.py")
+    return _search_capabilities
+
+
+def _like_escape(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search_clause(cursor, search, prefix_only=False):
+    """
+    Condición de búsqueda sobre leads (alias l) y orden por relevancia
+
+    - RUT (12.345.678-9): igualdad contra prospectos_raw.rut normalizado
+    - Teléfono: igualdad contra las formas en que puede estar guardado
+    - Texto: cada palabra debe aparecer en nombre/apellido/email/carrera sin
+      acentos (índice GIN de trigramas); prefix_only busca solo al inicio
+      (índice text_pattern_ops, para autocompletar con 1-2 letras)
+
+    Returns:
+        (where_sql, params, rank_sql, rank_params); rank_sql es None si no
+        hay orden por relevancia
+    """
+    capabilities = _get_search_capabilities(cursor)
+
+    if looks_like_rut(search) and capabilities['rut']:
+        return ("""
+            l.telefono IN (
+                SELECT telefono_1 FROM prospectos_raw
+                WHERE upper(regexp_replace(rut, '[^0-9kK]', '', 'g')) = %s
+            )
+        """, [normalize_rut(search)], None, [])
+
+    variants = phone_variants(search) if _PHONE_RE.match(search) else []
+    if variants:
+        return "(l.telefono = ANY(%s) OR l.session_id = ANY(%s))", [variants, variants], None, []
+
+    if not capabilities['trigram']:
+        search_pattern = f'%{search}%'
+        return ("""
+            (l.nombre ILIKE %s OR l.apellido ILIKE %s OR
+             l.email ILIKE %s OR l.carrera_interes ILIKE %s)
+        """, [search_pattern] * 4, None, [])
+
+    escaped = _like_escape(search)
+    if prefix_only:
+        return (f"{SEARCH_TEXT_SQL} LIKE lower(f_unaccent(%s)) || '%%'", [escaped],
+                SEARCH_TEXT_SQL, [])
+
+    words = [_like_escape(word) for word in search.split()]
+    where_sql = ' AND '.join(f"{SEARCH_TEXT_SQL} LIKE '%%' || lower(f_unaccent(%s)) || '%%'" for _ in words)
+    # Primero los que empiezan con la búsqueda, luego por similitud de palabras
+    rank_sql = (f"({SEARCH_TEXT_SQL} LIKE lower(f_unaccent(%s)) || '%%') DESC, "
+                f"word_similarity(lower(f_unaccent(%s)), {SEARCH_TEXT_SQL}) DESC")
+    return f"({where_sql})", words, rank_sql, [escaped, search]
+
+
+# Conteo de mensajes por lead sin leads.mensaje_count (el JOIN más caro de la lista)
+MENSAJES_JOIN_SQL = """
+    LEFT JOIN (
+        SELECT session_id, COUNT(*) as mensaje_count
+        FROM n8n_chat_histories
+        GROUP BY session_id
+    ) m ON (
+        l.telefono = m.session_id OR 
+        CONCAT('56', l.telefono) = m.session_id OR
+        l.telefono = REPLACE(m.session_id, '56', '')
+    )
+"""
+
+SORT_COLUMNS = {
+    'nombre': 'l.nombre',
+    'apellido': 'l.apellido',
+    'carrera': 'l.carrera_interes',
+    'dias_transcurridos': 'l.fecha_primer_contacto',
+    'mensaje_count': 'mensaje_count',
+    'fecha_primer_contacto': 'l.fecha_primer_contacto'
+}
+
+# Más días transcurridos = primer contacto más antiguo: se ordena por la
+# fecha (indexada) en sentido inverso
+INVERTED_SORTS = {'dias_transcurridos'}
+
+# Columnas de /api/export: (encabezado, función fila -> valor)
+EXPORT_COLUMNS = [
+    ('ID', lambda p: p['id']),
+    ('Nombre', lambda p: p['nombre']),
+    ('Apellido', lambda p: p['apellido']),
+    ('Email', lambda p: p['email']),
+    ('Teléfono', lambda p: p['telefono']),
+    ('Carrera', lambda p: p['carrera_interes']),
+    ('Plan', lambda p: p['plan']),
+    ('Experiencia', lambda p: p['experiencia_laboral']),
+    ('Estado', lambda p: p['estado']),
+    ('Nivel de intención', lambda p: p['nivel_intencion']),
+    ('Fecha primer contacto', lambda p: p['fecha_primer_contacto']),
+    ('Días transcurridos', _dias_transcurridos),
+    ('Mensajes', lambda p: p['mensaje_count']),
+    *((f'Followup día {dia[3:]} enviado', lambda p, dia=dia: p[f'followup_{dia}_enviado'] or False)
+      for dia in ('dia3', 'dia5', 'dia6', 'dia8')),
+    ('Derivado a humano', lambda p: p['derivado_a_humano'] or False),
+    ('Agente asignado', lambda p: p['agente_asignado']),
+    ('Notas', lambda p: p['notas']),
+    ('Creado', lambda p: p['created_at']),
+    ('Actualizado', lambda p: p['updated_at'])
+]
+EXPORT_LEAD_COLUMNS = [
+    'id', 'nombre', 'apellido', 'email', 'telefono', 'carrera_interes', 'plan', 'experiencia_laboral',
+    'estado', 'nivel_intencion', 'fecha_primer_contacto',
+    'followup_dia3_enviado', 'followup_dia5_enviado', 'followup_dia6_enviado', 'followup_dia8_enviado',
+    'derivado_a_humano', 'agente_asignado', 'notas', 'created_at', 'updated_at'
+]
+
+
+def _list_query(cursor, args):
+    """
+    WHERE y ORDER BY (sobre leads l) según los parámetros de /api/list y /api/export
+
+    Returns:
+        (where_sql, params, order_sql, order_params, sort_by)
+    """
+    search = args.get('search', '').strip()
+    
+    # Nuevos parámetros de filtro
+    filter_estado = args.get('estado', '').strip()
+    filter_carrera = args.get('carrera', '').strip()
+    filter_plan = args.get('plan', '').strip()
+    
+    # Parámetros de ordenamiento
+    sort_by = args.get('sort_by', 'relevancia' if search else 'dias_transcurridos')
+    sort_order = args.get('sort_order', 'DESC')
+    
+    # Construir WHERE clause
+    where_clauses = []
+    params = []
+    
+    rank_sql, rank_params = None, []
+    if search:
+        search_sql, search_params, rank_sql, rank_params = _search_clause(cursor, search)
+        where_clauses.append(search_sql)
+        params.extend(search_params)
+    
+    # Filtros adicionales
+    if filter_estado:
+        where_clauses.append("l.estado = %s")
+        params.append(filter_estado)
+    
+    if filter_carrera:
+        where_clauses.append("l.carrera_interes = %s")
+        params.append(filter_carrera)
+    
+    if filter_plan:
+        where_clauses.append("l.plan = %s")
+        params.append(filter_plan)
+    
+    where_sql = ' AND '.join(where_clauses) if where_clauses else '1=1'
+    
+    # Validar columna de ordenamiento
+    if sort_by not in SORT_COLUMNS and not (rank_sql and sort_by == 'relevancia'):
+        sort_by = 'dias_transcurridos'
+    sort_column = SORT_COLUMNS.get(sort_by, 'l.fecha_primer_contacto')
+    ascending = sort_order.upper() == 'ASC'
+    if sort_by in INVERTED_SORTS:
+        ascending = not ascending
+    sort_direction = 'ASC' if ascending else 'DESC'
+    order_sql = f"{sort_column} {sort_direction}, l.updated_at DESC"
+    order_params = []
+    # Con búsqueda de texto se ordena por relevancia salvo que se pida otro orden
+    if rank_sql and sort_by == 'relevancia':
+        order_sql = f"{rank_sql}, l.updated_at DESC"
+        order_params = rank_params
+    
+    return where_sql, params, order_sql, order_params, sort_by
+
+
+# Se detecta una vez por proceso (reiniciar tras correr init_db.py)
+_mensaje_counter = None
+
+
+def _has_mensaje_counter(cursor):
+    """Si existe leads.mensaje_count (lo crea init_db.py y lo mantienen sus triggers)"""
+    global _mensaje_counter
+    if _mensaje_counter is None:
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'leads' AND column_name = 'mensaje_count'
+            ) AS exists
+        """)
+        _mensaje_counter = cursor.fetchone()['exists']
+        if not _mensaje_counter:
+            print("⚠️ Conteo de mensajes sin leads.mensaje_count: ejecuta init_db.py")
+    return _mensaje_counter
+
+
+def _mensajes_sql(cursor, needed=True):
+    """
+    Expresión del conteo de mensajes (sobre leads l) y el JOIN que requiere
+
+    Con leads.mensaje_count es una columna más; sin él se cuenta
+    n8n_chat_histories con MENSAJES_JOIN_SQL, solo si needed.
+    """
+    if _has_mensaje_counter(cursor):
+        return "l.mensaje_count", ""
+    if needed and _chat_exists(cursor):
+        return "COALESCE(m.mensaje_count, 0)", MENSAJES_JOIN_SQL
+    return "0", ""
+
+
+def _chat_exists(cursor):
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT FROM information_schema.tables 
+            WHERE table_name = 'n8n_chat_histories'
+        );
+    """)
+    return cursor.fetchone()['exists']
+
+
 @prospectos_activos_bp.route('/')
 @prospectos_activos_bp.route('/activos')
 def prospectos_activos():
@@ -16,16 +319,11 @@ def list_activos():
     try:
         page = int(request.args.get('page', 1))
         page_size = int(request.args.get('page_size', 50))
-        search = request.args.get('search', '').strip()
-        
-        # Nuevos parámetros de filtro
-        filter_estado = request.args.get('estado', '').strip()
-        filter_carrera = request.args.get('carrera', '').strip()
-        filter_plan = request.args.get('plan', '').strip()
         
-        # Parámetros de ordenamiento
-        sort_by = request.args.get('sort_by', 'dias_transcurridos')
-        sort_order = request.args.get('sort_order', 'DESC')
+        try:
+            fields = parse_fields(request.args.get('fields'), ACTIVO_FIELDS)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         conn = get_db_connection()
         if not conn:
@@ -53,162 +351,40 @@ def list_activos():
                 'total_pages': 0
             })
         
-        # Construir WHERE clause
-        where_clauses = []
-        params = []
-        
-        if search:
-            search_pattern = f'%{search}%'
-            where_clauses.append("""
-                (nombre ILIKE %s OR apellido ILIKE %s OR 
-                 email ILIKE %s OR carrera_interes ILIKE %s)
-            """)
-            params.extend([search_pattern] * 4)
-        
-        # Filtros adicionales
-        if filter_estado:
-            where_clauses.append("estado = %s")
-            params.append(filter_estado)
-        
-        if filter_carrera:
-            where_clauses.append("carrera_interes = %s")
-            params.append(filter_carrera)
-        
-        if filter_plan:
-            where_clauses.append("plan = %s")
-            params.append(filter_plan)
-        
-        where_sql = ' AND '.join(where_clauses) if where_clauses else '1=1'
+        where_sql, params, order_sql, order_params, sort_by = _list_query(cursor, request.args)
         
         # Contar total
-        cursor.execute(f"SELECT COUNT(*) as total FROM leads WHERE {where_sql}", params)
+        cursor.execute(f"SELECT COUNT(*) as total FROM leads l WHERE {where_sql}", params)
         total = cursor.fetchone()['total']
         
         total_pages = (total + page_size - 1) // page_size
         offset = (page - 1) * page_size
         
-        # Verificar si existe la tabla n8n_chat_histories
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'n8n_chat_histories'
-            );
-        """)
-        chat_exists = cursor.fetchone()['exists']
-        
-        # Validar columna de ordenamiento
-        valid_sort_columns = {
-            'nombre': 'l.nombre',
-            'apellido': 'l.apellido',
-            'carrera': 'l.carrera_interes',
-            'dias_transcurridos': 'l.dias_transcurridos',
-            'mensaje_count': 'mensaje_count',
-            'fecha_primer_contacto': 'l.fecha_primer_contacto'
-        }
+        columns = columns_for(fields, ACTIVO_FIELDS) or ['id']
+        select_sql = ', '.join(f"l.{column}" for column in columns)
         
-        sort_column = valid_sort_columns.get(sort_by, 'l.dias_transcurridos')
-        sort_direction = 'ASC' if sort_order.upper() == 'ASC' else 'DESC'
-        
-        # Construir query con o sin LEFT JOIN según exista la tabla
-        if chat_exists:
-            query = f"""
-                SELECT 
-                    l.id, l.nombre, l.apellido, l.email, l.telefono, l.carrera_interes,
-                    l.experiencia_laboral, l.plan, l.estado, l.nivel_intencion,
-                    l.dias_transcurridos, l.descuento_actual, l.fecha_primer_contacto,
-                    l.followup_dia3_enviado, l.followup_dia3_fecha,
-                    l.followup_dia5_enviado, l.followup_dia5_fecha,
-                    l.followup_dia6_enviado, l.followup_dia6_fecha,
-                    l.followup_dia8_enviado, l.followup_dia8_fecha,
-                    l.derivado_a_humano, l.agente_asignado, l.chat_status, l.notas,
-                    l.fecha_derivacion, l.razon_derivacion,
-                    l.created_at, l.updated_at,
-                    COALESCE(m.mensaje_count, 0) as mensaje_count
-                FROM leads l
-                LEFT JOIN (
-                    SELECT session_id, COUNT(*) as mensaje_count
-                    FROM n8n_chat_histories
-                    GROUP BY session_id
-                ) m ON (
-                    l.telefono = m.session_id OR 
-                    CONCAT('56', l.telefono) = m.session_id OR
-                    l.telefono = REPLACE(m.session_id, '56', '')
-                )
-                WHERE {where_sql}
-                ORDER BY {sort_column} {sort_direction}, l.updated_at DESC
-                LIMIT %s OFFSET %s
-            """
-        else:
-            query = f"""
-                SELECT 
-                    id, nombre, apellido, email, telefono, carrera_interes,
-                    experiencia_laboral, plan, estado, nivel_intencion,
-                    dias_transcurridos, descuento_actual, fecha_primer_contacto,
-                    followup_dia3_enviado, followup_dia3_fecha,
-                    followup_dia5_enviado, followup_dia5_fecha,
-                    followup_dia6_enviado, followup_dia6_fecha,
-                    followup_dia8_enviado, followup_dia8_fecha,
-                    derivado_a_humano, agente_asignado, chat_status, notas,
-                    fecha_derivacion, razon_derivacion,
-                    created_at, updated_at,
-                    0 as mensaje_count
-                FROM leads
-                WHERE {where_sql}
-                ORDER BY {sort_column} {sort_direction}, updated_at DESC
-                LIMIT %s OFFSET %s
-            """
-        
-        cursor.execute(query, params + [page_size, offset])
+        # Sin el contador, el JOIN de mensajes (el más caro) solo si se pide o se ordena por él
+        mensajes_sql, join_sql = _mensajes_sql(
+            cursor, 'mensaje_count' in fields or sort_by == 'mensaje_count')
+        query = f"""
+            SELECT 
+                {select_sql},
+                {mensajes_sql} as mensaje_count
+            FROM leads l
+            {join_sql}
+            WHERE {where_sql}
+            ORDER BY {order_sql}
+            LIMIT %s OFFSET %s
+        """
+        
+        cursor.execute(query, params + order_params + [page_size, offset])
         
         prospectos = cursor.fetchall()
         cursor.close()
         conn.close()
         
-        # Formatear datos para respuesta
-        data = []
-        for p in prospectos:
-            data.append({
-                'id': str(p['id']),
-                'nombre': p['nombre'] or '',
-                'apellido': p['apellido'] or '',
-                'email': p['email'] or '',
-                'telefono': p['telefono'] or '',
-                'carrera': p['carrera_interes'] or '',
-                'experiencia': p['experiencia_laboral'] or 0,
-                'plan': p['plan'] or '',
-                'estado': p['estado'] or '',
-                'nivel_intencion': p['nivel_intencion'] or '',
-                'dias_transcurridos': p['dias_transcurridos'] or 0,
-                'descuento_actual': p['descuento_actual'] or 0,
-                'fecha_primer_contacto': p['fecha_primer_contacto'].strftime('%d/%m/%Y') if p['fecha_primer_contacto'] else '',
-                'mensaje_count': p['mensaje_count'] or 0,
-                'followups': {
-                    'dia3': {
-                        'enviado': p['followup_dia3_enviado'] or False,
-                        'fecha': p['followup_dia3_fecha'].isoformat() if p['followup_dia3_fecha'] else None
-                    },
-                    'dia5': {
-                        'enviado': p['followup_dia5_enviado'] or False,
-                        'fecha': p['followup_dia5_fecha'].isoformat() if p['followup_dia5_fecha'] else None
-                    },
-                    'dia6': {
-                        'enviado': p['followup_dia6_enviado'] or False,
-                        'fecha': p['followup_dia6_fecha'].isoformat() if p['followup_dia6_fecha'] else None
-                    },
-                    'dia8': {
-                        'enviado': p['followup_dia8_enviado'] or False,
-                        'fecha': p['followup_dia8_fecha'].isoformat() if p['followup_dia8_fecha'] else None
-                    }
-                },
-                'derivado_a_humano': p['derivado_a_humano'] or False,
-                'agente_asignado': p['agente_asignado'],
-                'chat_status': p['chat_status'] or '',
-                'notas': p['notas'] or '',
-                'fecha_derivacion': p['fecha_derivacion'].isoformat() if p['fecha_derivacion'] else None,
-                'razon_derivacion': p['razon_derivacion'] or '',
-                'created_at': p['created_at'].isoformat() if p['created_at'] else None,
-                'updated_at': p['updated_at'].isoformat() if p['updated_at'] else None
-            })
+        # Formatear datos para respuesta (las fechas las serializa el proveedor JSON)
+        data = build_rows(prospectos, fields, ACTIVO_FIELDS)
         
         return jsonify({
             'success': True,
@@ -230,6 +406,95 @@ def list_activos():
             'total_pages': 0
         })
 
+@prospectos_activos_bp.route('/api/export')
+def export_activos():
+    """Descarga CSV/XLSX de los prospectos activos con los mismos filtros y orden que /api/list"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in export_formats():
+        return jsonify({'success': False, 'error': f"Formato no soportado: {fmt}"}), 400
+    
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+        
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('leads') IS NOT NULL AS exists")
+        if not cursor.fetchone()['exists']:
+            cursor.close()
+            conn.close()
+            return export_response(fmt, 'prospectos_activos', EXPORT_COLUMNS, [], sheet_title='Prospectos activos')
+        
+        where_sql, params, order_sql, order_params, sort_by = _list_query(cursor, request.args)
+        mensajes_sql, join_sql = _mensajes_sql(cursor)
+        cursor.close()
+        
+        select_sql = ', '.join(f"l.{column}" for column in EXPORT_LEAD_COLUMNS)
+        
+        # l.id como desempate: el orden es estable entre bloques del cursor
+        rows = iter_query(conn, f"""
+            SELECT {select_sql}, {mensajes_sql} as mensaje_count
+            FROM leads l
+            {join_sql}
+            WHERE {where_sql}
+            ORDER BY {order_sql}, l.id
+        """, params + order_params)
+        return export_response(fmt, 'prospectos_activos', EXPORT_COLUMNS, rows, sheet_title='Prospectos activos')
+    
+    except Exception as e:
+        print(f"Error in export_activos: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@prospectos_activos_bp.route('/api/search-suggest')
+def search_suggest():
+    """Autocompletar del buscador: pocos leads que coinciden con lo escrito"""
+    try:
+        q = request.args.get('q', '').strip()
+        limit = min(max(int(request.args.get('limit', 8)), 1), 20)
+        if not q:
+            return jsonify({'success': True, 'suggestions': []})
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('leads') IS NOT NULL AS exists")
+        if not cursor.fetchone()['exists']:
+            cursor.close()
+            conn.close()
+            return jsonify({'success': True, 'suggestions': []})
+
+        # Con 1-2 letras los trigramas no filtran: solo coincidencias al inicio
+        where_sql, params, rank_sql, rank_params = _search_clause(cursor, q, prefix_only=len(q) < 3)
+        cursor.execute(f"""
+            SELECT l.id, l.nombre, l.apellido, l.telefono, l.carrera_interes
+            FROM leads l
+            WHERE {where_sql}
+            ORDER BY {rank_sql or 'l.updated_at DESC'}
+            LIMIT %s
+        """, params + rank_params + [limit])
+        rows = cursor.fetchall()
+        cursor.close()
+        conn.close()
+
+        return jsonify({
+            'success': True,
+            'suggestions': [{
+                'id': str(row['id']),
+                'nombre': row['nombre'] or '',
+                'apellido': row['apellido'] or '',
+                'telefono': row['telefono'] or '',
+                'carrera': row['carrera_interes'] or ''
+            } for row in rows]
+        })
+
+    except Exception as e:
+        print(f"Error in search_suggest: {str(e)}")
+        return jsonify({'success': True, 'suggestions': []})
+
 @prospectos_activos_bp.route('/api/mensajes/<telefono>')
 def get_mensajes(telefono):
     """API para obtener historial de mensajes de un prospecto"""
@@ -376,50 +641,92 @@ def get_mensajes(telefono):
             'prospecto': None
         })
 
-@prospectos_activos_bp.route('/api/activar', methods=['POST'])
-def activar_prospectos():
-    """Activar múltiples prospectos (cambiar estado a 'en_proceso')"""
+# Filtros de /api/list que acepta un cambio masivo por filtros
+BULK_FILTERS = ('search', 'estado', 'carrera', 'plan')
+
+
+def _bulk_selection(data):
+    """
+    Selección de un cambio masivo: {"ids": [...]} o {"filters": {...}} con
+    los filtros de /api/list (todos los leads que coinciden; {} son todos)
+
+    Returns:
+        (where_sql, params, descripción) o None si no hay selección
+
+    Raises:
+        ValueError: si algún id no es numérico
+    """
+    ids = data.get('ids')
+    if ids:
+        try:
+            ids = sorted({int(i) for i in ids})
+        except (TypeError, ValueError):
+            raise ValueError('ids deben ser numéricos')
+        return "l.id = ANY(%s)", [ids], {'ids': len(ids)}
+    
+    filters = data.get('filters')
+    if not isinstance(filters, dict):
+        return None
+    
+    filters = {key: str(filters[key]) for key in BULK_FILTERS if filters.get(key) not in (None, '')}
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError('Database connection failed')
     try:
-        data = request.get_json()
-        ids = data.get('ids', [])
-        
-        if not ids:
-            return jsonify({
-                'success': False, 
-                'error': 'No se proporcionaron IDs'
-            }), 400
-        
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                'success': False, 
-                'error': 'Database connection failed'
-            }), 500
-        
         cursor = conn.cursor()
-        
-        # Actualizar estado
-        placeholders = ','.join(['%s'] * len(ids))
-        query = f"""
-            UPDATE leads 
-            SET estado = 'en_proceso', updated_at = NOW()
-            WHERE id IN ({placeholders})
-            RETURNING id
-        """
-        cursor.execute(query, ids)
-        
-        updated = cursor.fetchall()
-        updated_ids = [str(row['id']) for row in updated]
-        
-        conn.commit()
+        where_sql, params, _, _, _ = _list_query(cursor, filters)
         cursor.close()
+    finally:
         conn.close()
-        
+    return where_sql, params, {'filtros': filters}
+
+
+def _bulk_estado(data, estado, message):
+    """Aplicar un cambio de estado masivo y armar la respuesta (conteos y operation_id)"""
+    try:
+        selection = _bulk_selection(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if selection is None:
+        return jsonify({'success': False, 'error': 'No se proporcionaron IDs ni filtros'}), 400
+    
+    where_sql, params, description = selection
+    job, background = bulk.BulkEstadoChange(where_sql, params, estado, description).start()
+    details = job['details']
+    
+    if background:
         return jsonify({
             'success': True,
-            'message': f'{len(updated_ids)} prospectos activados correctamente',
-            'updated_ids': updated_ids
-        })
+            'queued': True,
+            'operation_id': job['id'],
+            'total': job['total'],
+            'message': f"Actualizando {job['total']} prospectos en segundo plano"
+        }), 202
+    
+    if job['status'] == 'failed':
+        return jsonify({
+            'success': False,
+            'error': job['error'],
+            'operation_id': job['id'],
+            'updated': details.get('actualizados', 0)
+        }), 500
+    
+    updated = details.get('actualizados', 0)
+    return jsonify({
+        'success': True,
+        'operation_id': job['id'],
+        'total': job['total'],
+        'updated': updated,
+        'unchanged': details.get('sin_cambios', 0),
+        'message': message.format(count=updated)
+    })
+
+@prospectos_activos_bp.route('/api/activar', methods=['POST'])
+def activar_prospectos():
+    """Activar múltiples prospectos (cambiar estado a 'en_proceso'); ids o filters"""
+    try:
+        data = request.get_json() or {}
+        return _bulk_estado(data, 'en_proceso', '{count} prospectos activados correctamente')
         
     except Exception as e:
         print(f"Error en activar_prospectos: {str(e)}")
@@ -432,61 +739,25 @@ def activar_prospectos():
 
 @prospectos_activos_bp.route('/api/cambiar-estado', methods=['POST'])
 def cambiar_estado():
-    """Cambiar estado de múltiples prospectos"""
+    """Cambiar estado de múltiples prospectos; ids o filters"""
     try:
-        data = request.get_json()
-        ids = data.get('ids', [])
+        data = request.get_json() or {}
         nuevo_estado = data.get('estado', '')
         
-        if not ids or not nuevo_estado:
+        if not nuevo_estado or not (data.get('ids') or isinstance(data.get('filters'), dict)):
             return jsonify({
                 'success': False,
-                'error': 'IDs y estado son requeridos'
+                'error': 'IDs (o filtros) y estado son requeridos'
             }), 400
         
         # Validar estado
-        estados_validos = [
-            'nuevo', 'calificando', 'persuadiendo', 
-            'listo_matricula', 'perdido', 'en_proceso'
-        ]
-        
-        if nuevo_estado not in estados_validos:
+        if nuevo_estado not in ESTADOS:
             return jsonify({
                 'success': False,
-                'error': f'Estado inválido. Permitidos: {", ".join(estados_validos)}'
+                'error': f'Estado inválido. Permitidos: {", ".join(ESTADOS)}'
             }), 400
         
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                'success': False,
-                'error': 'Database connection failed'
-            }), 500
-        
-        cursor = conn.cursor()
-        
-        # Actualizar estado
-        placeholders = ','.join(['%s'] * len(ids))
-        query = f"""
-            UPDATE leads 
-            SET estado = %s, updated_at = NOW()
-            WHERE id IN ({placeholders})
-            RETURNING id
-        """
-        cursor.execute(query, [nuevo_estado] + ids)
-        
-        updated = cursor.fetchall()
-        updated_ids = [str(row['id']) for row in updated]
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        return jsonify({
-            'success': True,
-            'message': f'{len(updated_ids)} prospectos actualizados a: {nuevo_estado}',
-            'updated_ids': updated_ids
-        })
+        return _bulk_estado(data, nuevo_estado, '{count} prospectos actualizados a: ' + nuevo_estado)
         
     except Exception as e:
         print(f"Error en cambiar_estado: {str(e)}")
@@ -497,31 +768,36 @@ def cambiar_estado():
             'error': str(e)
         }), 500
 
-@prospectos_activos_bp.route('/api/stats')
-def get_stats():
-    """Obtiene estadísticas de prospectos activos por estado"""
+@prospectos_activos_bp.route('/api/operaciones/<operation_id>')
+def get_operacion(operation_id):
+    """Progreso de un cambio de estado masivo"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({
-                'success': False,
-                'error': 'Database connection failed'
-            }), 500
+        job = jobs.get(operation_id)
         
-        cursor = conn.cursor()
+        if not job or job['type'] != bulk.JOB_TYPE:
+            return jsonify({'success': False, 'error': 'Operación no encontrada'}), 404
         
-        # Verificar si existe la tabla
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'leads'
-            );
-        """)
-        table_exists = cursor.fetchone()['exists']
+        return jsonify({
+            'success': True,
+            'operation': job
+        })
         
-        if not table_exists:
-            cursor.close()
-            conn.close()
+    except Exception as e:
+        print(f"Error en get_operacion: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _leads_version():
+    # Versión de la caché de facetas de leads (O(1); ver facets.facet_totals)
+    return facet_cache.version('leads')
+
+@prospectos_activos_bp.route('/api/stats')
+@conditional(_leads_version)
+def get_stats():
+    """Obtiene estadísticas de prospectos activos por estado (desde la caché de facetas)"""
+    try:
+        # None si la caché no está disponible (p. ej. aún no existe la tabla leads)
+        totals = facet_cache.totals('leads')
+        if not totals:
             return jsonify({
                 'success': True,
                 'stats': {
@@ -530,24 +806,12 @@ def get_stats():
                 }
             })
         
-        # Total activos
-        cursor.execute("""
-            SELECT COUNT(*) as total 
-            FROM leads
-        """)
-        total_activos = cursor.fetchone()['total']
-        
-        # Por estado con nombres descriptivos
-        cursor.execute("""
-            SELECT 
-                estado, 
-                COUNT(*) as count
-            FROM leads
-            WHERE estado IS NOT NULL
-            GROUP BY estado
-            ORDER BY count DESC
-        """)
-        por_estado_raw = cursor.fetchall()
+        total_activos = totals['total']
+        estados = facet_cache.values('leads', 'estado', limit=1000, order='count')
+        por_estado_raw = [
+            {'estado': item['value'], 'count': item['count']}
+            for item in (estados['items'] if estados else [])
+        ]
         
         # Mapeo de estados a nombres descriptivos
         estado_nombres = {
@@ -579,9 +843,6 @@ def get_stats():
                 'count': row['count']
             })
         
-        cursor.close()
-        conn.close()
-        
         return jsonify({
             'success': True,
             'stats': {
@@ -603,73 +864,19 @@ def get_stats():
         })
 
 @prospectos_activos_bp.route('/api/filter-options')
+@conditional(_leads_version)
 def get_filter_options():
-    """Obtiene las opciones disponibles para los filtros tipo Excel"""
+    """Obtiene las opciones disponibles para los filtros tipo Excel (desde la caché de facetas)"""
     try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'success': False, 'error': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor()
-        
-        # Verificar si existe la tabla
-        cursor.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_name = 'leads'
-            );
-        """)
-        table_exists = cursor.fetchone()['exists']
-        
-        if not table_exists:
-            cursor.close()
-            conn.close()
-            return jsonify({
-                'success': True,
-                'options': {
-                    'carreras': [],
-                    'planes': [],
-                    'estados': []
-                }
-            })
-        
-        # Obtener carreras únicas
-        cursor.execute("""
-            SELECT DISTINCT carrera_interes
-            FROM leads
-            WHERE carrera_interes IS NOT NULL AND carrera_interes != ''
-            ORDER BY carrera_interes
-        """)
-        carreras = [row['carrera_interes'] for row in cursor.fetchall()]
-        
-        # Obtener planes únicos
-        cursor.execute("""
-            SELECT DISTINCT plan
-            FROM leads
-            WHERE plan IS NOT NULL AND plan != ''
-            ORDER BY plan
-        """)
-        planes = [row['plan'] for row in cursor.fetchall()]
-        
-        # Obtener estados únicos
-        cursor.execute("""
-            SELECT DISTINCT estado
-            FROM leads
-            WHERE estado IS NOT NULL AND estado != ''
-            ORDER BY estado
-        """)
-        estados = [row['estado'] for row in cursor.fetchall()]
-        
-        cursor.close()
-        conn.close()
+        options = {}
+        for key, column in (('carreras', 'carrera_interes'), ('planes', 'plan'), ('estados', 'estado')):
+            # None si la caché no está disponible (p. ej. aún no existe la tabla leads)
+            facet = facet_cache.values('leads', column, limit=1000)
+            options[key] = [item['value'] for item in facet['items'] if item['value'] != ''] if facet else []
         
         return jsonify({
             'success': True,
-            'options': {
-                'carreras': carreras,
-                'planes': planes,
-                'estados': estados
-            }
+            'options': options
         })
         
     except Exception as e:
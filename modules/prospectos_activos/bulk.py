@@ -0,0 +1,140 @@
+"""
+Cambios de estado masivos sobre leads
+
+La selección llega como ids (un solo parámetro array, id = ANY(%s)) o
+como los filtros de /api/list ("todos los que coinciden"). Los leads se
+recorren por id en bloques de BULK_CHUNK_ROWS con una transacción por
+bloque; los que ya tienen el estado no se tocan. Cada cambio queda como
+una operación en background_jobs: las selecciones de hasta
+BULK_SYNC_MAX_ROWS se aplican dentro del request y las mayores en
+segundo plano, con el progreso consultable por operation_id.
+"""
+import os
+
+from database import get_db_connection
+from facets import track_facets
+from utils.background_jobs import jobs, ProgressThrottle
+
+JOB_TYPE = 'leads_estado'
+
+BULK_CHUNK_ROWS = int(os.getenv('BULK_CHUNK_ROWS', '1000'))
+BULK_SYNC_MAX_ROWS = int(os.getenv('BULK_SYNC_MAX_ROWS', '5000'))
+
+
+class BulkEstadoChange:
+    """
+    Cambio de estado de los leads que cumplen where_sql (sobre leads l)
+
+    Args:
+        where_sql, params: Selección (de _list_query o id = ANY(%s))
+        estado: Estado nuevo
+        selection: Descripción de la selección para los detalles de la operación
+    """
+
+    def __init__(self, where_sql, params, estado, selection=None, chunk_rows=BULK_CHUNK_ROWS):
+        self.where_sql = where_sql
+        self.params = list(params)
+        self.estado = estado
+        self.selection = selection or {}
+        self.chunk_rows = chunk_rows
+
+    def _connect(self):
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        return conn
+
+    def count(self):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) AS total FROM leads l WHERE {self.where_sql}", self.params)
+            total = cursor.fetchone()['total']
+            cursor.close()
+        finally:
+            conn.close()
+        return total
+
+    def start(self):
+        """
+        Registrar la operación y aplicarla (en el request o en segundo plano)
+
+        Returns:
+            (trabajo de background_jobs, en_segundo_plano)
+        """
+        total = self.count()
+        # Sin referencia: los cambios de estado no son exclusivos entre sí
+        job_id = jobs.create(JOB_TYPE, total=total, details={
+            'estado': self.estado,
+            'seleccion': self.selection
+        })
+
+        if total > BULK_SYNC_MAX_ROWS:
+            jobs.run_in_background(job_id, self.run)
+            return jobs.get(job_id), True
+
+        jobs.update(job_id, status='running')
+        with jobs.keep_alive(job_id):
+            self.run(job_id)
+        return jobs.get(job_id), False
+
+    def _apply_chunk(self, cursor, last_id):
+        """Actualizar el siguiente bloque (en la transacción actual); retorna (ids, actualizados)"""
+        cursor.execute(f"""
+            SELECT l.id FROM leads l
+            WHERE ({self.where_sql}) AND l.id > %s
+            ORDER BY l.id
+            LIMIT %s
+        """, self.params + [last_id, self.chunk_rows])
+        ids = [row['id'] for row in cursor.fetchall()]
+        if not ids:
+            return ids, 0
+
+        with track_facets(cursor, 'leads', "id = ANY(%s)", [ids]):
+            cursor.execute("""
+                UPDATE leads
+                SET estado = %s, updated_at = NOW()
+                WHERE id = ANY(%s) AND estado IS DISTINCT FROM %s
+            """, (self.estado, ids, self.estado))
+            updated = cursor.rowcount
+        return ids, updated
+
+    def run(self, job_id):
+        """Aplicar el cambio bloque por bloque"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        processed = updated = 0
+        last_id = 0
+        throttle = ProgressThrottle()
+
+        try:
+            while True:
+                ids, chunk_updated = self._apply_chunk(cursor, last_id)
+                conn.commit()
+                if not ids:
+                    break
+                # Por id y no por OFFSET: un filtro por estado deja de
+                # coincidir con los leads ya actualizados
+                last_id = ids[-1]
+                processed += len(ids)
+                updated += chunk_updated
+                if throttle.ready():
+                    jobs.update(job_id, processed=processed, details={'actualizados': updated})
+
+            jobs.update(job_id, status='completed', processed=processed, details={
+                'actualizados': updated,
+                'sin_cambios': processed - updated
+            })
+
+        except Exception as e:
+            print(f"Error cambiando estado a {self.estado}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            conn.rollback()
+            # Los bloques ya confirmados quedan aplicados
+            jobs.update(job_id, status='failed', processed=processed, error=str(e),
+                        details={'actualizados': updated})
+
+        finally:
+            cursor.close()
+            conn.close()
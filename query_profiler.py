@@ -0,0 +1,340 @@
+import hashlib
+import os
+import queue
+import random
+import re
+import threading
+import time
+
+import metrics
+
+_COMMENTS = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'(?<![\w$])-?\d+(?:\.\d+)?(?![\w$])')
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_ARRAYS = re.compile(r'ARRAY\s*\[\s*\?(?:\s*,\s*\?)*\s*\]', re.I)
+_VALUES_ROWS = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+_TIMING = re.compile(r'(Planning|Execution) Time: ([\d.]+) ms')
+
+
+def normalize_query(sql):
+    """Reemplazar literales por ? y colapsar listas para agrupar queries equivalentes"""
+    text = _COMMENTS.sub(' ', sql)
+    text = _STRINGS.sub('?', text)
+    text = _NUMBERS.sub('?', text)
+    text = _VALUES_ROWS.sub(r'\1, ...', text)
+    text = _IN_LISTS.sub('(?, ...)', text)
+    text = _ARRAYS.sub('ARRAY[?, ...]', text)
+    return ' '.join(text.split())
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.lower().encode('utf-8')).hexdigest()
+
+
+def is_read_only(sql):
+    """Solo las lecturas se ejecutan con ANALYZE; el resto se explica sin ejecutar"""
+    keyword = _COMMENTS.sub(' ', sql).lstrip().split(None, 1)
+    return bool(keyword) and keyword[0].lower() in ('select', 'with', 'values', 'table')
+
+
+def _settings():
+    return {
+        'enabled': os.getenv('QUERY_PROFILER', '0') == '1',
+        'threshold_ms': float(os.getenv('QUERY_PROFILER_THRESHOLD_MS', '250')),
+        'sample_rate': float(os.getenv('QUERY_PROFILER_SAMPLE_RATE', '0.2')),
+        # Segundos mínimos entre dos EXPLAIN de la misma query
+        'cooldown': float(os.getenv('QUERY_PROFILER_COOLDOWN', '600')),
+        'statement_timeout_ms': int(os.getenv('QUERY_PROFILER_TIMEOUT_MS', '15000'))
+    }
+
+
+def _connection_factory(label):
+    if label == 'kb':
+        from database_kb import get_kb_db_connection
+        return get_kb_db_connection
+    from database import get_db_connection
+    return get_db_connection
+
+
+class QueryProfiler:
+    """
+    Muestreo de queries lentas con EXPLAIN (ANALYZE, BUFFERS)
+
+    Los cursores instrumentados llaman a sample() tras cada query. Una
+    fracción de las que superan el umbral se encola y un hilo de fondo
+    ejecuta EXPLAIN sobre una copia de la query (en una transacción de solo
+    lectura que se descarta) y guarda el plan en query_profiles, agrupado
+    por fingerprint de la query normalizada.
+    """
+
+    QUEUE_SIZE = 200
+
+    def __init__(self):
+        self.settings = _settings()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._explained_at = {}
+        self._lock = threading.Lock()
+        self._table_ready = None
+        self.dropped = 0
+
+    @property
+    def enabled(self):
+        return self.settings['enabled']
+
+    def install(self):
+        """Registrar el muestreador en los cursores instrumentados (si está habilitado)"""
+        self.settings = _settings()
+        if self.enabled:
+            metrics.set_query_sampler(self.sample)
+        return self.enabled
+
+    def _ensure_worker(self):
+        # Tras un fork el hilo del padre no existe en el hijo
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+            self._explained_at = {}
+            self._thread = threading.Thread(target=self._worker, name='query-profiler', daemon=True)
+            self._thread.start()
+            self._pid = pid
+
+    def sample(self, cursor, query, vars, seconds):
+        """Decidir si una query ejecutada se perfila (llamado en el hilo del request)"""
+        if seconds * 1000 < self.settings['threshold_ms']:
+            return
+        if random.random() >= self.settings['sample_rate']:
+            return
+        if threading.current_thread() is self._thread:
+            return
+
+        try:
+            sql = cursor.mogrify(query, vars).decode('utf-8', 'replace')
+        except Exception:
+            return
+        if 'query_profiles' in sql or sql.lstrip()[:7].upper() == 'EXPLAIN':
+            return
+
+        stats = metrics.current_stats()
+        item = {
+            'sql': sql,
+            'ms': seconds * 1000,
+            'route': stats.route if stats is not None else None,
+            'database': getattr(cursor.connection, 'label', None) or 'main'
+        }
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._profile(item)
+            except Exception as e:
+                print(f"Error en query_profiler: {e}")
+
+    def _ready(self):
+        """
+        Si existe la tabla query_profiles (la crea init_db.py)
+
+        Se cachea solo cuando existe: tras correr init_db.py se empieza a
+        guardar sin reiniciar.
+        """
+        from database import get_db_connection
+
+        if self._table_ready:
+            return True
+        conn = get_db_connection()
+        if not conn:
+            return False
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT to_regclass('query_profiles') IS NOT NULL AS ready")
+            ready = cursor.fetchone()['ready']
+            cursor.close()
+        finally:
+            conn.close()
+        if not ready and self._table_ready is None:
+            print("⚠️ query_profiles no existe: ejecuta init_db.py")
+        self._table_ready = ready
+        return ready
+
+    def _profile(self, item):
+        from database import get_db_connection
+
+        if not self._ready():
+            return
+
+        normalized = normalize_query(item['sql'])
+        key = fingerprint(normalized)
+
+        plan = None
+        now = time.monotonic()
+        last = self._explained_at.get(key)
+        if last is None or now - last >= self.settings['cooldown']:
+            self._explained_at[key] = now
+            plan = self.explain(item['sql'], item['database'])
+
+        conn = get_db_connection()
+        if not conn:
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO query_profiles (
+                    fingerprint, database, query, sample_sql, route,
+                    samples, total_ms, max_ms, last_ms
+                )
+                VALUES (%s, %s, %s, %s, %s, 1, %s, %s, %s)
+                ON CONFLICT (fingerprint) DO UPDATE SET
+                    sample_sql = EXCLUDED.sample_sql,
+                    route = COALESCE(EXCLUDED.route, query_profiles.route),
+                    samples = query_profiles.samples + 1,
+                    total_ms = query_profiles.total_ms + EXCLUDED.total_ms,
+                    max_ms = GREATEST(query_profiles.max_ms, EXCLUDED.max_ms),
+                    last_ms = EXCLUDED.last_ms,
+                    last_seen_at = CURRENT_TIMESTAMP
+            """, (key, item['database'], normalized, item['sql'], item['route'],
+                  item['ms'], item['ms'], item['ms']))
+
+            if plan is not None:
+                cursor.execute("""
+                    UPDATE query_profiles
+                    SET plan = %s, plan_analyzed = %s, plan_planning_ms = %s,
+                        plan_execution_ms = %s, plan_error = %s,
+                        explained_at = CURRENT_TIMESTAMP
+                    WHERE fingerprint = %s
+                """, (plan['plan'], plan['analyzed'], plan['planning_ms'],
+                      plan['execution_ms'], plan['error'], key))
+
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def explain(self, sql, database='main'):
+        """
+        Ejecutar EXPLAIN sobre una copia de la query
+
+        Las lecturas se ejecutan con ANALYZE y BUFFERS dentro de una
+        transacción READ ONLY con statement_timeout; las escrituras solo se
+        planifican. La transacción siempre se descarta.
+        """
+        analyze = is_read_only(sql)
+        result = {'plan': None, 'analyzed': analyze, 'planning_ms': None,
+                  'execution_ms': None, 'error': None}
+
+        conn = _connection_factory(database)()
+        if not conn:
+            result['error'] = 'Database connection failed'
+            return result
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SET TRANSACTION READ ONLY")
+            cursor.execute("SELECT set_config('statement_timeout', %s, true)",
+                           (str(self.settings['statement_timeout_ms']),))
+            options = 'ANALYZE, BUFFERS' if analyze else 'VERBOSE'
+            cursor.execute(f"EXPLAIN ({options}) {sql}")
+            lines = [list(row.values())[0] for row in cursor.fetchall()]
+            cursor.close()
+
+            result['plan'] = '\n'.join(lines)
+            for kind, value in _TIMING.findall(result['plan']):
+                result['planning_ms' if kind == 'Planning' else 'execution_ms'] = float(value)
+        except Exception as e:
+            result['error'] = str(e)[:1000]
+        finally:
+            conn.rollback()
+            conn.close()
+
+        return result
+
+    def list_profiles(self, limit=100, order='total_ms'):
+        """Queries perfiladas, de mayor a menor costo acumulado"""
+        from database import get_db_connection
+
+        if order not in ('total_ms', 'max_ms', 'samples', 'last_seen_at'):
+            order = 'total_ms'
+        if not self._ready():
+            raise RuntimeError('La tabla query_profiles no existe: ejecuta init_db.py')
+
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT fingerprint, database, query, route, samples, total_ms, max_ms,
+                       last_ms, total_ms / NULLIF(samples, 0) AS avg_ms,
+                       plan_execution_ms, plan_analyzed, plan_error IS NOT NULL AS has_error,
+                       explained_at, first_seen_at, last_seen_at
+                FROM query_profiles
+                ORDER BY {order} DESC
+                LIMIT %s
+            """, (limit,))
+            profiles = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        return profiles
+
+    def get_profile(self, key):
+        """Detalle de una query perfilada, con su último plan"""
+        from database import get_db_connection
+
+        if not self._ready():
+            raise RuntimeError('La tabla query_profiles no existe: ejecuta init_db.py')
+
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT *, total_ms / NULLIF(samples, 0) AS avg_ms
+                FROM query_profiles WHERE fingerprint = %s
+            """, (key,))
+            profile = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+        return profile
+
+    def clear(self):
+        """Borrar todos los perfiles acumulados"""
+        from database import get_db_connection
+
+        if not self._ready():
+            raise RuntimeError('La tabla query_profiles no existe: ejecuta init_db.py')
+
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM query_profiles")
+            deleted = cursor.rowcount
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        self._explained_at.clear()
+        return deleted
+
+    def status(self):
+        return dict(self.settings, dropped=self.dropped,
+                    queued=self._queue.qsize() if self._queue is not None else 0)
+
+
+query_profiler = QueryProfiler()
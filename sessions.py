@@ -0,0 +1,171 @@
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+from database import get_db_connection
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Sesión cuyo contenido vive en el servidor; la cookie solo lleva el id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class PostgresSessionInterface(SessionInterface):
+    """
+    Sesiones almacenadas en PostgreSQL (tabla flask_sessions)
+
+    Solo se escribe en la base de datos cuando la sesión cambia, y las
+    sesiones expiradas se barren como máximo una vez por SWEEP_INTERVAL
+    segundos en cada proceso. La tabla la crea init_db.py.
+    """
+
+    SWEEP_INTERVAL = 600
+
+    def __init__(self):
+        self._last_sweep = 0.0
+        self._sweep_lock = threading.Lock()
+
+    def _connect(self):
+        return get_db_connection()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid:
+            return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+        conn = self._connect()
+        if not conn:
+            # Sin base de datos la app sigue funcionando con una sesión vacía
+            return ServerSideSession(sid=sid, new=True)
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT data FROM flask_sessions
+                WHERE id = %s AND expires_at > NOW()
+            """, (sid,))
+            row = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+
+        if row:
+            return ServerSideSession(row['data'], sid=sid)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self._delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not session.modified:
+            return
+
+        expires = self.get_expiration_time(app, session) or (
+            datetime.now(timezone.utc) + app.permanent_session_lifetime
+        )
+
+        conn = self._connect()
+        if not conn:
+            return
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO flask_sessions (id, data, expires_at)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (id) DO UPDATE SET
+                    data = EXCLUDED.data,
+                    expires_at = EXCLUDED.expires_at
+            """, (session.sid, json.dumps(dict(session)), expires))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        self._maybe_sweep()
+
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def _delete(self, sid):
+        conn = self._connect()
+        if not conn:
+            return
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM flask_sessions WHERE id = %s", (sid,))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < self.SWEEP_INTERVAL or not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_sweep = now
+            conn = self._connect()
+            if not conn:
+                return
+            try:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM flask_sessions WHERE expires_at < NOW()")
+                conn.commit()
+                cursor.close()
+            finally:
+                conn.close()
+        finally:
+            self._sweep_lock.release()
+
+
+def configure_sessions(app):
+    """
+    Seleccionar el backend de sesiones según SESSION_BACKEND
+
+    - cookie (por defecto): cookie firmada de Flask, sin estado en el servidor.
+      Suficiente para el tema del usuario y funciona con varios workers.
+    - postgres: contenido en la tabla flask_sessions, la cookie solo lleva el id.
+    - filesystem: Flask-Session en disco (comportamiento anterior).
+    """
+    backend = os.getenv('SESSION_BACKEND', 'cookie')
+
+    if backend == 'postgres':
+        app.session_interface = PostgresSessionInterface()
+    elif backend == 'filesystem':
+        from flask_session import Session
+
+        app.config['SESSION_TYPE'] = 'filesystem'
+        Session(app)
+    elif backend != 'cookie':
+        raise ValueError(f"SESSION_BACKEND no soportado: {backend}")
+
+    return backend
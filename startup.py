@@ -0,0 +1,127 @@
+"""
+Carga diferida de dependencias pesadas y perfilado del arranque
+
+    python startup.py                    # tiempo de `import app` y módulos más lentos
+    python startup.py --target-ms 1000   # falla (código 1) si se supera el objetivo
+
+HEAVY_IMPORTS controla cuándo se cargan pandas, openpyxl, qdrant_client,
+openai y tiktoken:
+
+- background (por defecto): en un hilo daemon de cada worker, tras iniciar
+- lazy: solo en el primer uso (p. ej. el primer upload)
+- eager: antes de atender requests (con gunicorn, en el master antes del fork)
+"""
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+HEAVY_MODULES = ('pandas', 'chardet', 'openpyxl', 'qdrant_client', 'openai', 'tiktoken')
+
+# Objetivo de arranque en frío para `import app` (sin dependencias pesadas)
+COLD_START_TARGET_MS = float(os.getenv('COLD_START_TARGET_MS', '1000'))
+
+
+def heavy_imports_mode():
+    mode = os.getenv('HEAVY_IMPORTS', 'background')
+    return mode if mode in ('background', 'lazy', 'eager') else 'background'
+
+
+def import_heavy_modules(modules=HEAVY_MODULES):
+    """
+    Importar los módulos pesados que falten
+
+    Returns:
+        Dict {módulo: ms} (None si no está instalado)
+    """
+    timings = {}
+    for name in modules:
+        if name in sys.modules:
+            continue
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        except ImportError:
+            timings[name] = None
+    return timings
+
+
+def start_background_imports():
+    """Importar los módulos pesados en un hilo daemon (HEAVY_IMPORTS=background)"""
+    if heavy_imports_mode() != 'background':
+        return None
+
+    def runner():
+        timings = import_heavy_modules()
+        if timings:
+            print(f"Dependencias cargadas en segundo plano: {timings}")
+
+    thread = threading.Thread(target=runner, name='heavy-imports', daemon=True)
+    thread.start()
+    return thread
+
+
+def profile_import(module='app'):
+    """
+    Medir `import <module>` en un proceso nuevo con -X importtime
+
+    Los hilos de fondo se desactivan para medir solo la importación.
+
+    Returns:
+        (ms totales del proceso, lista [(ms acumulados, módulo)] de mayor a
+        menor, nombres de todos los módulos importados)
+    """
+    env = dict(os.environ, APP_SERVER='gunicorn', HEAVY_IMPORTS='lazy', KB_WARMUP='0')
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, capture_output=True, text=True
+    )
+    total_ms = (time.perf_counter() - started) * 1000
+
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError('\n'.join(errors[-20:]))
+
+    modules = []
+    imported = set()
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\| (\s*)(\S+)', line)
+        if match:
+            cumulative_us, indent, name = match.groups()
+            imported.add(name)
+            # Solo módulos de primer nivel (los anidados ya están en su padre)
+            if not indent:
+                modules.append((int(cumulative_us) / 1000, name))
+    modules.sort(reverse=True)
+    return total_ms, modules, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perfilar el tiempo de arranque de la app')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--target-ms', type=float, default=COLD_START_TARGET_MS)
+    args = parser.parse_args()
+
+    total_ms, modules, imported = profile_import(args.module)
+
+    print(f"import {args.module}: {total_ms:.0f} ms (objetivo {args.target_ms:.0f} ms)\n")
+    for ms, name in modules[:args.top]:
+        print(f"{ms:>9.1f} ms  {name}")
+
+    loaded_heavy = sorted({name.split('.')[0] for name in imported} & set(HEAVY_MODULES))
+    if loaded_heavy:
+        print(f"\n⚠️ Dependencias pesadas importadas al arrancar: {', '.join(loaded_heavy)}")
+
+    sys.exit(1 if total_ms > args.target_ms else 0)
+
+
+if __name__ == '__main__':
+    main()
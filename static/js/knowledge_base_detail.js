@@ -8,6 +8,9 @@ let currentPage = 1;
 let totalPages = 1;
 let selectedPointId = null;
 
+// La lista solo muestra el resumen; el contenido completo se pide al seleccionar
+const POINT_LIST_FIELDS = 'id,content_preview,synced,created_at';
+
 // ========================================
 // INITIALIZATION
 // ========================================
@@ -116,7 +119,7 @@ async function loadPoints(page = 1) {
     currentPage = page;
     const search = document.getElementById('searchPoints').value;
     
-    const url = `/knowledge_base/api/bases/${currentKbId}/points?page=${page}&page_size=50&search=${encodeURIComponent(search)}`;
+    const url = `/knowledge_base/api/bases/${currentKbId}/points?page=${page}&page_size=50&search=${encodeURIComponent(search)}&fields=${POINT_LIST_FIELDS}`;
     
     try {
         const response = await fetch(url);
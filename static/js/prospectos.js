@@ -6,6 +6,7 @@
 let uploadedFile = null;
 let previewData = null;
 let suggestedMapping = null;
+let uploadFileId = null;
 
 // Paginación
 let currentPage = 1;
@@ -20,6 +21,8 @@ let selectMode = false;
 let activeFilters = {};
 let currentFilterColumn = null;
 let allColumnValues = {};
+let truncatedColumns = {};
+let filterSearchTimer = null;
 
 // Ordenamiento
 let sortColumn = 'fecha_creacion';
@@ -29,18 +32,24 @@ let sortOrder = 'DESC';
 // CARGA DE DATOS
 // ========================================
 
+// Filtros y orden actuales (los comparten la lista y la exportación)
+function buildQueryParams() {
+    const params = new URLSearchParams({
+        sort_column: sortColumn,
+        sort_order: sortOrder
+    });
+    
+    for (const [column, values] of Object.entries(activeFilters)) {
+        params.append(column, JSON.stringify(values));
+    }
+    return params;
+}
+
 async function loadProspectos() {
     try {
-        const params = new URLSearchParams({
-            page: currentPage,
-            page_size: pageSize,
-            sort_column: sortColumn,
-            sort_order: sortOrder
-        });
-        
-        for (const [column, values] of Object.entries(activeFilters)) {
-            params.append(column, JSON.stringify(values));
-        }
+        const params = buildQueryParams();
+        params.append('page', currentPage);
+        params.append('page_size', pageSize);
         
         const response = await fetch(`/prospectos/api/list?${params}`);
         const data = await response.json();
@@ -390,13 +399,21 @@ async function openFilterDropdown(column, event) {
     }
 }
 
-async function loadColumnValues(column) {
+async function loadColumnValues(column, prefix = '') {
     try {
-        const response = await fetch(`/prospectos/api/column-values?column=${column}`);
+        let url = `/prospectos/api/column-values?column=${column}`;
+        if (prefix) {
+            url += `&prefix=${encodeURIComponent(prefix)}`;
+        }
+        const response = await fetch(url);
         const data = await response.json();
         
         if (data.success) {
             allColumnValues[column] = data.values;
+            // Con más valores que el límite, la búsqueda se hace en el servidor
+            if (!prefix) {
+                truncatedColumns[column] = data.truncated;
+            }
             renderFilterOptions(data.values, column);
         }
     } catch (error) {
@@ -525,6 +542,13 @@ function refreshProspectos() {
     loadStats();
 }
 
+function exportProspectos(format) {
+    // Descarga directa: el servidor genera el archivo mientras lo envía
+    const params = buildQueryParams();
+    params.append('format', format);
+    window.location.href = `/prospectos/api/export?${params}`;
+}
+
 // ========================================
 // MODAL DE CARGA
 // ========================================
@@ -611,6 +635,7 @@ async function handleFileUpload(file) {
             
             previewData = data.preview;
             suggestedMapping = data.suggested_mapping;
+            uploadFileId = data.file_id;
             
             setTimeout(() => {
                 showMappingStep(data);
@@ -637,6 +662,7 @@ function showMappingStep(data) {
     
     if (previewFilename) previewFilename.textContent = data.filename;
     if (previewRows) previewRows.textContent = `${data.preview.total_rows} filas detectadas`;
+    renderSheets(data.sheets || [], data.sheet);
     
     const container = document.getElementById('mappingContainer');
     if (!container) return;
@@ -689,12 +715,58 @@ function showMappingStep(data) {
         container.appendChild(row);
     }
     
+    // Las claves de duplicado dependen del mapeo de teléfono, email y RUT
+    container.querySelectorAll('.column-select').forEach(select => {
+        if (DUPLICATE_KEY_FIELDS.includes(select.dataset.field)) {
+            select.addEventListener('change', checkDuplicates);
+        }
+    });
+    renderDuplicates(data.duplicates);
+    
     if (typeof feather !== 'undefined') {
         feather.replace();
     }
 }
 
-async function importData() {
+function renderSheets(sheets, current) {
+    const field = document.getElementById('sheetField');
+    const select = document.getElementById('sheetSelect');
+    if (!field || !select) return;
+    
+    // Solo los Excel con más de una hoja
+    field.style.display = sheets.length > 1 ? 'block' : 'none';
+    select.innerHTML = sheets.map(sheet =>
+        `<option value="${sheet}" ${sheet === current ? 'selected' : ''}>${sheet}</option>`
+    ).join('');
+}
+
+async function changeSheet(sheet) {
+    const previewRows = document.getElementById('previewRows');
+    if (previewRows) previewRows.textContent = 'Leyendo hoja...';
+    
+    try {
+        const response = await fetch('/prospectos/api/upload/sheet', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ file_id: uploadFileId, sheet: sheet })
+        });
+        const data = await response.json();
+        if (!data.success) {
+            throw new Error(data.error || 'Error al leer la hoja');
+        }
+        
+        previewData = data.preview;
+        suggestedMapping = data.suggested_mapping;
+        showMappingStep(data);
+    } catch (error) {
+        console.error('Sheet error:', error);
+        alert('Error: ' + error.message);
+    }
+}
+
+const DUPLICATE_KEY_FIELDS = ['telefono_1', 'email_1', 'rut'];
+
+function getMapping() {
     const mapping = {};
     document.querySelectorAll('.column-select').forEach(select => {
         const field = select.dataset.field;
@@ -703,6 +775,53 @@ async function importData() {
             mapping[field] = column;
         }
     });
+    return mapping;
+}
+
+function renderDuplicates(duplicates) {
+    const section = document.getElementById('duplicatesSection');
+    const info = document.getElementById('duplicatesInfo');
+    if (!section || !info) return;
+    
+    if (!duplicates) {
+        section.style.display = 'none';
+        return;
+    }
+    
+    section.style.display = 'grid';
+    if (duplicates.duplicados === 0) {
+        info.textContent = 'Sin duplicados por teléfono, email o RUT';
+        return;
+    }
+    
+    info.innerHTML = `
+        <strong>${duplicates.duplicados}</strong> de ${duplicates.total} filas duplicadas:
+        ${duplicates.en_archivo} repetidas en el archivo,
+        ${duplicates.en_prospectos} ya en prospectos,
+        ${duplicates.en_leads} ya activas
+    `;
+}
+
+async function checkDuplicates() {
+    const info = document.getElementById('duplicatesInfo');
+    if (info) info.textContent = 'Buscando duplicados...';
+    
+    try {
+        const response = await fetch('/prospectos/api/import/check', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ mapping: getMapping(), file_id: uploadFileId })
+        });
+        const data = await response.json();
+        renderDuplicates(data.success ? data.duplicates : null);
+    } catch (error) {
+        console.error('Duplicate check error:', error);
+        renderDuplicates(null);
+    }
+}
+
+async function importData() {
+    const mapping = getMapping();
     
     if (Object.keys(mapping).length === 0) {
         alert('Debes mapear al menos una columna');
@@ -725,7 +844,11 @@ async function importData() {
         const response = await fetch('/prospectos/api/import', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ mapping })
+            body: JSON.stringify({
+                mapping,
+                file_id: uploadFileId,
+                duplicates: document.getElementById('duplicateMode')?.value || 'flag'
+            })
         });
         
         const data = await response.json();
@@ -755,7 +878,7 @@ function showSuccessStep(data) {
     
     const successMessage = document.getElementById('successMessage');
     if (successMessage) {
-        successMessage.textContent = `Se importaron ${data.imported_count} registros exitosamente`;
+        successMessage.textContent = data.message || `Se importaron ${data.imported_count} registros exitosamente`;
     }
     
     if (typeof feather !== 'undefined') {
@@ -814,6 +937,14 @@ document.addEventListener('DOMContentLoaded', function() {
     if (filterSearch) {
         filterSearch.addEventListener('input', (e) => {
             const searchTerm = e.target.value.toLowerCase();
+            
+            if (truncatedColumns[currentFilterColumn]) {
+                clearTimeout(filterSearchTimer);
+                const column = currentFilterColumn;
+                filterSearchTimer = setTimeout(() => loadColumnValues(column, e.target.value.trim()), 250);
+                return;
+            }
+            
             const options = document.querySelectorAll('.filter-options-list .filter-option');
             
             options.forEach(option => {
@@ -3,6 +3,8 @@
 let prospectos = [];
 let filteredProspectos = [];
 let selectedIds = new Set();
+let selectAllMatching = false;
+let totalMatching = 0;
 let currentPage = 1;
 let pageSize = 50;
 let totalPages = 1;
@@ -11,6 +13,9 @@ let sortColumn = 'dias_transcurridos';
 let sortOrder = 'DESC';
 let chatModal = null;
 
+// Campos que usa la tabla; el detalle se carga desde /api/mensajes
+const LIST_FIELDS = 'id,nombre,apellido,telefono,carrera,plan,experiencia,estado,fecha_primer_contacto,dias_transcurridos,mensaje_count,followups';
+
 // Filtros activos
 let activeFilters = {
     estado: null,
@@ -29,6 +34,11 @@ let filterOptions = {
 let currentFilterType = null;
 let currentFilterButton = null;
 
+// Buscador: debounce de la lista y del autocompletar
+let searchTimer = null;
+let suggestTimer = null;
+let activeSuggestion = -1;
+
 // Inicializar modal de Bootstrap
 document.addEventListener('DOMContentLoaded', function() {
     const chatModalElement = document.getElementById('chatModal');
@@ -61,6 +71,7 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Cargar opciones de filtros
     loadFilterOptions();
+    initSearch();
 });
 
 // ====================================
@@ -287,34 +298,161 @@ function clearAllFilters() {
 }
 
 // ====================================
-// CARGAR PROSPECTOS
+// BÚSQUEDA
 // ====================================
 
-async function loadProspectos() {
-    try {
-        const searchTerm = document.getElementById('searchInput')?.value || '';
+function initSearch() {
+    const input = document.getElementById('searchInput');
+    if (!input) return;
+    
+    input.addEventListener('input', function() {
+        const term = input.value.trim();
+        
+        // Con texto se ordena por relevancia; al borrar vuelve el orden por defecto
+        if (term && sortColumn !== 'relevancia' && !input.dataset.searching) {
+            sortColumn = 'relevancia';
+            sortOrder = 'DESC';
+            updateSortIndicators();
+        } else if (!term && sortColumn === 'relevancia') {
+            sortColumn = 'dias_transcurridos';
+            sortOrder = 'DESC';
+            updateSortIndicators();
+        }
+        input.dataset.searching = term ? '1' : '';
         
-        // Construir parámetros de URL con filtros
-        let url = `/prospectos_activos/api/list?page=${currentPage}&page_size=${pageSize}&search=${encodeURIComponent(searchTerm)}&sort_by=${sortColumn}&sort_order=${sortOrder}`;
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            currentPage = 1;
+            loadProspectos();
+        }, 300);
         
-        // Agregar filtros
-        if (activeFilters.estado) {
-            url += `&estado=${encodeURIComponent(activeFilters.estado)}`;
+        clearTimeout(suggestTimer);
+        suggestTimer = setTimeout(() => loadSuggestions(term), 150);
+    });
+    
+    input.addEventListener('keydown', function(e) {
+        const items = document.querySelectorAll('#searchSuggestions .search-suggestion');
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            if (!items.length) return;
+            e.preventDefault();
+            activeSuggestion = (activeSuggestion + (e.key === 'ArrowDown' ? 1 : -1) + items.length) % items.length;
+            items.forEach((item, i) => item.classList.toggle('active', i === activeSuggestion));
+        } else if (e.key === 'Enter') {
+            if (activeSuggestion >= 0 && items[activeSuggestion]) {
+                items[activeSuggestion].click();
+            } else {
+                hideSuggestions();
+                clearTimeout(searchTimer);
+                currentPage = 1;
+                loadProspectos();
+            }
+        } else if (e.key === 'Escape') {
+            hideSuggestions();
         }
-        if (activeFilters.carrera.length > 0) {
-            url += `&carrera=${encodeURIComponent(activeFilters.carrera[0])}`;
+    });
+    
+    document.addEventListener('click', function(e) {
+        if (!e.target.closest('.search-box')) {
+            hideSuggestions();
         }
-        if (activeFilters.plan.length > 0) {
-            url += `&plan=${encodeURIComponent(activeFilters.plan[0])}`;
+    });
+}
+
+async function loadSuggestions(term) {
+    const container = document.getElementById('searchSuggestions');
+    if (!term) {
+        hideSuggestions();
+        return;
+    }
+    
+    try {
+        const response = await fetch(`/prospectos_activos/api/search-suggest?q=${encodeURIComponent(term)}`);
+        const result = await response.json();
+        
+        // Ignorar respuestas de una búsqueda que ya cambió
+        if (document.getElementById('searchInput').value.trim() !== term) return;
+        
+        if (!result.success || result.suggestions.length === 0) {
+            hideSuggestions();
+            return;
         }
         
-        const response = await fetch(url);
+        activeSuggestion = -1;
+        container.innerHTML = result.suggestions.map(s => `
+            <div class="search-suggestion" data-telefono="${escapeHtml(s.telefono)}">
+                <span>${escapeHtml(`${s.nombre} ${s.apellido}`.trim() || s.telefono)}</span>
+                <span class="search-suggestion-meta">${escapeHtml([s.telefono, s.carrera].filter(Boolean).join(' · '))}</span>
+            </div>
+        `).join('');
+        container.querySelectorAll('.search-suggestion').forEach(item => {
+            item.addEventListener('click', () => selectSuggestion(item.dataset.telefono));
+        });
+        container.classList.add('show');
+    } catch (error) {
+        console.error('Error cargando sugerencias:', error);
+    }
+}
+
+function selectSuggestion(telefono) {
+    // El teléfono va por la búsqueda exacta (índice) y deja un único resultado
+    const input = document.getElementById('searchInput');
+    input.value = telefono;
+    hideSuggestions();
+    clearTimeout(searchTimer);
+    clearTimeout(suggestTimer);
+    currentPage = 1;
+    loadProspectos();
+}
+
+function hideSuggestions() {
+    const container = document.getElementById('searchSuggestions');
+    if (container) {
+        container.classList.remove('show');
+        container.innerHTML = '';
+    }
+    activeSuggestion = -1;
+}
+
+// ====================================
+// CARGAR PROSPECTOS
+// ====================================
+
+// Búsqueda, filtros y orden actuales (los comparten la lista y la exportación)
+function buildQueryParams() {
+    const searchTerm = document.getElementById('searchInput')?.value || '';
+    const params = new URLSearchParams({
+        search: searchTerm,
+        sort_by: sortColumn,
+        sort_order: sortOrder
+    });
+    
+    if (activeFilters.estado) {
+        params.append('estado', activeFilters.estado);
+    }
+    if (activeFilters.carrera.length > 0) {
+        params.append('carrera', activeFilters.carrera[0]);
+    }
+    if (activeFilters.plan.length > 0) {
+        params.append('plan', activeFilters.plan[0]);
+    }
+    return params;
+}
+
+async function loadProspectos() {
+    try {
+        const params = buildQueryParams();
+        params.append('page', currentPage);
+        params.append('page_size', pageSize);
+        params.append('fields', LIST_FIELDS);
+        
+        const response = await fetch(`/prospectos_activos/api/list?${params}`);
         const result = await response.json();
         
         if (result.success) {
             prospectos = result.data;
             filteredProspectos = prospectos;
             totalPages = result.total_pages;
+            totalMatching = result.total;
             renderProspectos();
             updatePaginationInfo(result.total, result.page);
         }
@@ -751,6 +889,7 @@ function toggleSelectMode() {
         selectAll.style.display = 'none';
         btn.style.display = 'block';
         selectedIds.clear();
+        selectAllMatching = false;
     }
     
     renderProspectos();
@@ -762,8 +901,12 @@ function toggleSelectAll() {
     
     if (checked) {
         filteredProspectos.forEach(p => selectedIds.add(p.id));
+        // Más allá de esta página: se envían los filtros y no los ids
+        selectAllMatching = totalMatching > filteredProspectos.length &&
+            confirm(`¿Seleccionar los ${totalMatching} prospectos que coinciden con los filtros?`);
     } else {
         selectedIds.clear();
+        selectAllMatching = false;
     }
     
     renderProspectos();
@@ -771,6 +914,7 @@ function toggleSelectAll() {
 }
 
 function toggleRowSelection(id) {
+    selectAllMatching = false;
     if (selectedIds.has(id)) {
         selectedIds.delete(id);
     } else {
@@ -792,27 +936,65 @@ function updateActivarButton() {
     const btn = document.getElementById('btnActivar');
     const count = document.getElementById('selectedCount');
     
-    count.textContent = selectedIds.size;
+    count.textContent = selectAllMatching ? totalMatching : selectedIds.size;
     btn.disabled = selectedIds.size === 0;
 }
 
+// ids de la selección, o los filtros actuales si se eligieron todos los que coinciden
+function buildSelection() {
+    if (!selectAllMatching) {
+        return { ids: Array.from(selectedIds) };
+    }
+    const filters = Object.fromEntries(buildQueryParams());
+    delete filters.sort_by;
+    delete filters.sort_order;
+    return { filters: filters };
+}
+
+// Las selecciones grandes se aplican en segundo plano (202 con operation_id)
+async function waitForOperation(operationId) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`/prospectos_activos/api/operaciones/${operationId}`);
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error || 'Operación no encontrada');
+        }
+        
+        const operation = result.operation;
+        const count = document.getElementById('selectedCount');
+        if (count) count.textContent = `${operation.progress}%`;
+        
+        if (operation.status === 'completed') {
+            return `${operation.details.actualizados || 0} prospectos actualizados`;
+        }
+        if (operation.status === 'failed') {
+            throw new Error(operation.error || 'La operación falló');
+        }
+    }
+}
+
 async function activarSeleccionados() {
     if (selectedIds.size === 0) return;
     
-    if (!confirm(`¿Activar ${selectedIds.size} prospecto(s)?`)) return;
+    const total = selectAllMatching ? totalMatching : selectedIds.size;
+    if (!confirm(`¿Activar ${total} prospecto(s)?`)) return;
     
     try {
         const response = await fetch('/prospectos_activos/api/activar', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ ids: Array.from(selectedIds) })
+            body: JSON.stringify(buildSelection())
         });
         
         const result = await response.json();
         
         if (result.success) {
-            alert(result.message);
+            const message = result.queued ? await waitForOperation(result.operation_id) : result.message;
+            alert(message);
             selectedIds.clear();
+            selectAllMatching = false;
+            updateActivarButton();
             loadProspectos();
             loadStats();
         } else {
@@ -885,6 +1067,13 @@ function updatePaginationInfo(total, page) {
     document.getElementById('btnNext').disabled = page >= totalPages;
 }
 
+function exportProspectos(format) {
+    // Descarga directa: el servidor genera el archivo mientras lo envía
+    const params = buildQueryParams();
+    params.append('format', format);
+    window.location.href = `/prospectos_activos/api/export?${params}`;
+}
+
 function refreshProspectos() {
     currentPage = 1;
     loadProspectos();
@@ -0,0 +1,122 @@
+// ========================================
+// ADMIN - QUERIES LENTAS
+// ========================================
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text == null ? '' : String(text);
+    return div.innerHTML;
+}
+
+function formatMs(value) {
+    if (value == null) return '-';
+    return Number(value).toLocaleString('es-CL', { maximumFractionDigits: 1 });
+}
+
+async function loadProfiles() {
+    const order = document.getElementById('profileOrder').value;
+    const tbody = document.getElementById('profilesTableBody');
+
+    try {
+        const response = await fetch(`/admin/api/query-profiles?order=${encodeURIComponent(order)}`);
+        const data = await response.json();
+
+        if (!data.success) {
+            tbody.innerHTML = `<tr><td colspan="8" class="text-center">Error: ${escapeHtml(data.error)}</td></tr>`;
+            return;
+        }
+
+        renderStatus(data.profiler);
+        renderProfiles(data.profiles);
+    } catch (error) {
+        console.error('Error loading profiles:', error);
+        tbody.innerHTML = '<tr><td colspan="8" class="text-center">Error al cargar los perfiles</td></tr>';
+    }
+}
+
+function renderStatus(profiler) {
+    const status = document.getElementById('profilerStatus');
+
+    if (!profiler.enabled) {
+        status.innerHTML = 'El profiler está desactivado en este worker. Actívalo con <code>QUERY_PROFILER=1</code>.';
+        return;
+    }
+
+    status.innerHTML = `Muestreando el ${Math.round(profiler.sample_rate * 100)}% de las queries
+        de más de ${formatMs(profiler.threshold_ms)} ms
+        (en cola: ${profiler.queued}, descartadas: ${profiler.dropped}).`;
+}
+
+function renderProfiles(profiles) {
+    const tbody = document.getElementById('profilesTableBody');
+
+    if (!profiles.length) {
+        tbody.innerHTML = '<tr><td colspan="8" class="text-center">Sin queries perfiladas</td></tr>';
+        return;
+    }
+
+    tbody.innerHTML = profiles.map(profile => {
+        let planLabel = 'Pendiente';
+        if (profile.has_error) {
+            planLabel = 'Error';
+        } else if (profile.explained_at) {
+            planLabel = profile.plan_analyzed ? `${formatMs(profile.plan_execution_ms)} ms` : 'Sin ANALYZE';
+        }
+
+        return `
+            <tr style="cursor: pointer;" onclick="openPlan('${profile.fingerprint}')">
+                <td><div class="query-profile-query" title="${escapeHtml(profile.query)}">${escapeHtml(profile.query)}</div></td>
+                <td>${escapeHtml(profile.route || '-')}</td>
+                <td>${escapeHtml(profile.database)}</td>
+                <td style="text-align: right;">${profile.samples}</td>
+                <td style="text-align: right;">${formatMs(profile.avg_ms)}</td>
+                <td style="text-align: right;">${formatMs(profile.max_ms)}</td>
+                <td style="text-align: right;">${formatMs(profile.total_ms)}</td>
+                <td>${planLabel}</td>
+            </tr>
+        `;
+    }).join('');
+}
+
+async function openPlan(fingerprint) {
+    try {
+        const response = await fetch(`/admin/api/query-profiles/${fingerprint}`);
+        const data = await response.json();
+
+        if (!data.success) {
+            alert('Error: ' + data.error);
+            return;
+        }
+
+        const profile = data.profile;
+        document.getElementById('planQuery').textContent = profile.query;
+        document.getElementById('planSample').textContent = profile.sample_sql || '';
+        document.getElementById('planTitle').textContent = profile.plan_analyzed
+            ? 'Plan (EXPLAIN ANALYZE, BUFFERS)'
+            : 'Plan (EXPLAIN, sin ejecutar)';
+        document.getElementById('planText').textContent = profile.plan_error
+            ? `Error: ${profile.plan_error}`
+            : (profile.plan || 'Aún no se ha generado el plan');
+
+        new bootstrap.Modal(document.getElementById('planModal')).show();
+    } catch (error) {
+        console.error('Error loading plan:', error);
+    }
+}
+
+async function clearProfiles() {
+    if (!confirm('¿Borrar todas las queries perfiladas?')) return;
+
+    try {
+        const response = await fetch('/admin/api/query-profiles', { method: 'DELETE' });
+        const data = await response.json();
+
+        if (data.success) {
+            loadProfiles();
+        } else {
+            alert('Error: ' + data.error);
+        }
+    } catch (error) {
+        console.error('Error clearing profiles:', error);
+    }
+}
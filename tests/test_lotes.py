@@ -0,0 +1,111 @@
+"""
+Eliminación de lotes contra PostgreSQL local
+
+    DB_HOST=localhost python -m pytest tests/test_lotes.py
+
+Usa la base configurada en .env solo si es local (los mismos hosts que
+benchmarks.seed); prepara el esquema con init_db.py y trabaja con lotes de
+nombre único que se eliminan al terminar.
+"""
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip('psycopg2')
+
+from benchmarks.seed import LOCAL_HOSTS  # noqa: E402
+from database import get_db_connection  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def db():
+    if (os.getenv('DB_HOST') or 'localhost') not in LOCAL_HOSTS:
+        pytest.skip('DB_HOST no es una base de datos local')
+    conn = get_db_connection()
+    if not conn:
+        pytest.skip('Sin conexión a PostgreSQL')
+    conn.close()
+
+    import init_db
+    assert init_db.init_database()
+
+
+@pytest.fixture
+def lote(db):
+    """Lote recién importado: tres filas con estado NULL, como las deja el import"""
+    lote_id = f"test_{uuid.uuid4().hex[:12]}"
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    for i in range(3):
+        cursor.execute("""
+            INSERT INTO prospectos_raw (nombre, telefono_1, archivo_origen, lote_importacion)
+            VALUES (%s, %s, 'test.csv', %s)
+        """, (f'Prueba {i}', f'+56 9 {uuid.uuid4().int % 10 ** 8:08d}', lote_id))
+    conn.commit()
+    yield lote_id, conn, cursor
+    cursor.execute("DELETE FROM prospectos_raw WHERE lote_importacion = %s", (lote_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def _remaining(cursor, lote_id):
+    cursor.execute("SELECT COUNT(*) AS total FROM prospectos_raw WHERE lote_importacion = %s", (lote_id,))
+    total = cursor.fetchone()['total']
+    cursor.connection.commit()
+    return total
+
+
+def _wait(job_id, timeout=30):
+    from utils.background_jobs import jobs
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] not in ('pending', 'running'):
+            return job
+        time.sleep(0.1)
+    pytest.fail(f'La eliminación {job_id} no terminó en {timeout}s')
+
+
+def test_refuse_deletes_lote_without_activated_rows(lote):
+    from modules.prospectos import lotes
+
+    lote_id, _, cursor = lote
+    result, status = lotes.LoteDeletion(lote_id, 'refuse', chunk_rows=2).start()
+    assert status == 202, result
+
+    job = _wait(result['job_id'])
+    assert job['status'] == 'completed'
+    assert job['processed'] == 3
+    assert job['details']['conservados'] == 0
+    assert _remaining(cursor, lote_id) == 0
+
+
+def test_keep_deletes_all_but_activated_rows(lote):
+    from modules.prospectos import lotes
+
+    lote_id, conn, cursor = lote
+    cursor.execute("""
+        UPDATE prospectos_raw SET estado = 'activado'
+        WHERE id = (SELECT MIN(id) FROM prospectos_raw WHERE lote_importacion = %s)
+    """, (lote_id,))
+    conn.commit()
+
+    result, status = lotes.LoteDeletion(lote_id, 'refuse').start()
+    assert status == 409, result
+
+    result, status = lotes.LoteDeletion(lote_id, 'keep', chunk_rows=1).start()
+    assert status == 202, result
+
+    job = _wait(result['job_id'])
+    assert job['status'] == 'completed'
+    assert job['processed'] == 2
+    assert job['details']['conservados'] == 1
+    assert _remaining(cursor, lote_id) == 1
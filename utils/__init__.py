@@ -1,3 +1,9 @@
-from .file_processor import FileProcessor
-
 __all__ = ['FileProcessor']
+
+
+def __getattr__(name):
+    # Import diferido: importar utils.background_jobs no debe cargar pandas
+    if name == 'FileProcessor':
+        from .file_processor import FileProcessor
+        return FileProcessor
+    raise AttributeError(f"module 'utils' has no attribute {name!r}")
@@ -0,0 +1,302 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from database import get_db_connection
+
+ACTIVE_STATUSES = ('pending', 'running')
+# Mismo predicado que el índice único parcial idx_background_jobs_active (init_db.py)
+ACTIVE_SQL = f"status IN ({', '.join(repr(status) for status in ACTIVE_STATUSES)})"
+
+# Un trabajo activo sin heartbeat en JOB_LEASE_SECONDS se da por interrumpido
+# (el worker que lo corría terminó: deploy, max_requests, OOM)
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '120'))
+JOB_HEARTBEAT_SECONDS = max(JOB_LEASE_SECONDS / 4, 1)
+
+
+class JobRegistry:
+    """
+    Registro de trabajos en segundo plano persistido en PostgreSQL
+
+    El estado vive en la tabla background_jobs (la crea init_db.py) para
+    que cualquier proceso pueda consultar el progreso de un trabajo lanzado
+    por otro. Los trabajos corren en hilos del worker que los lanzó: si el
+    worker termina, el trabajo deja de renovar heartbeat_at y al vencer el
+    lease se marca como fallido, liberando su referencia.
+    """
+
+    def __init__(self, connection_factory=None):
+        self.connection_factory = connection_factory or get_db_connection
+
+    def _connect(self):
+        conn = self.connection_factory()
+        if not conn:
+            raise RuntimeError('Database connection failed')
+        return conn
+
+    @staticmethod
+    def _expire(cursor):
+        """Marcar como fallidos los trabajos activos cuyo lease venció"""
+        cursor.execute(f"""
+            UPDATE background_jobs
+            SET status = 'failed',
+                error = 'Trabajo interrumpido: el proceso que lo ejecutaba terminó',
+                finished_at = NOW(),
+                updated_at = NOW()
+            WHERE {ACTIVE_SQL}
+              AND heartbeat_at < NOW() - make_interval(secs => %s)
+        """, (JOB_LEASE_SECONDS,))
+
+    def create(self, job_type, reference=None, total=0, details=None):
+        """
+        Registrar un trabajo nuevo y retornar su id
+
+        Solo puede haber un trabajo activo por (job_type, reference) con
+        reference definida (índice único parcial): si ya existe uno retorna
+        None, sin carrera entre dos requests simultáneos.
+        """
+        job_id = str(uuid.uuid4())
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            self._expire(cursor)
+            cursor.execute(f"""
+                INSERT INTO background_jobs (id, job_type, reference, total, details, heartbeat_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+                ON CONFLICT (job_type, reference) WHERE {ACTIVE_SQL} DO NOTHING
+                RETURNING id
+            """, (job_id, job_type, reference, total, json.dumps(details or {})))
+            created = cursor.fetchone() is not None
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+        return job_id if created else None
+
+    def heartbeat(self, job_id):
+        """Renovar el lease de un trabajo activo"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE background_jobs SET heartbeat_at = NOW()
+                WHERE id = %s AND {ACTIVE_SQL}
+            """, (job_id,))
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def keep_alive(self, job_id):
+        """
+        Renovar el lease cada JOB_HEARTBEAT_SECONDS mientras dura el bloque
+
+        Un hilo aparte: el trabajo puede pasar más que el lease sin
+        actualizar su progreso (p. ej. esperando a OpenAI).
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(JOB_HEARTBEAT_SECONDS):
+                try:
+                    self.heartbeat(job_id)
+                except Exception as e:
+                    print(f"Error renovando heartbeat de {job_id}: {str(e)}")
+
+        thread = threading.Thread(target=beat, name=f"job-heartbeat-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def update(self, job_id, details=None, **fields):
+        """
+        Actualizar campos de un trabajo
+
+        Args:
+            job_id: Id del trabajo
+            details: Dict que se mezcla con los detalles existentes
+            **fields: status, total, processed, errors, error
+        """
+        allowed = {'status', 'total', 'processed', 'errors', 'error'}
+        assignments = []
+        params = []
+
+        for key, value in fields.items():
+            if key in allowed:
+                assignments.append(f"{key} = %s")
+                params.append(value)
+
+        if fields.get('status') == 'running':
+            assignments.append("started_at = COALESCE(started_at, NOW())")
+        elif fields.get('status') in ('completed', 'failed', 'cancelled'):
+            assignments.append("finished_at = NOW()")
+
+        if details:
+            assignments.append("details = COALESCE(details, '{}'::jsonb) || %s::jsonb")
+            params.append(json.dumps(details))
+
+        assignments.append("updated_at = NOW()")
+        assignments.append("heartbeat_at = NOW()")
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"UPDATE background_jobs SET {', '.join(assignments)} WHERE id = %s",
+                params + [job_id]
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        """Obtener un trabajo con throughput y ETA calculados"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            self._expire(cursor)
+            conn.commit()
+            cursor.execute("SELECT * FROM background_jobs WHERE id = %s", (job_id,))
+            job = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return self._format(job) if job else None
+
+    def list(self, job_type=None, reference=None, limit=20):
+        """Listar los trabajos más recientes"""
+        where_clauses = []
+        params = []
+
+        if job_type:
+            where_clauses.append("job_type = %s")
+            params.append(job_type)
+        if reference:
+            where_clauses.append("reference = %s")
+            params.append(reference)
+
+        where_sql = ' AND '.join(where_clauses) if where_clauses else '1=1'
+
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            self._expire(cursor)
+            conn.commit()
+            cursor.execute(f"""
+                SELECT * FROM background_jobs
+                WHERE {where_sql}
+                ORDER BY created_at DESC
+                LIMIT %s
+            """, params + [limit])
+            jobs = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return [self._format(job) for job in jobs]
+
+    def find_active(self, job_type, reference):
+        """Retornar el trabajo pendiente o en curso para una referencia, si existe (con lease vigente)"""
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            self._expire(cursor)
+            conn.commit()
+            cursor.execute(f"""
+                SELECT * FROM background_jobs
+                WHERE job_type = %s AND reference = %s AND {ACTIVE_SQL}
+            """, (job_type, reference))
+            job = cursor.fetchone()
+            cursor.close()
+        finally:
+            conn.close()
+
+        return self._format(job) if job else None
+
+    def run_in_background(self, job_id, target, *args, **kwargs):
+        """
+        Ejecutar target(job_id, *args) en un hilo daemon, renovando su lease
+
+        Las excepciones no controladas marcan el trabajo como fallido.
+        """
+        def runner():
+            try:
+                self.update(job_id, status='running')
+                with self.keep_alive(job_id):
+                    target(job_id, *args, **kwargs)
+            except Exception as e:
+                print(f"Error en trabajo {job_id}: {str(e)}")
+                traceback.print_exc()
+                try:
+                    self.update(job_id, status='failed', error=str(e))
+                except Exception:
+                    traceback.print_exc()
+
+        thread = threading.Thread(target=runner, name=f"job-{job_id}", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def _format(job):
+        started_at = job['started_at']
+        finished_at = job['finished_at']
+        processed = job['processed'] or 0
+        total = job['total'] or 0
+
+        throughput = None
+        eta_seconds = None
+        elapsed = None
+
+        if started_at:
+            end = finished_at or datetime.now(timezone.utc)
+            elapsed = max((end - started_at).total_seconds(), 0.001)
+            throughput = processed / elapsed
+            if job['status'] == 'running' and throughput > 0 and total > processed:
+                eta_seconds = round((total - processed) / throughput, 1)
+
+        return {
+            'id': str(job['id']),
+            'type': job['job_type'],
+            'reference': job['reference'],
+            'status': job['status'],
+            'total': total,
+            'processed': processed,
+            'errors': job['errors'] or 0,
+            'progress': round(processed * 100 / total, 1) if total else 0,
+            'throughput_per_second': round(throughput, 2) if throughput is not None else None,
+            'elapsed_seconds': round(elapsed, 1) if elapsed is not None else None,
+            'eta_seconds': eta_seconds,
+            'details': job['details'] or {},
+            'error': job['error'],
+            'started_at': started_at.isoformat() if started_at else None,
+            'finished_at': finished_at.isoformat() if finished_at else None,
+            'created_at': job['created_at'].isoformat() if job['created_at'] else None
+        }
+
+
+class ProgressThrottle:
+    """Limita la frecuencia con que se persiste el progreso de un trabajo"""
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self._last = 0.0
+
+    def ready(self):
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+
+jobs = JobRegistry()
@@ -0,0 +1,155 @@
+"""
+Exportación en streaming del resultado de una query (CSV o XLSX)
+
+Las filas se leen de un cursor con nombre (server-side) de EXPORT_ITERSIZE
+en EXPORT_ITERSIZE y se escriben en la respuesta a medida que llegan, así
+la memoria no depende del tamaño del resultado. El XLSX se arma con
+openpyxl en modo write-only (las filas van a un archivo temporal) y se
+envía por partes al terminar.
+"""
+import csv
+import io
+import os
+import tempfile
+import uuid
+from datetime import date, datetime
+
+from flask import Response
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', '2000'))
+
+# Máximo de filas de una hoja de Excel (sin contar el encabezado)
+XLSX_MAX_ROWS = 1048575
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+
+def export_formats():
+    """Formatos disponibles (xlsx solo con openpyxl instalado)"""
+    return [fmt for fmt in MIMETYPES if fmt != 'xlsx' or Workbook is not None]
+
+
+def iter_query(conn, query, params=()):
+    """
+    Filas de una query desde un cursor con nombre
+
+    La query se ejecuta (y trae el primer bloque) antes de retornar, así un
+    error todavía puede responderse como JSON. La conexión se cierra (vuelve
+    al pool) al terminar o si el cliente corta la descarga.
+    """
+    try:
+        cursor = conn.cursor(name=f"export_{uuid.uuid4().hex[:12]}")
+        cursor.itersize = EXPORT_ITERSIZE
+        cursor.execute(query, list(params))
+        first = cursor.fetchmany(EXPORT_ITERSIZE)
+    except Exception:
+        conn.close()
+        raise
+
+    def rows():
+        try:
+            yield from first
+            for row in cursor:
+                yield row
+            cursor.close()
+        finally:
+            conn.close()
+
+    return rows()
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _xlsx_value(value):
+    # Excel no guarda zona horaria: se exporta la hora tal como la entrega la base
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    if isinstance(value, (list, dict)):
+        return str(value)
+    return value
+
+
+def _csv_chunks(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM para que Excel abra el UTF-8 con acentos
+    buffer.write('\ufeff')
+    writer.writerow([header for header, _ in columns])
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_csv_value(getter(row)) for _, getter in columns])
+        if i % EXPORT_ITERSIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _xlsx_chunks(columns, rows, sheet_title):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title[:31])
+    sheet.append([header for header, _ in columns])
+
+    for i, row in enumerate(rows, 1):
+        if i > XLSX_MAX_ROWS:
+            sheet.append([f"Exportación truncada en {XLSX_MAX_ROWS} filas: usa format=csv"])
+            # Cierra el cursor y devuelve la conexión sin leer el resto
+            getattr(rows, 'close', lambda: None)()
+            break
+        sheet.append([_xlsx_value(getter(row)) for _, getter in columns])
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(256 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_response(fmt, filename, columns, rows, sheet_title='Datos'):
+    """
+    Respuesta de descarga que se genera mientras se envía
+
+    Args:
+        fmt: 'csv' o 'xlsx'
+        filename: Nombre sin extensión (se agrega fecha y hora)
+        columns: Lista [(encabezado, función fila -> valor)]
+        rows: Iterador de filas (normalmente iter_query)
+
+    Raises:
+        ValueError: si el formato no está disponible
+    """
+    if fmt not in export_formats():
+        raise ValueError(f"Formato no soportado: {fmt} (disponibles: {', '.join(export_formats())})")
+
+    if fmt == 'xlsx':
+        body = _xlsx_chunks(columns, iter(rows), sheet_title)
+    else:
+        body = _csv_chunks(columns, rows)
+
+    stamp = datetime.now().strftime('%Y%m%d_%H%M')
+    response = Response(body, mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}_{stamp}.{fmt}"'
+    # Que nginx no acumule la respuesta completa antes de enviarla
+    response.headers['X-Accel-Buffering'] = 'no'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
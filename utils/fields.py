@@ -0,0 +1,45 @@
+"""
+Selección de campos para respuestas de listas (parámetro fields=)
+
+Cada API define un dict {campo: (columnas, formateador)}; con fields= solo
+se leen de la base de datos las columnas necesarias y solo se arman los
+campos pedidos.
+"""
+
+
+def parse_fields(value, spec):
+    """
+    Interpretar fields= (nombres separados por coma)
+
+    Returns:
+        Lista de campos en el orden de `spec`; todos si value está vacío
+
+    Raises:
+        ValueError: si se pide un campo que no existe
+    """
+    if not value or not value.strip():
+        return list(spec)
+
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - spec.keys()
+    if unknown:
+        raise ValueError(
+            f"Campos desconocidos: {', '.join(sorted(unknown))} (disponibles: {', '.join(spec)})"
+        )
+    return [name for name in spec if name in requested]
+
+
+def columns_for(names, spec):
+    """Columnas SQL necesarias para los campos, sin repetir y en orden"""
+    columns = []
+    for name in names:
+        for column in spec[name][0]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def build_rows(rows, names, spec):
+    """Armar la lista de dicts de respuesta con solo los campos pedidos"""
+    formatters = [(name, spec[name][1]) for name in names]
+    return [{name: fmt(row) for name, fmt in formatters} for row in rows]
@@ -1,7 +1,46 @@
-import pandas as pd
+import json
 import os
-from datetime import datetime
-import chardet
+from datetime import date, datetime, time, timedelta
+
+# pandas, openpyxl y chardet se importan en el primer uso: la mayoría de los
+# workers nunca procesa un archivo y no deben pagar su tiempo de carga al iniciar
+
+# Filas por bloque al leer CSV
+CSV_CHUNK_ROWS = int(os.getenv('CSV_CHUNK_ROWS', '10000'))
+
+
+def _cell(value):
+    """Valor de una celda como tipo JSON (None para vacíos, texto para fechas)"""
+    if value is None:
+        return None
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        # Escalares de numpy
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, (datetime, date, time, timedelta)):
+        return str(value)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    text = str(value)
+    return None if text in ('NaT', 'nan') else text
+
+
+def _header(values):
+    """Nombres de columna como los deja pandas: 'Unnamed: n' y repetidos con .1, .2"""
+    values = list(values)
+    while values and values[-1] in (None, ''):
+        values.pop()
+    columns, seen = [], {}
+    for index, value in enumerate(values):
+        name = f"Unnamed: {index}" if value in (None, '') else str(_cell(value))
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        columns.append(name)
+    return columns
 
 class FileProcessor:
     """Procesa archivos CSV, Excel y similares"""
@@ -16,14 +55,39 @@ class FileProcessor:
     @staticmethod
     def detect_encoding(file_path):
         """Detecta el encoding de un archivo"""
+        import chardet
+        
         with open(file_path, 'rb') as f:
             result = chardet.detect(f.read())
             return result['encoding']
     
     @staticmethod
-    def read_file(file_path):
+    def extension(file_path):
+        return file_path.rsplit('.', 1)[1].lower()
+    
+    @staticmethod
+    def sheet_names(file_path):
+        """Hojas de un Excel (lista vacía para CSV/TSV)"""
+        ext = FileProcessor.extension(file_path)
+        if ext == 'xlsx':
+            from openpyxl import load_workbook
+            workbook = load_workbook(file_path, read_only=True)
+            try:
+                return list(workbook.sheetnames)
+            finally:
+                workbook.close()
+        if ext == 'xls':
+            import pandas as pd
+            with pd.ExcelFile(file_path) as workbook:
+                return [str(name) for name in workbook.sheet_names]
+        return []
+    
+    @staticmethod
+    def read_file(file_path, sheet=None):
         """Lee un archivo y retorna un DataFrame de pandas"""
-        ext = file_path.rsplit('.', 1)[1].lower()
+        import pandas as pd
+        
+        ext = FileProcessor.extension(file_path)
         
         try:
             if ext == 'csv':
@@ -36,7 +100,7 @@ class FileProcessor:
                     df = pd.read_csv(file_path, encoding=encoding, delimiter=';')
             
             elif ext in ['xlsx', 'xls']:
-                df = pd.read_excel(file_path)
+                df = pd.read_excel(file_path, sheet_name=sheet if sheet is not None else 0)
             
             elif ext == 'tsv':
                 encoding = FileProcessor.detect_encoding(file_path)
@@ -51,22 +115,161 @@ class FileProcessor:
             raise Exception(f"Error al leer el archivo: {str(e)}")
     
     @staticmethod
-    def get_columns(file_path):
+    def _xlsx_rows(file_path, sheet=None):
+        # openpyxl en modo solo lectura: las filas se leen del XML a medida
+        # que se piden, sin cargar el libro completo en memoria
+        from openpyxl import load_workbook
+        
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+            # Algunos generadores escriben mal la dimensión de la hoja (A1)
+            worksheet.reset_dimensions()
+            rows = worksheet.iter_rows(values_only=True)
+            for values in rows:
+                if any(value not in (None, '') for value in values):
+                    columns = _header(values)
+                    break
+            else:
+                columns = []
+            yield columns
+            
+            width = len(columns)
+            for values in rows:
+                row = [_cell(value) for value in values[:width]]
+                if any(value is not None for value in row):
+                    yield row + [None] * (width - len(row))
+        finally:
+            workbook.close()
+    
+    @staticmethod
+    def _pandas_rows(file_path, sheet=None):
+        # .xls (sin lector por filas) y CSV/TSV por bloques
+        import pandas as pd
+        
+        ext = FileProcessor.extension(file_path)
+        if ext == 'xls':
+            frames = [FileProcessor.read_file(file_path, sheet)]
+        else:
+            encoding = FileProcessor.detect_encoding(file_path)
+            delimiter = '\t' if ext == 'tsv' else ','
+            if ext == 'csv':
+                try:
+                    # Mismo criterio que read_file: si falla con coma, punto y coma
+                    pd.read_csv(file_path, encoding=encoding, nrows=CSV_CHUNK_ROWS)
+                except Exception:
+                    delimiter = ';'
+            frames = pd.read_csv(file_path, encoding=encoding, delimiter=delimiter,
+                                 chunksize=CSV_CHUNK_ROWS)
+        
+        columns = None
+        for frame in frames:
+            if columns is None:
+                columns = [str(column) for column in frame.columns]
+                yield columns
+            for values in frame.itertuples(index=False, name=None):
+                yield [_cell(value) for value in values]
+        if columns is None:
+            yield []
+    
+    @staticmethod
+    def iter_rows(file_path, sheet=None):
+        """
+        Lee el archivo por filas sin cargarlo completo
+        
+        Args:
+            file_path: Ruta al archivo
+            sheet: Hoja de un Excel (por defecto la primera)
+            
+        Returns:
+            (columnas, iterador de filas); cada fila es una lista paralela a
+            columnas con valores JSON (None para vacíos, fechas como texto)
+        """
+        try:
+            if FileProcessor.extension(file_path) == 'xlsx':
+                rows = FileProcessor._xlsx_rows(file_path, sheet)
+            elif FileProcessor.extension(file_path) in ('xls', 'csv', 'tsv'):
+                rows = FileProcessor._pandas_rows(file_path, sheet)
+            else:
+                raise ValueError(f"Formato de archivo no soportado: {FileProcessor.extension(file_path)}")
+            return next(rows), rows
+        except Exception as e:
+            raise Exception(f"Error al leer el archivo: {str(e)}")
+    
+    @staticmethod
+    def get_columns(file_path, sheet=None):
         """Obtiene las columnas del archivo"""
-        df = FileProcessor.read_file(file_path)
-        return df.columns.tolist()
+        columns, rows = FileProcessor.iter_rows(file_path, sheet)
+        rows.close()
+        return columns
     
     @staticmethod
-    def get_preview(file_path, rows=5):
-        """Obtiene una vista previa del archivo"""
-        df = FileProcessor.read_file(file_path)
-        preview = df.head(rows).to_dict('records')
+    def get_preview(file_path, rows=5, sheet=None):
+        """Obtiene una vista previa del archivo (recorre las filas para contarlas)"""
+        columns, file_rows = FileProcessor.iter_rows(file_path, sheet)
+        preview, total = [], 0
+        for row in file_rows:
+            if total < rows:
+                preview.append(dict(zip(columns, row)))
+            total += 1
+        return {
+            'columns': columns,
+            'rows': preview,
+            'total_rows': total
+        }
+    
+    @staticmethod
+    def write_cache(file_path, cache_path, sheet=None, preview_rows=5):
+        """
+        Lee el archivo una vez y guarda las filas en cache_path (JSON por línea)
+        
+        La vista previa, la revisión de duplicados y la importación leen la
+        caché en lugar de volver a abrir el libro.
+        
+        Returns:
+            Vista previa como get_preview
+        """
+        columns, rows = FileProcessor.iter_rows(file_path, sheet)
+        preview, total = [], 0
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as cache:
+                cache.write(json.dumps({'columns': columns, 'sheet': sheet}, ensure_ascii=False) + '\n')
+                for row in rows:
+                    if total < preview_rows:
+                        preview.append(dict(zip(columns, row)))
+                    total += 1
+                    cache.write(json.dumps(row, ensure_ascii=False) + '\n')
+            # Un worker que esté leyendo la caché anterior la termina de leer
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            rows.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
         return {
-            'columns': df.columns.tolist(),
+            'columns': columns,
             'rows': preview,
-            'total_rows': len(df)
+            'total_rows': total
         }
     
+    @staticmethod
+    def read_cache(cache_path):
+        """(columnas, iterador de filas) de una caché de write_cache"""
+        cache = open(cache_path, encoding='utf-8')
+        try:
+            columns = json.loads(cache.readline())['columns']
+        except Exception:
+            cache.close()
+            raise
+        
+        def rows():
+            with cache:
+                for line in cache:
+                    yield json.loads(line)
+        
+        return columns, rows()
+    
     @staticmethod
     def normalize_column_name(name):
         """Normaliza el nombre de una columna para comparación"""
@@ -104,60 +307,59 @@ class FileProcessor:
         return mapping
     
     @staticmethod
-    def process_and_map(file_path, column_mapping):
+    def iter_mapped(file_path, column_mapping, cache_path=None, sheet=None):
         """
-        Procesa el archivo y mapea las columnas según el mapeo proporcionado
+        Mapea las filas del archivo una a una
         
         Args:
             file_path: Ruta al archivo
             column_mapping: Diccionario {campo_destino: columna_origen}
+            cache_path: Caché de write_cache (si existe se lee en lugar del archivo)
+            sheet: Hoja de un Excel si no hay caché
             
-        Returns:
-            Lista de diccionarios con los datos mapeados
+        Yields:
+            Diccionarios con los campos mapeados; las columnas no mapeadas con
+            valor van en datos_adicionales
         """
-        df = FileProcessor.read_file(file_path)
-        
-        # Crear DataFrame con columnas mapeadas
-        mapped_data = []
-        
-        for _, row in df.iterrows():
-            record = {}
-            for target_field, source_column in column_mapping.items():
-                if source_column and source_column in df.columns:
-                    value = row[source_column]
-                    # Convertir NaN y valores problemáticos a None
-                    if pd.isna(value):
-                        record[target_field] = None
-                    elif isinstance(value, float) and (value != value):  # NaN check
-                        record[target_field] = None
-                    else:
-                        # Convertir a tipo nativo de Python
-                        if isinstance(value, (pd.Timestamp, pd.DatetimeTZDtype)):
-                            record[target_field] = str(value)
-                        elif isinstance(value, (int, float)):
-                            record[target_field] = value if not pd.isna(value) else None
-                        else:
-                            record[target_field] = str(value) if value is not None else None
-                else:
-                    record[target_field] = None
+        if cache_path and os.path.exists(cache_path):
+            columns, rows = FileProcessor.read_cache(cache_path)
+        else:
+            columns, rows = FileProcessor.iter_rows(file_path, sheet)
+        
+        positions = {column: index for index, column in enumerate(columns)}
+        mapped = [(field, positions.get(column) if column else None)
+                  for field, column in column_mapping.items()]
+        sources = set(column_mapping.values())
+        additional = [(column, index) for index, column in enumerate(columns) if column not in sources]
+        
+        for row in rows:
+            record = {
+                field: row[index] if index is not None and index < len(row) else None
+                for field, index in mapped
+            }
             
             # Agregar columnas adicionales que no fueron mapeadas
-            additional_data = {}
-            for col in df.columns:
-                if col not in column_mapping.values():
-                    value = row[col]
-                    if not pd.isna(value):
-                        # Convertir a tipo JSON-serializable
-                        if isinstance(value, (pd.Timestamp, pd.DatetimeTZDtype)):
-                            additional_data[col] = str(value)
-                        elif isinstance(value, (int, float)):
-                            additional_data[col] = value if not pd.isna(value) else None
-                        else:
-                            additional_data[col] = str(value) if value is not None else None
-            
+            additional_data = {
+                column: row[index] for column, index in additional
+                if index < len(row) and row[index] is not None
+            }
             if additional_data:
                 record['datos_adicionales'] = additional_data
             
-            mapped_data.append(record)
+            yield record
+    
+    @staticmethod
+    def process_and_map(file_path, column_mapping, cache_path=None, sheet=None):
+        """
+        Procesa el archivo y mapea las columnas según el mapeo proporcionado
         
-        return mapped_data
+        Args:
+            file_path: Ruta al archivo
+            column_mapping: Diccionario {campo_destino: columna_origen}
+            cache_path: Caché de write_cache, si la hay
+            sheet: Hoja de un Excel si no hay caché
+            
+        Returns:
+            Lista de diccionarios con los datos mapeados
+        """
+        return list(FileProcessor.iter_mapped(file_path, column_mapping, cache_path, sheet))
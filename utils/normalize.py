@@ -0,0 +1,56 @@
+"""
+Normalización de identificadores de contacto (teléfonos chilenos y RUT)
+"""
+import re
+
+
+def normalize_phone(phone):
+    """Normaliza teléfono a formato 569XXXXXXXX"""
+    if not phone:
+        return None
+
+    phone_str = str(phone).strip()
+    phone_clean = re.sub(r'[^0-9]', '', phone_str)
+
+    if phone_clean.startswith('56'):
+        phone_clean = phone_clean[2:]
+
+    if phone_clean.startswith('9') and len(phone_clean) == 9:
+        return '56' + phone_clean
+
+    if len(phone_clean) == 8:
+        return '569' + phone_clean
+
+    return None
+
+
+def phone_variants(phone):
+    """
+    Formas en que un teléfono puede estar guardado (569XXXXXXXX, 9XXXXXXXX y
+    los dígitos tal cual), para buscarlo por igualdad
+
+    Returns:
+        Lista sin repetidos; vacía si no parece un teléfono
+    """
+    digits = re.sub(r'[^0-9]', '', str(phone or ''))
+    normalized = normalize_phone(digits)
+    if not normalized:
+        return []
+    return list(dict.fromkeys([normalized, normalized[2:], digits]))
+
+
+_RUT_RE = re.compile(r'^\d{1,2}(?:\.?\d{3}){2}-?[\dkK]$')
+
+
+def looks_like_rut(value):
+    """RUT con puntos y/o guion (12.345.678-9, 12345678-K); sin formato se confunde con un teléfono"""
+    value = (value or '').strip()
+    return bool(_RUT_RE.match(value)) and ('-' in value or '.' in value or value[-1] in 'kK')
+
+
+def normalize_rut(rut):
+    """RUT sin puntos ni guion y con K mayúscula (123456789, 12345678K)"""
+    if not rut:
+        return None
+    cleaned = re.sub(r'[^0-9kK]', '', str(rut)).upper()
+    return cleaned or None
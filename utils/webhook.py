@@ -0,0 +1,20 @@
+"""
+Autenticación de los webhooks que llama n8n (ingesta de mensajes y
+actualización de leads)
+"""
+import hmac
+import os
+
+from flask import request
+
+
+def webhook_authorized():
+    """Con INGEST_TOKEN definido se exige en X-Ingest-Token o Authorization: Bearer"""
+    token = os.getenv('INGEST_TOKEN')
+    if not token:
+        return True
+    sent = request.headers.get('X-Ingest-Token', '')
+    authorization = request.headers.get('Authorization', '')
+    if not sent and authorization.startswith('Bearer '):
+        sent = authorization[7:]
+    return hmac.compare_digest(sent.encode(), token.encode())
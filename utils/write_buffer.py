@@ -0,0 +1,192 @@
+"""
+Buffer de escrituras con commit agrupado
+
+Los hilos de los requests agregan filas y esperan; un hilo por proceso las
+escribe juntas (inserts de varias filas en una sola transacción) cuando se
+juntan max_rows filas o la más antigua lleva max_delay segundos esperando.
+Cada request responde recién cuando sus filas están confirmadas, así el
+agrupamiento no arriesga datos y mil mensajes cuestan unas pocas
+transacciones en lugar de mil. Con retry_rows_on, si el lote falla por una
+fila inválida se reintenta fila por fila y solo fallan las inválidas.
+"""
+import atexit
+import os
+import threading
+import time
+
+
+class PendingWrite:
+    """
+    Filas de un llamador; wait() bloquea hasta que se escriben
+
+    result queda con lo que retornó la función de escritura del lote
+    (compartido por todos los llamadores del lote). failed lista las filas
+    que fallaron al reintentarlas una por una: [(posición, error)].
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.error = None
+        self.result = None
+        self.failed = []
+        self._done = threading.Event()
+
+    def _finish(self, error=None, result=None, failed=()):
+        self.error = error
+        self.result = result
+        self.failed = list(failed)
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Esperar a que las filas estén confirmadas
+
+        Returns:
+            Filas escritas (sin las de failed)
+
+        Raises:
+            TimeoutError: si no se escribieron dentro de timeout (siguen en cola)
+            Exception: el error con el que falló la escritura del lote
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError('Las filas siguen en cola')
+        if self.error is not None:
+            raise self.error
+        return self.count - len(self.failed)
+
+
+class WriteBuffer:
+    """
+    Cola de filas que se escriben por lotes
+
+    Args:
+        flush: Función que escribe una lista de filas (en una transacción); lo
+            que retorne queda en PendingWrite.result
+        max_rows: Filas que disparan una escritura inmediata
+        max_delay: Segundos máximos que una fila espera a completar el lote
+        name: Nombre del hilo (para logs)
+        retry_rows_on: Excepciones (de datos, no de conexión) con las que un
+            lote fallido se reintenta fila por fila
+    """
+
+    def __init__(self, flush, max_rows=500, max_delay=0.05, name='write-buffer',
+                 retry_rows_on=()):
+        self.flush_function = flush
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.name = name
+        self.retry_rows_on = tuple(retry_rows_on)
+        self.flushes = 0
+        self.rows_written = 0
+        self._pid = None
+        self._rows = []
+        self._waiters = []
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def _ensure_worker(self):
+        # Tras un fork el hilo del padre no existe en el hijo
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._condition:
+            if self._pid == pid:
+                return
+            self._rows, self._waiters, self._oldest = [], [], None
+            threading.Thread(target=self._worker, name=self.name, daemon=True).start()
+            self._pid = pid
+
+    def add(self, rows):
+        """Encolar filas; retorna un PendingWrite para esperar su escritura"""
+        pending = PendingWrite(len(rows))
+        if not rows:
+            pending._finish()
+            return pending
+
+        self._ensure_worker()
+        with self._condition:
+            # El hilo duerme sin timeout con la cola vacía: se despierta con la
+            # primera fila (para medir max_delay) y al completar el lote
+            first = not self._rows
+            if first:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self._waiters.append(pending)
+            if first or len(self._rows) >= self.max_rows:
+                self._condition.notify()
+        return pending
+
+    def _take(self):
+        rows, waiters = self._rows, self._waiters
+        self._rows, self._waiters, self._oldest = [], [], None
+        return rows, waiters
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while True:
+                    if len(self._rows) >= self.max_rows:
+                        break
+                    if self._rows:
+                        remaining = self._oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._condition.wait(remaining)
+                    else:
+                        self._condition.wait()
+                rows, waiters = self._take()
+            self._write(rows, waiters)
+
+    def _write(self, rows, waiters):
+        error = result = None
+        with self._flush_lock:
+            try:
+                result = self.flush_function(rows)
+                self.flushes += 1
+                self.rows_written += len(rows)
+            except self.retry_rows_on as e:
+                if len(rows) == 1:
+                    error = e
+                else:
+                    print(f"Error escribiendo lote de {self.name} ({len(rows)} filas): {str(e).strip()}; "
+                          f"reintentando fila por fila")
+                    self._write_rows(rows, waiters)
+                    return
+            except Exception as e:
+                print(f"Error escribiendo lote de {self.name} ({len(rows)} filas): {e}")
+                error = e
+        for pending in waiters:
+            pending._finish(error, result)
+
+    def _write_rows(self, rows, waiters):
+        """Escribir fila por fila (con _flush_lock tomado); cada llamador recibe sus fallidas"""
+        errors = {}
+        for position, row in enumerate(rows):
+            try:
+                self.flush_function([row])
+                self.flushes += 1
+                self.rows_written += 1
+            except Exception as e:
+                errors[position] = e
+        if errors:
+            print(f"{self.name}: {len(errors)} de {len(rows)} filas rechazadas")
+
+        start = 0
+        for pending in waiters:
+            failed = [(position - start, errors[position])
+                      for position in range(start, start + pending.count) if position in errors]
+            start += pending.count
+            # Si no se escribió ninguna de sus filas el llamador recibe el error
+            if failed and len(failed) == pending.count:
+                pending._finish(failed[-1][1])
+            else:
+                pending._finish(failed=failed)
+
+    def flush(self):
+        """Escribir ya lo pendiente (p. ej. al terminar el proceso)"""
+        with self._condition:
+            rows, waiters = self._take()
+        if rows:
+            self._write(rows, waiters)